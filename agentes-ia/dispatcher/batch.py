@@ -0,0 +1,116 @@
+"""
+Bounded concurrent fan-out for batch sends.
+
+`fan_out()` runs an async handler over many items with at most `concurrency`
+of them in flight and yields each result as soon as it is ready, so
+`/send/batch` can stream progress while the rest of the batch is still being
+sent:
+
+    async for result in fan_out(recipients, send_one, concurrency=50):
+        yield json.dumps(result) + "\\n"
+
+`concurrency` worker tasks pull items from one shared iterator, so memory
+stays bounded by the batch itself rather than by one task per item. Results
+go through a small buffer: a slow consumer (e.g. a slow HTTP client reading
+the stream) pauses the workers instead of piling results up in memory.
+
+The handler is expected to turn per-item failures into results. An exception
+escaping it stops the batch: the other workers are cancelled and the
+exception is raised to the consumer. Closing the generator early (e.g. the
+client disconnected) cancels the workers too; a cancelled worker puts nothing
+more in the buffer, since nobody reads it any more.
+
+`invalid_recipients()` checks a batch before it starts and
+`recipient_template()` fills the batch template with one recipient's
+parameters.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_DONE = object()
+
+
+class _Failed:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+async def fan_out(
+    items: Iterable[T],
+    handle: Callable[[T], Awaitable[R]],
+    concurrency: int = 50,
+) -> AsyncIterator[R]:
+    if concurrency <= 0:
+        raise ValueError("concurrency must be positive")
+    pending = iter(items)
+    results: asyncio.Queue = asyncio.Queue(maxsize=2 * concurrency)
+    active = concurrency
+
+    async def worker() -> None:
+        nonlocal active
+        # CancelledError is not caught: the consumer is gone and a put on the
+        # full buffer would never return.
+        try:
+            # Each worker takes the next item; the loop is single-threaded,
+            # so the shared iterator needs no lock.
+            for item in pending:
+                await results.put(await handle(item))
+        except Exception as exc:
+            await results.put(_Failed(exc))
+        active -= 1
+        if active == 0:
+            await results.put(_DONE)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        while True:
+            result = await results.get()
+            if result is _DONE:
+                break
+            if isinstance(result, _Failed):
+                raise result.error
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def invalid_recipients(recipients: Any) -> list[int]:
+    """
+    Indexes of the recipients that are neither a phone number nor a
+    `{"phone_number": ...}` dict; `[-1]` if `recipients` is not a list.
+    """
+    if not isinstance(recipients, list):
+        return [-1]
+    return [
+        index
+        for index, recipient in enumerate(recipients)
+        if not isinstance(recipient, str)
+        and not (isinstance(recipient, dict) and isinstance(recipient.get("phone_number"), str))
+    ]
+
+
+def recipient_template(template: dict[str, Any], recipient: dict[str, Any]) -> dict[str, Any]:
+    """
+    The batch template for one recipient: `components` replaces the template's
+    components, `parameters` fills the body placeholders ({{1}}, {{2}}, ...).
+    """
+    if recipient.get("components") is not None:
+        return {**template, "components": recipient["components"]}
+    parameters = recipient.get("parameters")
+    if parameters:
+        body = {
+            "type": "body",
+            "parameters": [{"type": "text", "text": str(value)} for value in parameters],
+        }
+        return {**template, "components": [*template.get("components", []), body]}
+    return template
@@ -1,38 +1,232 @@
-
-from fastapi import FastAPI
-import requests
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from time import perf_counter
+from typing import Any
+import json
+import math
+import os
+import time
 import google.cloud.logging
+import httpx
 import logging
 
-app = FastAPI()
+from shared import clients, latency, logs, metrics
+from shared.graph import GraphAPIError, GraphClient
+from shared.latency import LatencyMiddleware
+from shared.offload import BlockingExecutor
+from shared.ratelimit import RateLimiter, RateLimitExceeded
+from shared.secrets import SecretProvider
+from shared.tenant_cache import TenantCache
+from batch import fan_out, invalid_recipients, recipient_template
+from outbox import Backoff, OutboundMessage, OutboxWorker, RetryableError, SQLiteOutbox
 
 # Instantiates a client
 client = google.cloud.logging.Client()
 
-# Retrieves a Cloud Logging handler; you can log standard Python
-# logging messages to Cloud Logging
-client.setup_logging()
+# Attaches a batching Cloud Logging handler: standard Python logging
+# messages are queued and written to Cloud Logging off the request path.
+logs.setup_logging(client)
 
 # The name of the log to write to
 log_name = "agentes-ia-log"
 # The logger object
 logger = logging.getLogger(log_name)
 
+outgoing_messages = metrics.registry.counter(
+    "outgoing_messages_total", "Messages sent through the Graph API", ("tenant", "type")
+)
+outgoing_errors = metrics.registry.counter(
+    "outgoing_errors_total", "Sends that failed", ("tenant", "status")
+)
+send_wait = metrics.registry.histogram(
+    "send_queue_wait_ms", "Time a send waited for rate-limit tokens", ("tenant",)
+)
+rate_limited = metrics.registry.counter(
+    "rate_limited_sends_total", "Sends delayed or rejected by the rate limiter",
+    ("tenant", "scope"),
+)
+outbox_delivery = metrics.registry.histogram(
+    "outbox_delivery_ms", "Time from enqueue to send for queued messages", ("tenant",)
+)
+
+
+def load_tenant(tenant: str) -> dict[str, Any] | None:
+    tenant_doc = clients.registry.firestore().collection("tenants").document(tenant).get()
+    if not tenant_doc.exists:
+        return None
+    return tenant_doc.to_dict()
+
+
+tenant_cache = TenantCache(
+    load_tenant,
+    maxsize=int(os.environ.get("TENANT_CACHE_MAXSIZE", "256")),
+    ttl=float(os.environ.get("TENANT_CACHE_TTL_SECONDS", "300")),
+    negative_ttl=float(os.environ.get("TENANT_CACHE_NEGATIVE_TTL_SECONDS", "30")),
+)
+
+secret_provider = SecretProvider(
+    client_factory=clients.get_secret_manager,
+    ttl=float(os.environ.get("SECRETS_CACHE_TTL_SECONDS", "600")),
+)
+
+blocking = BlockingExecutor(
+    max_workers=int(os.environ.get("BLOCKING_IO_THREADS", "32")), name="blocking_io"
+)
+
+# One connection pool for every tenant; see shared/graph.py for the
+# GRAPH_API_* settings.
+graph = GraphClient()
+
+# Token buckets per phone_id (WhatsApp throughput limit) and per recipient
+# (pair rate limit). A tenant document may raise its number's limit with
+# {"rate_limit": {"mps": 250, "burst": 1}}.
+limiter = RateLimiter(
+    phone_rate=float(os.environ.get("RATE_LIMIT_PHONE_MPS", "80")),
+    phone_burst=int(os.environ.get("RATE_LIMIT_PHONE_BURST", "1")),
+    recipient_rate=1 / float(os.environ.get("RATE_LIMIT_RECIPIENT_INTERVAL_SECONDS", "6")),
+    recipient_burst=int(os.environ.get("RATE_LIMIT_RECIPIENT_BURST", "10")),
+    max_wait=float(os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", "60")),
+    max_recipients=int(os.environ.get("RATE_LIMIT_MAX_RECIPIENTS", "100000")),
+)
+
+# /send/batch: recipients in flight per batch, and the largest batch accepted.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "50"))
+BATCH_MAX_RECIPIENTS = int(os.environ.get("BATCH_MAX_RECIPIENTS", "10000"))
+
+MESSAGE_TYPES = ("text", "template")
+
+for collector in (
+    tenant_cache.stats, secret_provider.stats, blocking.stats, graph.stats, limiter.stats
+):
+    metrics.registry.add_collector(collector)
+
+
+async def on_startup(app: FastAPI) -> None:
+    if outbox_worker is not None:
+        await outbox_worker.start()
+
+
+async def on_shutdown(app: FastAPI) -> None:
+    if outbox_worker is not None:
+        await outbox_worker.stop()
+        outbox_store.close()
+    await graph.close()
+    tenant_cache.close()
+    secret_provider.close()
+    blocking.close()
+
+
+app = FastAPI(
+    lifespan=clients.lifespan(
+        "firestore", "secretmanager", startup=on_startup, shutdown=on_shutdown
+    )
+)
+app.add_middleware(LatencyMiddleware, service="dispatcher")
+app.include_router(metrics.router)
+
+
+async def get_tenant(tenant: str) -> dict[str, Any]:
+    """Return the tenant document; raise 404 for unknown tenants."""
+    found, tenant_config = tenant_cache.cached(tenant)
+    if not found:
+        tenant_config = await blocking.run(tenant_cache.get, tenant)
+    if tenant_config is None:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    return tenant_config
+
+
+async def get_token(tenant_config: dict[str, Any]) -> str:
+    secret_id = tenant_config["secrets"]["meta_token"]
+    token = secret_provider.cached(secret_id)
+    if token is None:
+        token = await blocking.run(secret_provider.get, secret_id)
+    return token
+
+
+async def wait_for_slot(tenant: str, tenant_config: dict[str, Any], phone_number: str) -> None:
+    """
+    Queue the send until the phone number and recipient buckets allow it;
+    raise RateLimitExceeded if the wait would be too long.
+    """
+    limits = tenant_config.get("rate_limit") or {}
+    try:
+        with latency.phase("rate_limit"):
+            waited, scope = await limiter.acquire(
+                tenant_config["phone_id"],
+                phone_number,
+                rate=limits.get("mps"),
+                burst=limits.get("burst"),
+            )
+    except RateLimitExceeded:
+        rate_limited.inc(tenant=tenant, scope="rejected")
+        raise
+    send_wait.observe(waited * 1000, tenant=tenant)
+    if scope:
+        rate_limited.inc(tenant=tenant, scope=scope)
+
+
 @app.post("/send")
-def send(request: dict):
+async def send(request: dict):
     tenant = request.get("tenant")
     phone_number = request.get("phone_number")
     message = request.get("message")
     message_type = request.get("message_type", "text")
+    if message_type not in MESSAGE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported message_type: {message_type}")
 
-    # Get secrets from Secret Manager
-    # ...
+    tenant_config = await get_tenant(tenant)
+    if outbox_worker is not None:
+        message_id = await queue(tenant, phone_number, message_type, message)
+        return JSONResponse({"status": "queued", "id": message_id}, status_code=202)
 
-    if message_type == "text":
-        send_text(phone_number, message)
-    elif message_type == "template":
-        send_template(phone_number, message)
+    token = await get_token(tenant_config)
+    try:
+        await wait_for_slot(tenant, tenant_config, phone_number)
+    except RateLimitExceeded as exc:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
+
+    try:
+        await deliver(tenant_config["phone_id"], token, phone_number, message_type, message)
+    except GraphAPIError as exc:
+        outgoing_errors.inc(tenant=tenant, status=exc.status)
+        logger.warning(
+            "Graph API rejected message",
+            extra={
+                "json_fields": {
+                    "app": "agentes-ia",
+                    "env": "dev",
+                    "tenant": tenant,
+                    "metric": "outgoing_errors_total",
+                    "status": exc.status,
+                    "error": exc.body,
+                }
+            },
+        )
+        raise HTTPException(status_code=502, detail="Graph API error")
+    except httpx.HTTPError as exc:
+        timeout = isinstance(exc, httpx.TimeoutException)
+        outgoing_errors.inc(tenant=tenant, status="timeout" if timeout else "transport")
+        logger.warning(
+            "Graph API unreachable",
+            extra={
+                "json_fields": {
+                    "app": "agentes-ia",
+                    "env": "dev",
+                    "tenant": tenant,
+                    "metric": "outgoing_errors_total",
+                    "error": repr(exc),
+                }
+            },
+        )
+        if timeout:
+            raise HTTPException(status_code=504, detail="Graph API timeout")
+        raise HTTPException(status_code=502, detail="Graph API unreachable")
 
+    outgoing_messages.inc(tenant=tenant, type=message_type)
     logger.info("Outgoing message", extra={
         "json_fields": {
             "app": "agentes-ia",
@@ -44,10 +238,297 @@ def send(request: dict):
 
     return {"status": "success"}
 
-def send_text(phone_number, message):
+
+async def deliver(phone_id, token, phone_number, message_type, message):
+    if message_type == "text":
+        return await send_text(phone_id, token, phone_number, message)
+    elif message_type == "template":
+        return await send_template(phone_id, token, phone_number, message)
+    raise ValueError(f"Unsupported message_type: {message_type}")
+
+async def send_text(phone_id, token, phone_number, message):
     # Send text message using Meta Graph API
-    pass
+    return await graph.send_text(phone_id, token, to=phone_number, body=message)
+
+async def send_template(phone_id, token, phone_number, message):
+    # Send template message using Meta Graph API. `message` is the template
+    # name or a {"name", "language", "components"} dict.
+    if isinstance(message, str):
+        message = {"name": message}
+    return await graph.send_template(
+        phone_id,
+        token,
+        to=phone_number,
+        name=message["name"],
+        language=message.get("language", "es"),
+        components=message.get("components"),
+    )
+
+
+async def deliver_queued(message: OutboundMessage) -> None:
+    """
+    Send a message from the outbox. Transient failures raise RetryableError;
+    anything else (unknown tenant, a 4xx from Graph API) dead-letters it.
+    """
+    tenant = message.tenant
+    payload = message.payload
+    try:
+        tenant_config = await get_tenant(tenant)
+        token = await get_token(tenant_config)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise RetryableError(f"Tenant credentials unavailable: {exc!r}") from exc
+
+    try:
+        await wait_for_slot(tenant, tenant_config, payload["phone_number"])
+        await deliver(
+            tenant_config["phone_id"],
+            token,
+            payload["phone_number"],
+            payload["message_type"],
+            payload["message"],
+        )
+    except RateLimitExceeded as exc:
+        raise RetryableError("Rate limit exceeded", exc.retry_after) from exc
+    except GraphAPIError as exc:
+        outgoing_errors.inc(tenant=tenant, status=exc.status)
+        if exc.retryable:
+            raise RetryableError(str(exc), exc.retry_after) from exc
+        raise
+    except httpx.HTTPError as exc:
+        outgoing_errors.inc(tenant=tenant, status="transport")
+        raise RetryableError(repr(exc)) from exc
+
+    outgoing_messages.inc(tenant=tenant, type=payload["message_type"])
+    outbox_delivery.observe((time.time() - message.enqueued_at) * 1000, tenant=tenant)
+
+
+def build_outbox_store() -> SQLiteOutbox | None:
+    if os.environ.get("OUTBOX_BACKEND", "") != "sqlite":
+        return None
+    return SQLiteOutbox(os.environ.get("OUTBOX_PATH", "/tmp/dispatcher-outbox.sqlite3"))
+
+
+# Durable outbound queue: with OUTBOX_BACKEND=sqlite, /send persists each
+# message and a background worker sends it, retrying transient failures.
+outbox_store = build_outbox_store()
+outbox_worker = None
+if outbox_store is not None:
+    outbox_worker = OutboxWorker(
+        deliver_queued,
+        outbox_store,
+        run=blocking.run,
+        concurrency=int(os.environ.get("OUTBOX_CONCURRENCY", "50")),
+        backoff=Backoff(
+            base=float(os.environ.get("OUTBOX_BACKOFF_BASE_SECONDS", "1")),
+            cap=float(os.environ.get("OUTBOX_BACKOFF_CAP_SECONDS", "300")),
+            max_attempts=int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8")),
+        ),
+        lease=float(os.environ.get("OUTBOX_LEASE_SECONDS", "120")),
+        poll_interval=float(os.environ.get("OUTBOX_POLL_SECONDS", "1")),
+    )
+    metrics.registry.add_collector(outbox_store.stats)
+    metrics.registry.add_collector(outbox_worker.stats)
+
+
+def require_outbox() -> SQLiteOutbox:
+    if outbox_store is None:
+        raise HTTPException(status_code=404, detail="Outbox is not enabled")
+    return outbox_store
+
+
+@app.get("/outbox/dead")
+async def outbox_dead_letters(limit: int = 100):
+    store = require_outbox()
+    return {"dead_letters": await blocking.run(store.dead_letters, limit)}
+
+
+@app.post("/outbox/dead/{message_id}/requeue")
+async def outbox_requeue(message_id: int):
+    store = require_outbox()
+    if not await blocking.run(store.requeue, message_id):
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    outbox_worker.wake()
+    return {"status": "queued", "id": message_id}
+
+
+async def queue(tenant: str, phone_number: str, message_type: str, message: Any) -> int:
+    return await outbox_worker.put(
+        OutboundMessage(
+            tenant=tenant,
+            payload={
+                "phone_number": phone_number,
+                "message": message,
+                "message_type": message_type,
+            },
+        )
+    )
+
+
+async def send_or_queue(
+    tenant: str,
+    tenant_config: dict[str, Any],
+    token: str,
+    phone_number: str,
+    message_type: str,
+    message: Any,
+) -> dict[str, Any]:
+    """
+    Send one message now and describe the outcome (`status` sent/failed/queued).
+    With the outbox enabled, transient failures are queued for retry.
+    """
+    result: dict[str, Any]
+    try:
+        await wait_for_slot(tenant, tenant_config, phone_number)
+        answer = await deliver(
+            tenant_config["phone_id"], token, phone_number, message_type, message
+        )
+    except RateLimitExceeded:
+        result = {"status": "failed", "http_status": 429, "error": "Rate limit exceeded"}
+        retryable = True
+    except GraphAPIError as exc:
+        outgoing_errors.inc(tenant=tenant, status=exc.status)
+        result = {"status": "failed", "http_status": exc.status, "error": exc.body}
+        retryable = exc.retryable
+    except httpx.HTTPError as exc:
+        outgoing_errors.inc(tenant=tenant, status="transport")
+        result = {"status": "failed", "error": repr(exc)}
+        retryable = True
+    else:
+        outgoing_messages.inc(tenant=tenant, type=message_type)
+        message_ids = [sent.get("id") for sent in (answer or {}).get("messages", [])]
+        return {"status": "sent", "message_id": message_ids[0] if message_ids else None}
+
+    if retryable and outbox_worker is not None:
+        # Transient failures are handed to the outbox for retries.
+        result["id"] = await queue(tenant, phone_number, message_type, message)
+        result["status"] = "queued"
+    return result
+
+
+@app.post("/send/actions")
+async def send_actions(request: dict):
+    """
+    Replies published in batches by the webhook (ACTIONS_MODE=publish):
+
+        {"actions": [{"tenant": "bumeran", "to": "57300...", "type": "text",
+                      "message": "...", "next": "delegate_to_llm"}, ...]}
+
+    Actions are sent concurrently. With the outbox enabled they are queued
+    instead and the answer is a 202, so the webhook never waits for the rate
+    limits. The answer counts them by outcome; an action that cannot be sent
+    (unknown tenant, missing fields, credentials unavailable) counts as failed
+    without affecting the others.
+    """
+    actions = request.get("actions") or []
+
+    async def send_one(action: dict[str, Any]) -> dict[str, Any]:
+        tenant = action.get("tenant")
+        message_type = action.get("type", "text")
+        if not action.get("to") or "message" not in action or message_type not in MESSAGE_TYPES:
+            return {"status": "failed", "http_status": 400, "error": "Invalid action"}
+        try:
+            tenant_config = await get_tenant(tenant)
+            if outbox_worker is not None:
+                return {
+                    "status": "queued",
+                    "id": await queue(tenant, action["to"], message_type, action["message"]),
+                }
+            token = await get_token(tenant_config)
+            return await send_or_queue(
+                tenant, tenant_config, token, action["to"], message_type, action["message"]
+            )
+        except HTTPException as exc:
+            return {"status": "failed", "http_status": exc.status_code, "error": exc.detail}
+        except Exception as exc:
+            logger.warning("Failed to send action for tenant %s: %r", tenant, exc)
+            return {"status": "failed", "error": repr(exc)}
+
+    summary = {"sent": 0, "failed": 0, "queued": 0}
+    async for result in fan_out(actions, send_one, BATCH_CONCURRENCY):
+        summary[result["status"]] += 1
+    if outbox_worker is not None:
+        return JSONResponse({"status": "queued", **summary}, status_code=202)
+    return {"status": "success", **summary}
+
+
+@app.post("/send/batch")
+async def send_batch(request: dict, stream: bool = True):
+    """
+    Send a template to many recipients:
+
+        {"tenant": "bumeran", "template": {"name": "reapertura_bumeran"},
+         "recipients": ["57300...", {"phone_number": "57301...", "parameters": ["Ana"]}]}
+
+    Recipients are sent `BATCH_CONCURRENCY` at a time, within the rate limits.
+    The answer streams one JSON line per recipient as it completes (in
+    completion order, with its `index` in the request) and a final `summary`
+    line; with `?stream=false` it is a single JSON document instead. With the
+    outbox enabled, transient failures are queued for retry (`status: queued`).
+    """
+    tenant = request.get("tenant")
+    recipients = request.get("recipients") or []
+    template = request.get("template")
+    if not recipients or not template:
+        raise HTTPException(status_code=400, detail="recipients and template are required")
+    invalid = invalid_recipients(recipients)
+    if invalid:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid recipients at indexes {invalid[:10]}"
+        )
+    if len(recipients) > BATCH_MAX_RECIPIENTS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {BATCH_MAX_RECIPIENTS} recipients per batch"
+        )
+    if isinstance(template, str):
+        template = {"name": template}
+
+    tenant_config = await get_tenant(tenant)
+    token = await get_token(tenant_config)
+
+    async def send_one(item: tuple[int, Any]) -> dict[str, Any]:
+        index, recipient = item
+        if isinstance(recipient, str):
+            recipient = {"phone_number": recipient}
+        phone_number = recipient.get("phone_number")
+        result = await send_or_queue(
+            tenant,
+            tenant_config,
+            token,
+            phone_number,
+            "template",
+            recipient_template(template, recipient),
+        )
+        return {"index": index, "phone_number": phone_number, **result}
+
+    summary = {"total": len(recipients), "sent": 0, "failed": 0, "queued": 0}
+
+    async def results():
+        start = perf_counter()
+        async for result in fan_out(enumerate(recipients), send_one, BATCH_CONCURRENCY):
+            summary[result["status"]] += 1
+            yield result
+        summary["elapsed_ms"] = round((perf_counter() - start) * 1000, 3)
+        logger.info("Outgoing batch", extra={
+            "json_fields": {
+                "app": "agentes-ia",
+                "env": "dev",
+                "tenant": tenant,
+                "metric": "outgoing_batches",
+                "template": template.get("name"),
+                **summary,
+            }
+        })
+
+    if not stream:
+        collected = [result async for result in results()]
+        collected.sort(key=lambda result: result["index"])
+        return {"status": "success", "summary": summary, "results": collected}
+
+    async def lines():
+        async for result in results():
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": summary}) + "\n"
 
-def send_template(phone_number, message):
-    # Send template message using Meta Graph API
-    pass
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,363 @@
+"""
+Durable outbound queue ("outbox") for the dispatcher.
+
+With the outbox enabled `/send` persists the message and returns; an
+`OutboxWorker` sends it in the background. A send that fails with a
+retryable error (Graph API 429/5xx, a network error, the rate limiter) is
+retried after a jittered exponential backoff that never undercuts the
+server's `Retry-After`; after `max_attempts`, or on a permanent error, the
+message is dead-lettered and kept for inspection and `requeue()`.
+
+Backends share a small interface (`put`, `claim`, `ack`, `retry`, `release`,
+`dead`, `requeue`, `dead_letters`, `stats`), so a Cloud Tasks or Pub/Sub
+backend can replace `SQLiteOutbox` in production. `SQLiteOutbox` is the
+local durable backend: one row per message in a SQLite file (WAL mode).
+`claim()` leases due rows by pushing their `available_at` forward by
+`lease` seconds inside a write transaction, so several processes can share
+the file and a message claimed by a process that died is picked up again
+once its lease expires. Delivery is therefore at-least-once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+
+class RetryableError(Exception):
+    """Raised by the send callback for failures worth retrying."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class OutboundMessage:
+    tenant: str
+    payload: dict[str, Any]
+    id: Optional[int] = None
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class Backoff:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempts)]."""
+
+    def __init__(
+        self,
+        base: float = 1.0,
+        cap: float = 300.0,
+        max_attempts: int = 8,
+        random: Callable[[], float] = random.random,
+    ) -> None:
+        self.base = base
+        self.cap = cap
+        self.max_attempts = max_attempts
+        self._random = random
+
+    def delay(self, attempts: int, retry_after: Optional[float] = None) -> float:
+        delay = self._random() * min(self.cap, self.base * 2**attempts)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tenant TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (dead, available_at);
+"""
+
+
+class SQLiteOutbox:
+    def __init__(self, path: str, clock: Callable[[], float] = time.time) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+
+    def put(self, message: OutboundMessage) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (tenant, payload, attempts, enqueued_at, available_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    message.tenant,
+                    json.dumps(message.payload),
+                    message.attempts,
+                    message.enqueued_at,
+                    self._clock(),
+                ),
+            )
+        message.id = cursor.lastrowid
+        return message.id
+
+    def claim(self, limit: int, lease: float) -> list[OutboundMessage]:
+        """Lease up to `limit` due messages for `lease` seconds, oldest first."""
+        now = self._clock()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, tenant, payload, attempts, enqueued_at FROM outbox"
+                    " WHERE dead = 0 AND available_at <= ? ORDER BY available_at, id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                if rows:
+                    self._db.executemany(
+                        "UPDATE outbox SET available_at = ? WHERE id = ?",
+                        [(now + lease, row[0]) for row in rows],
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return [
+            OutboundMessage(
+                tenant=tenant,
+                payload=json.loads(payload),
+                id=message_id,
+                attempts=attempts,
+                enqueued_at=enqueued_at,
+            )
+            for message_id, tenant, payload, attempts, enqueued_at in rows
+        ]
+
+    def ack(self, message: OutboundMessage) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (message.id,))
+
+    def retry(self, message: OutboundMessage, delay: float, error: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, available_at = ?, last_error = ?"
+                " WHERE id = ?",
+                (self._clock() + delay, error, message.id),
+            )
+
+    def release(self, message: OutboundMessage) -> None:
+        """Give a claimed message back without counting an attempt."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET available_at = ? WHERE id = ?", (self._clock(), message.id)
+            )
+
+    def dead(self, message: OutboundMessage, error: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, dead = 1, last_error = ? WHERE id = ?",
+                (error, message.id),
+            )
+
+    def requeue(self, message_id: int) -> bool:
+        """Move a dead letter back to the queue; return False if there is none."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE outbox SET dead = 0, attempts = 0, available_at = ?"
+                " WHERE id = ? AND dead = 1",
+                (self._clock(), message_id),
+            )
+        return cursor.rowcount > 0
+
+    def dead_letters(self, limit: int = 100) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, tenant, payload, attempts, enqueued_at, last_error FROM outbox"
+                " WHERE dead = 1 ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "id": message_id,
+                "tenant": tenant,
+                "payload": json.loads(payload),
+                "attempts": attempts,
+                "enqueued_at": enqueued_at,
+                "error": error,
+            }
+            for message_id, tenant, payload, attempts, enqueued_at, error in rows
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        now = self._clock()
+        with self._lock:
+            pending, dead, oldest = self._db.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0),"
+                " MIN(CASE WHEN dead = 0 THEN enqueued_at END) FROM outbox"
+            ).fetchone()
+        return {
+            "outbox_depth": pending,
+            "outbox_dead_letters": dead,
+            # Age of the oldest message not yet sent.
+            "outbox_lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+async def _inline(func: Callable[..., Any], *args: Any) -> Any:
+    return func(*args)
+
+
+class OutboxWorker:
+    """
+    Claims due messages and sends them with at most `concurrency` in flight.
+
+    `send` raises RetryableError for failures worth retrying; any other
+    exception dead-letters the message. Outbox calls go through `run` (e.g.
+    `BlockingExecutor.run`) so SQLite I/O stays off the event loop.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[OutboundMessage], Awaitable[Any]],
+        outbox: Any,
+        run: Callable[..., Awaitable[Any]] = _inline,
+        concurrency: int = 50,
+        backoff: Optional[Backoff] = None,
+        lease: float = 120.0,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self._send = send
+        self._outbox = outbox
+        self._run = run
+        self._concurrency = concurrency
+        self._backoff = backoff or Backoff()
+        self._lease = lease
+        self._poll_interval = poll_interval
+        self._inflight: set[asyncio.Task] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.sent = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    async def put(self, message: OutboundMessage) -> int:
+        """Persist `message` and wake the worker; return its id."""
+        message_id = await self._run(self._outbox.put, message)
+        self.wake()
+        return message_id
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="outbox-worker")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stop claiming, let in-flight sends finish, then cancel the rest."""
+        self._stopping = True
+        self.wake()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._inflight:
+            _, pending = await asyncio.wait(self._inflight, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            # Cleared before claiming, so a wake-up during the claim is kept.
+            self._wake.clear()
+            free = self._concurrency - len(self._inflight)
+            messages: list[OutboundMessage] = []
+            if free > 0:
+                try:
+                    messages = await self._run(self._outbox.claim, free, self._lease)
+                except Exception:
+                    logger.exception("Failed to claim outbound messages.")
+            for message in messages:
+                task = asyncio.create_task(self._deliver(message))
+                self._inflight.add(task)
+                task.add_done_callback(self._finished)
+            if len(messages) < free:
+                # Nothing else is due: wait for a new message, a free slot
+                # or the next poll.
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            elif not messages:
+                await self._wake.wait()
+
+    async def _deliver(self, message: OutboundMessage) -> None:
+        try:
+            await self._send(message)
+        except asyncio.CancelledError:
+            await self._run(self._outbox.release, message)
+            raise
+        except RetryableError as exc:
+            if message.attempts + 1 >= self._backoff.max_attempts:
+                await self._dead(message, str(exc))
+            else:
+                delay = self._backoff.delay(message.attempts, exc.retry_after)
+                await self._run(self._outbox.retry, message, delay, str(exc))
+                self.retried += 1
+        except Exception as exc:
+            await self._dead(message, repr(exc))
+        else:
+            await self._run(self._outbox.ack, message)
+            self.sent += 1
+
+    def _finished(self, task: asyncio.Task) -> None:
+        # A slot is free: let the loop claim more.
+        self._inflight.discard(task)
+        self.wake()
+        if not task.cancelled() and task.exception() is not None:
+            # The outbox itself failed; the lease brings the message back.
+            logger.error("Outbox bookkeeping failed", exc_info=task.exception())
+
+    async def _dead(self, message: OutboundMessage, error: str) -> None:
+        await self._run(self._outbox.dead, message, error)
+        self.dead_lettered += 1
+        logger.warning(
+            "Outbound message dead-lettered",
+            extra={
+                "json_fields": {
+                    "app": "agentes-ia",
+                    "env": "dev",
+                    "tenant": message.tenant,
+                    "metric": "outbox_dead_letters_total",
+                    "outbox_id": message.id,
+                    "attempts": message.attempts + 1,
+                    "error": error,
+                }
+            },
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "outbox_inflight": len(self._inflight),
+            "outbox_sent": self.sent,
+            "outbox_retried": self.retried,
+            "outbox_dead_lettered": self.dead_lettered,
+        }
@@ -0,0 +1,248 @@
+"""
+Conversation memory for the LLM orchestrator.
+
+`/nlu/generate` used to receive a single `prompt`, so callers had to resend
+the whole conversation on every turn and its cost grew with each message.
+`ConversationStore` keeps, per tenant and sender, a compact history:
+
+- the recent turns (role, text and their token count, computed once when
+  the turn is added with `count_tokens`, normally the model's tokenizer, so
+  trimming never re-counts);
+- a running summary of the older ones.
+
+When the turns exceed `budget` tokens the oldest are folded into the summary
+until they fit in `budget * low_water`, leaving room for a few more turns
+before the next fold; `summarize(tenant, summary, turns)` extends the previous
+summary with the folded turns only, so each fold costs about the same however
+long the conversation is. Without a summarizer the folded turns are dropped.
+The last `min_turns` turns are always kept verbatim. If `count_tokens`
+fails, the text is estimated with `estimate_tokens` and the failure counted.
+
+Conversations live in an in-memory LRU of `maxsize` senders. Optionally a
+store (`FirestoreConversationStore`) keeps them across instances and
+restarts: a conversation missing from memory is loaded from it, and each
+update is written back. Store failures are logged and counted; the
+conversation continues from memory.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+
+def estimate_tokens(text: str) -> int:
+    # Fallback for when the tokenizer is unavailable: about four characters
+    # per token for Gemini on Spanish and English text.
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class Turn:
+    role: str
+    text: str
+    tokens: int
+
+
+@dataclass
+class Conversation:
+    summary: str = ""
+    summary_tokens: int = 0
+    turns: list[Turn] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Conversation":
+        return cls(
+            summary=data.get("summary", ""),
+            summary_tokens=data.get("summary_tokens", 0),
+            turns=[Turn(**turn) for turn in data.get("turns", [])],
+        )
+
+
+class FirestoreConversationStore:
+    """
+    One document per conversation under `collection`. Documents carry an
+    `expires_at` field meant for a Firestore TTL policy that deletes
+    conversations idle for `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        collection: str = "conversations",
+        ttl: float = 7 * 86400.0,
+    ) -> None:
+        self._client_factory = client_factory
+        self._collection = collection
+        self._ttl = ttl
+
+    def _document(self, key: tuple[str, str]) -> Any:
+        tenant, sender = key
+        return (
+            self._client_factory()
+            .collection(self._collection)
+            .document(f"{tenant}:{sender}".replace("/", "_"))
+        )
+
+    def load(self, key: tuple[str, str]) -> Optional[Conversation]:
+        snapshot = self._document(key).get()
+        if not snapshot.exists:
+            return None
+        return Conversation.from_dict(snapshot.to_dict())
+
+    def save(self, key: tuple[str, str], conversation: Conversation) -> None:
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=self._ttl
+        )
+        tenant, sender = key
+        self._document(key).set(
+            {
+                "tenant": tenant,
+                "sender": sender,
+                "expires_at": expires_at,
+                **conversation.to_dict(),
+            }
+        )
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        budget: int = 1000,
+        low_water: float = 0.5,
+        min_turns: int = 2,
+        maxsize: int = 10_000,
+        summarize: Optional[Callable[[str, str, list[Turn]], str]] = None,
+        store: Optional[Any] = None,
+    ) -> None:
+        self._budget = budget
+        self._low_water = low_water
+        self._min_turns = min_turns
+        self._maxsize = maxsize
+        self._count_tokens = count_tokens
+        self._summarize = summarize
+        self._store = store
+        self._conversations: OrderedDict[tuple[str, str], Conversation] = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.folds = 0
+        self.folded_turns = 0
+        self.summarize_errors = 0
+        self.store_errors = 0
+        self.count_errors = 0
+
+    def get(self, tenant: str, sender: str) -> Conversation:
+        """The sender's conversation, from memory or the store."""
+        key = (tenant, sender)
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None:
+                self._conversations.move_to_end(key)
+                return conversation
+        conversation = None
+        if self._store is not None:
+            try:
+                conversation = self._store.load(key)
+            except Exception as exc:
+                self.store_errors += 1
+                logger.warning("Failed to load conversation: %s", exc)
+            else:
+                self.loads += 1
+        with self._lock:
+            # Another request may have loaded it meanwhile.
+            conversation = self._conversations.setdefault(key, conversation or Conversation())
+            self._conversations.move_to_end(key)
+            while len(self._conversations) > self._maxsize:
+                self._conversations.popitem(last=False)
+        return conversation
+
+    def prompt(self, tenant: str, sender: str, text: str) -> str:
+        """`text` preceded by the summary and the recent turns, if any."""
+        conversation = self.get(tenant, sender)
+        if not conversation.summary and not conversation.turns:
+            return text
+        lines = []
+        if conversation.summary:
+            lines.append(f"Resumen de la conversación: {conversation.summary}")
+        lines.extend(f"{turn.role}: {turn.text}" for turn in conversation.turns)
+        lines.append(f"user: {text}")
+        return "\n".join(lines)
+
+    def append(self, tenant: str, sender: str, user_text: str, model_text: str) -> Conversation:
+        """Record a turn, fold the oldest turns if over budget, and save."""
+        conversation = self.get(tenant, sender)
+        turns = [
+            Turn("user", user_text, self._count(user_text)),
+            Turn("model", model_text, self._count(model_text)),
+        ]
+        with self._lock:
+            conversation.turns.extend(turns)
+            folded = self._take_folded(conversation)
+        if folded:
+            self._fold(tenant, conversation, folded)
+        if self._store is not None:
+            try:
+                self._store.save((tenant, sender), conversation)
+            except Exception as exc:
+                self.store_errors += 1
+                logger.warning("Failed to save conversation: %s", exc)
+        return conversation
+
+    def _count(self, text: str) -> int:
+        try:
+            return self._count_tokens(text)
+        except Exception as exc:
+            self.count_errors += 1
+            logger.warning("Failed to count tokens, estimating them: %s", exc)
+            return estimate_tokens(text)
+
+    def _take_folded(self, conversation: Conversation) -> list[Turn]:
+        if conversation.tokens <= self._budget:
+            return []
+        target = self._budget * self._low_water
+        folded = []
+        while len(conversation.turns) > self._min_turns and conversation.tokens > target:
+            folded.append(conversation.turns.pop(0))
+        return folded
+
+    def _fold(self, tenant: str, conversation: Conversation, folded: list[Turn]) -> None:
+        self.folds += 1
+        self.folded_turns += len(folded)
+        if self._summarize is None:
+            return
+        try:
+            summary = self._summarize(tenant, conversation.summary, folded)
+        except Exception as exc:
+            # Keep the previous summary; the folded turns are lost.
+            self.summarize_errors += 1
+            logger.warning("Failed to summarize conversation: %s", exc)
+            return
+        tokens = self._count(summary)
+        with self._lock:
+            conversation.summary = summary
+            conversation.summary_tokens = tokens
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "conversations_cached": len(self._conversations),
+            "conversations_loaded": self.loads,
+            "conversations_folds": self.folds,
+            "conversations_folded_turns": self.folded_turns,
+            "conversations_summarize_errors": self.summarize_errors,
+            "conversations_store_errors": self.store_errors,
+            "conversations_token_count_errors": self.count_errors,
+        }
@@ -1,43 +1,389 @@
+import math
+import os
+from typing import Any
 
-from fastapi import FastAPI
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from google.cloud import aiplatform
 import google.cloud.logging
 import logging
+from vertexai.generative_models import GenerativeModel
+from vertexai.language_models import TextEmbeddingModel
 
-app = FastAPI()
+from conversations import ConversationStore, FirestoreConversationStore, Turn, estimate_tokens
+from model_registry import ModelRegistry, generate_content, predict_instances
+from response_cache import ResponseCache
+from scheduler import FairScheduler, SchedulerFull
+from streaming import ReleasingResponse, events
+from shared import clients, logs, metrics
+from shared.latency import LatencyMiddleware
+from shared.offload import BlockingExecutor
+from shared.tenant_cache import TenantCache
 
 # Instantiates a client
 client = google.cloud.logging.Client()
 
-# Retrieves a Cloud Logging handler; you can log standard Python
-# logging messages to Cloud Logging
-client.setup_logging()
+# Attaches a batching Cloud Logging handler: standard Python logging
+# messages are queued and written to Cloud Logging off the request path.
+logs.setup_logging(client)
 
 # The name of the log to write to
 log_name = "agentes-ia-log"
 # The logger object
 logger = logging.getLogger(log_name)
 
-@app.post("/nlu/generate")
-def generate(request: dict):
-    tenant = request.get("tenant")
-    model = request.get("model")
-    prompt = request.get("prompt")
+llm_tokens = metrics.registry.counter(
+    "llm_tokens_total",
+    "Tokens used by LLM generations (source=cache: saved by the response cache)",
+    ("tenant", "model", "source"),
+)
+first_token = metrics.registry.histogram(
+    "llm_first_token_ms", "Time to the first streamed text of a generation", ("model",)
+)
+
+VERTEX_PROJECT = os.environ.get("VERTEX_PROJECT", "agentes-ia-dev")
+VERTEX_LOCATION = os.environ.get("VERTEX_LOCATION", "us-central1")
+
+
+def model_names(variable: str, default: str = "") -> list[str]:
+    """A comma-separated list of model names from the environment."""
+    return [name.strip() for name in os.environ.get(variable, default).split(",") if name.strip()]
+
+
+# Gemini models /nlu/generate accepts. The warm, batch and summary models
+# below are accepted too; any other model name gets a 400.
+LLM_MODELS = model_names("LLM_MODELS", "gemini-1.5-pro")
+# Models loaded when the container starts.
+LLM_WARM_MODELS = model_names("LLM_WARM_MODELS")
+# If set, each warm model answers this prompt once at startup, which also
+# connects its channel. It spends tokens, so it is off by default.
+LLM_WARMUP_PROMPT = os.environ.get("LLM_WARMUP_PROMPT", "")
+# Vertex AI endpoints (ids or resource names) whose deployed model accepts
+# several `instances` per predict; requests for them are batched.
+LLM_BATCH_MODELS = set(model_names("LLM_BATCH_MODELS"))
+LLM_BATCH_MAX_SIZE = int(os.environ.get("LLM_BATCH_MAX_SIZE", "8"))
+# Model that summarizes older conversation turns; without one they are dropped.
+LLM_CONTEXT_SUMMARY_MODEL = os.environ.get("LLM_CONTEXT_SUMMARY_MODEL", "")
+# Gemini model whose `count_tokens` counts conversation turns; with none they
+# are estimated at about four characters per token.
+LLM_CONTEXT_TOKEN_MODEL = os.environ.get(
+    "LLM_CONTEXT_TOKEN_MODEL", LLM_MODELS[0] if LLM_MODELS else ""
+)
+
+
+# `exact` or `semantic` enables the response cache (off by default).
+LLM_CACHE = os.environ.get("LLM_CACHE", "off")
+LLM_CACHE_EMBEDDING_MODEL = os.environ.get(
+    "LLM_CACHE_EMBEDDING_MODEL", "text-multilingual-embedding-002"
+)
+
+
+# Model calls, SDK setup, cache lookups (embeddings) and stream set-up are
+# blocking gRPC calls; they run on this pool, off the event loop.
+blocking = BlockingExecutor(max_workers=int(os.environ.get("BLOCKING_IO_THREADS", "32")))
+metrics.registry.add_collector(blocking.stats)
+
+
+def load_tenant(tenant: str) -> dict[str, Any] | None:
+    tenant_doc = clients.registry.firestore().collection("tenants").document(tenant).get()
+    if not tenant_doc.exists:
+        return None
+    return tenant_doc.to_dict()
+
+
+# Tenants come from the request body and become metric labels and scheduler
+# queues, so only existing tenants are served.
+tenant_cache = TenantCache(
+    load_tenant,
+    maxsize=int(os.environ.get("TENANT_CACHE_MAXSIZE", "256")),
+    ttl=float(os.environ.get("TENANT_CACHE_TTL_SECONDS", "300")),
+    negative_ttl=float(os.environ.get("TENANT_CACHE_NEGATIVE_TTL_SECONDS", "30")),
+)
+metrics.registry.add_collector(tenant_cache.stats)
+
+
+def init_vertex() -> None:
+    aiplatform.init(project=VERTEX_PROJECT, location=VERTEX_LOCATION)
+
+
+def load_model(model_name: str):
+    if model_name in LLM_BATCH_MODELS:
+        return aiplatform.Endpoint(model_name)
+    return GenerativeModel(model_name)
+
+
+models = ModelRegistry(
+    load_model,
+    init=init_vertex,
+    allowed={
+        *LLM_MODELS,
+        *LLM_WARM_MODELS,
+        *LLM_BATCH_MODELS,
+        LLM_CONTEXT_SUMMARY_MODEL,
+        LLM_CONTEXT_TOKEN_MODEL,
+    } - {""},
+    run=blocking.run,
+)
+embedding_models = ModelRegistry(
+    TextEmbeddingModel.from_pretrained,
+    init=init_vertex,
+    allowed=[LLM_CACHE_EMBEDDING_MODEL],
+    run=blocking.run,
+)
+metrics.registry.add_collector(models.stats)
+
+
+def embed(text: str) -> list[float]:
+    model = embedding_models.get(LLM_CACHE_EMBEDDING_MODEL)
+    return model.get_embeddings([text])[0].values
+
+
+def build_response_cache() -> ResponseCache | None:
+    if LLM_CACHE not in ("exact", "semantic"):
+        return None
+    return ResponseCache(
+        maxsize=int(os.environ.get("LLM_CACHE_MAXSIZE", "1000")),
+        ttl=float(os.environ.get("LLM_CACHE_TTL_SECONDS", "86400")),
+        embed=embed if LLM_CACHE == "semantic" else None,
+        threshold=float(os.environ.get("LLM_CACHE_SIMILARITY", "0.92")),
+    )
+
+
+response_cache = build_response_cache()
+if response_cache is not None:
+    metrics.registry.add_collector(response_cache.stats)
+
+
+def predict_batch(model_name: str, prompts: list[str]) -> list[tuple[str, int]]:
+    """
+    Generate the answer to each of `prompts`; returns `(content, tokens)` per
+    prompt. Batch models answer them all in one predict call, Gemini models
+    get one prompt per call (the scheduler never batches them).
+    """
+    handle = models.get(model_name)
+    if model_name in LLM_BATCH_MODELS:
+        return predict_instances(handle, prompts, estimate_tokens)
+    return [generate_content(handle, prompt) for prompt in prompts]
+
+
+async def run_batch(model_name: str, prompts: list[str]) -> list[tuple[str, int]]:
+    return await blocking.run(predict_batch, model_name, prompts)
+
+
+scheduler = FairScheduler(
+    run_batch,
+    max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "16")),
+    tenant_concurrency=int(os.environ.get("LLM_TENANT_CONCURRENCY", "4")),
+    batch_size=lambda model: LLM_BATCH_MAX_SIZE if model in LLM_BATCH_MODELS else 1,
+    batch_window=float(os.environ.get("LLM_BATCH_WINDOW_MS", "5")) / 1000,
+    max_queued=int(os.environ.get("LLM_MAX_QUEUED_PER_TENANT", "100")),
+)
+metrics.registry.add_collector(scheduler.stats)
 
-    aiplatform.init(project="agentes-ia-dev", location="us-central1")
-    model = aiplatform.gapic.Model(model_name=model)
 
-    response = model.predict(instances=[prompt])
+# `memory` or `firestore` keeps conversation history per sender (off by
+# default); requests that carry a `sender` then get it in their prompt.
+LLM_CONTEXT = os.environ.get("LLM_CONTEXT", "off")
+SUMMARY_PROMPT = (
+    "Actualiza el resumen de esta conversación de WhatsApp entre un cliente "
+    "(user) y el asistente (model) con los mensajes nuevos. Conserva datos "
+    "útiles para seguir atendiendo (destino, fechas, nombres, pedidos).\n"
+    "Resumen actual: {summary}\n"
+    "Mensajes nuevos:\n{turns}\n"
+    "Responde solo con el resumen actualizado, en menos de 80 palabras."
+)
 
+
+def summarize(tenant: str, summary: str, turns: list[Turn]) -> str:
+    prompt = SUMMARY_PROMPT.format(
+        summary=summary or "(vacío)",
+        turns="\n".join(f"{turn.role}: {turn.text}" for turn in turns),
+    )
+    # Folding runs in a background task thread; the call still waits its
+    # turn in the scheduler like the tenant's other generations.
+    content, tokens = scheduler.submit_from_thread(tenant, LLM_CONTEXT_SUMMARY_MODEL, prompt)
+    llm_tokens.inc(tokens, tenant=tenant, model=LLM_CONTEXT_SUMMARY_MODEL, source="model")
+    return content
+
+
+def count_tokens(text: str) -> int:
+    return models.get(LLM_CONTEXT_TOKEN_MODEL).count_tokens(text).total_tokens
+
+
+def build_conversations() -> ConversationStore | None:
+    if LLM_CONTEXT not in ("memory", "firestore"):
+        return None
+    store = None
+    if LLM_CONTEXT == "firestore":
+        store = FirestoreConversationStore(
+            clients.get_firestore,
+            collection=os.environ.get("LLM_CONTEXT_COLLECTION", "conversations"),
+            ttl=float(os.environ.get("LLM_CONTEXT_TTL_SECONDS", str(7 * 86400))),
+        )
+    return ConversationStore(
+        count_tokens=count_tokens if LLM_CONTEXT_TOKEN_MODEL else estimate_tokens,
+        budget=int(os.environ.get("LLM_CONTEXT_TOKEN_BUDGET", "1000")),
+        maxsize=int(os.environ.get("LLM_CONTEXT_MAXSIZE", "10000")),
+        summarize=summarize if LLM_CONTEXT_SUMMARY_MODEL else None,
+        store=store,
+    )
+
+
+conversations = build_conversations()
+if conversations is not None:
+    metrics.registry.add_collector(conversations.stats)
+
+
+def warm_up(model_name: str) -> None:
+    predict_batch(model_name, [LLM_WARMUP_PROMPT])
+
+
+async def on_startup(app: FastAPI) -> None:
+    # Runs before the instance takes traffic.
+    await models.start(LLM_WARM_MODELS, warmup=warm_up if LLM_WARMUP_PROMPT else None)
+    if LLM_CACHE == "semantic":
+        await embedding_models.start([LLM_CACHE_EMBEDDING_MODEL])
+    await scheduler.start()
+
+
+async def on_shutdown(app: FastAPI) -> None:
+    await scheduler.stop()
+    tenant_cache.close()
+    blocking.close()
+
+
+app = FastAPI(
+    lifespan=clients.lifespan("firestore", startup=on_startup, shutdown=on_shutdown)
+)
+app.add_middleware(LatencyMiddleware, service="llm-orchestrator")
+app.include_router(metrics.router)
+
+def record_generation(
+    tenant, model_name, prompt, content, tokens, vector=None, cache=True
+) -> None:
+    llm_tokens.inc(tokens, tenant=tenant, model=model_name, source="model")
     logger.info("LLM tokens", extra={
         "json_fields": {
             "app": "agentes-ia",
             "env": "dev",
             "tenant": tenant,
-            "model": model,
+            "model": model_name,
             "metric": "llm_tokens_total",
-            "tokens": response.usage_metadata.total_token_count
+            "tokens": tokens
         }
     })
 
-    return {"response": response.predictions[0].content}
+    if response_cache is not None and cache:
+        response_cache.store(tenant, model_name, prompt, content, tokens, vector)
+
+
+async def check_tenant(tenant: Any) -> None:
+    """Raise 400 for a missing tenant and 404 for an unknown one."""
+    if not isinstance(tenant, str) or not tenant:
+        raise HTTPException(status_code=400, detail="Missing tenant")
+    found, tenant_config = tenant_cache.cached(tenant)
+    if not found:
+        tenant_config = await blocking.run(tenant_cache.get, tenant)
+    if tenant_config is None:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+
+
+def start_stream(model_name: str, prompt: str):
+    return models.get(model_name).generate_content(prompt, stream=True)
+
+
+@app.post("/nlu/generate")
+async def generate(request: dict, background: BackgroundTasks, stream: bool = False):
+    """
+    Generate the answer to `prompt` with `model`. With a `sender` (and
+    LLM_CONTEXT enabled) the prompt carries that sender's conversation and
+    the new turn is recorded. With `?stream=true` the answer is streamed as
+    NDJSON events (see `streaming.py`) while Gemini generates it. Unknown
+    tenants get a 404 and models outside the configured ones a 400. Model calls go through the
+    scheduler, which answers 429 when the tenant already has too many
+    generations queued.
+    """
+    tenant = request.get("tenant")
+    model_name = request.get("model")
+    question = request.get("prompt")
+    sender = request.get("sender") if conversations is not None else None
+    await check_tenant(tenant)
+    if not models.allows(model_name):
+        raise HTTPException(status_code=400, detail=f"Unknown model {model_name!r}")
+    if stream and model_name in LLM_BATCH_MODELS:
+        raise HTTPException(status_code=400, detail="Streaming needs a Gemini model")
+
+    prompt = question
+    if sender:
+        prompt = await blocking.run(conversations.prompt, tenant, sender, question)
+    # Only a question without prior context can share a cached answer.
+    cacheable = response_cache is not None and prompt == question
+
+    def remember(content: str) -> None:
+        if sender:
+            conversations.append(tenant, sender, question, content)
+
+    vector = None
+    if cacheable:
+        hit, vector = await blocking.run(response_cache.lookup, tenant, model_name, prompt)
+        if hit is not None:
+            llm_tokens.inc(hit.tokens, tenant=tenant, model=model_name, source="cache")
+            logger.info("LLM cache hit", extra={
+                "json_fields": {
+                    "app": "agentes-ia",
+                    "env": "dev",
+                    "tenant": tenant,
+                    "model": model_name,
+                    "metric": "llm_cache_hits_total",
+                    "tier": hit.tier,
+                    "similarity": round(hit.similarity, 4),
+                    "tokens_saved": hit.tokens
+                }
+            })
+            background.add_task(remember, hit.response)
+            if stream:
+                return StreamingResponse(
+                    events([hit.response]),
+                    media_type="application/x-ndjson",
+                    background=background,
+                )
+            return {"response": hit.response}
+
+    try:
+        if stream:
+            release = await scheduler.hold(tenant)
+        else:
+            content, tokens = await scheduler.submit(tenant, model_name, prompt)
+    except SchedulerFull as exc:
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
+
+    if stream:
+        try:
+            chunks = await blocking.run(start_stream, model_name, prompt)
+        except BaseException:
+            release()
+            raise
+
+        def on_done(content: str, tokens: int) -> None:
+            record_generation(tenant, model_name, prompt, content, tokens, vector, cacheable)
+            # Folding old turns may call the model; keep it off the stream.
+            background.add_task(remember, content)
+
+        lines = events(
+            chunks,
+            on_done=on_done,
+            on_first=lambda ms: first_token.observe(ms, model=model_name),
+        )
+        return ReleasingResponse(
+            lines, release, media_type="application/x-ndjson", background=background
+        )
+
+    record_generation(tenant, model_name, prompt, content, tokens, vector, cacheable)
+    # Recorded after the response is sent: folding old turns may call the model.
+    background.add_task(remember, content)
+
+    return {"response": content}
@@ -0,0 +1,170 @@
+"""
+Model handles for the LLM orchestrator.
+
+`generate()` used to call `aiplatform.init()` and build the model handle on
+every request, redoing the SDK setup (credentials, prediction client and
+gRPC channel) each time. `ModelRegistry` runs `init` once per process and
+keeps one handle per model name, built the first time the model is asked
+for; every later request reuses it, and with it its client and channel.
+
+Model names come from requests, so the registry only builds handles for the
+`allowed` names; anything else raises `UnknownModel` instead of growing the
+handles (and the `model` metric labels) without bound.
+
+`start()` runs at container start: it initializes the SDK and loads the
+models listed to warm, so the first message on a new instance does not pay
+for it. The blocking SDK calls go through `run` (the service passes its
+`BlockingExecutor`), so different models load in parallel off the event
+loop; concurrent requests for a model that is still loading wait for that
+one load.
+
+`generate_content()` and `predict_instances()` call the two kinds of handle
+the service builds: a Gemini `GenerativeModel` (one prompt per call) and an
+`aiplatform.Endpoint` serving a model that takes several `instances` per
+predict.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from shared import metrics
+
+logger = logging.getLogger("agentes-ia-log")
+
+model_load = metrics.registry.histogram(
+    "llm_model_load_ms", "Time to build a model handle", ("model",)
+)
+
+
+class UnknownModel(Exception):
+    def __init__(self, name: Any) -> None:
+        super().__init__(f"Unknown model {name!r}")
+        self.name = name
+
+
+async def _inline(func: Callable[..., Any], *args: Any) -> Any:
+    return func(*args)
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        load: Callable[[str], Any],
+        init: Optional[Callable[[], None]] = None,
+        allowed: Optional[Iterable[str]] = None,
+        run: Callable[..., Awaitable[Any]] = _inline,
+    ) -> None:
+        self._load = load
+        self._init = init
+        self._allowed = frozenset(allowed) if allowed is not None else None
+        self._run = run
+        self._initialized = False
+        self._handles: dict[str, Any] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.load_errors = 0
+        self.warmed = 0
+
+    def allows(self, name: Any) -> bool:
+        return self._allowed is None or name in self._allowed
+
+    def _ensure_init(self) -> None:
+        if self._initialized:
+            return
+        with self._lock:
+            if not self._initialized:
+                if self._init is not None:
+                    self._init()
+                self._initialized = True
+
+    def get(self, name: str) -> Any:
+        """Return the handle for model `name`, building it on first use."""
+        handle = self._handles.get(name)
+        if handle is not None:
+            return handle
+        if not self.allows(name):
+            raise UnknownModel(name)
+        self._ensure_init()
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            handle = self._handles.get(name)
+            if handle is None:
+                start = time.perf_counter()
+                try:
+                    handle = self._load(name)
+                except Exception:
+                    self.load_errors += 1
+                    raise
+                model_load.observe((time.perf_counter() - start) * 1000, model=name)
+                self.loads += 1
+                self._handles[name] = handle
+        return handle
+
+    async def start(
+        self,
+        warm: Iterable[str] = (),
+        warmup: Optional[Callable[[str], Any]] = None,
+    ) -> None:
+        """
+        Initialize the SDK and load the `warm` models, in parallel through
+        `run`. `warmup(name)`, if given, runs once per model after it loads
+        (e.g. a one-token prediction) so the channel is connected before
+        traffic arrives. Failures are logged and leave the model to load on
+        its first request.
+        """
+        await self._run(self._ensure_init)
+        warmed = await asyncio.gather(*(self._run(self._warm, name, warmup) for name in warm))
+        self.warmed += sum(warmed)
+
+    def _warm(self, name: str, warmup: Optional[Callable[[str], Any]]) -> bool:
+        try:
+            self.get(name)
+            if warmup is not None:
+                warmup(name)
+        except Exception as exc:
+            logger.warning("Model warm-up failed for %s: %s", name, exc)
+            return False
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "llm_models_loaded": len(self._handles),
+            "llm_model_loads": self.loads,
+            "llm_model_load_errors": self.load_errors,
+            "llm_models_warmed": self.warmed,
+        }
+
+
+def generate_content(model: Any, prompt: str) -> tuple[str, int]:
+    """One `GenerativeModel.generate_content` call; returns `(text, tokens)`."""
+    response = model.generate_content(prompt)
+    return response.text, response.usage_metadata.total_token_count
+
+
+def predict_instances(
+    endpoint: Any, prompts: list[str], count_tokens: Callable[[str], int]
+) -> list[tuple[str, int]]:
+    """
+    One `Endpoint.predict` call with an instance per prompt; returns
+    `(text, tokens)` per prompt. Each prediction is the generated text, or a
+    mapping with it under `content`. Endpoints do not report token usage, so
+    `count_tokens` counts each prompt and its answer.
+    """
+    response = endpoint.predict(instances=[{"prompt": prompt} for prompt in prompts])
+    if len(response.predictions) != len(prompts):
+        raise ValueError(
+            f"Expected {len(prompts)} predictions, got {len(response.predictions)}"
+        )
+    results = []
+    for prompt, prediction in zip(prompts, response.predictions):
+        text = prediction["content"] if isinstance(prediction, Mapping) else str(prediction)
+        results.append((text, count_tokens(prompt) + count_tokens(text)))
+    return results
@@ -0,0 +1,185 @@
+"""
+Per-tenant cache of LLM responses.
+
+Customers keep asking the same questions (baggage, payment methods, opening
+hours), and each one costs a full model call. `ResponseCache` keeps the
+answers per tenant and model in two tiers:
+
+- exact: the SHA-256 of the normalized prompt (case, accents, punctuation and
+  spacing ignored), so "¿Horario de atención?" and "horario de atencion"
+  share an entry;
+- semantic: with an `embed(text)` function, a prompt whose embedding has a
+  cosine similarity of at least `threshold` with a cached one reuses its
+  answer. Vectors are stored unit-length, so the similarity is a dot
+  product; each lookup scans the tenant's entries, which `maxsize` bounds.
+
+Entries expire after `ttl` seconds and each tenant keeps at most `maxsize`
+of them, evicting the least recently used.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import operator
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(prompt: str) -> str:
+    text = unicodedata.normalize("NFKD", prompt.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def _unit(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else list(vector)
+
+
+@dataclass
+class CacheEntry:
+    response: Any
+    tokens: int
+    expires_at: float
+    vector: Optional[list[float]] = None
+
+
+@dataclass
+class CacheHit:
+    response: Any
+    tokens: int
+    tier: str
+    similarity: float = 1.0
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        ttl: float = 86400.0,
+        embed: Optional[Callable[[str], list[float]]] = None,
+        threshold: float = 0.92,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._embed = embed
+        self._threshold = threshold
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (tenant, model) -> prompt hash -> entry, least recently used first.
+        self._entries: dict[tuple[str, str], OrderedDict[str, CacheEntry]] = {}
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_saved = 0
+        self.embed_errors = 0
+
+    @staticmethod
+    def key(prompt: str) -> str:
+        return hashlib.sha256(normalize(prompt).encode()).hexdigest()
+
+    def _vector(self, prompt: str) -> Optional[list[float]]:
+        if self._embed is None:
+            return None
+        try:
+            return _unit(self._embed(prompt))
+        except Exception:
+            # The model call still answers; it just is not cached semantically.
+            self.embed_errors += 1
+            return None
+
+    def lookup(
+        self, tenant: str, model: str, prompt: str
+    ) -> tuple[Optional[CacheHit], Optional[list[float]]]:
+        """
+        Return `(hit, vector)`: the cached answer, if any, and the prompt's
+        embedding (when one was computed) to pass to `store()` on a miss.
+        """
+        key = self.key(prompt)
+        now = self._clock()
+        with self._lock:
+            entries = self._entries.get((tenant, model))
+            entry = entries.get(key) if entries is not None else None
+            if entry is not None:
+                if entry.expires_at > now:
+                    entries.move_to_end(key)
+                    return self._hit(entry, "exact"), None
+                del entries[key]
+
+        vector = self._vector(prompt)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        with self._lock:
+            entries = self._entries.get((tenant, model)) or OrderedDict()
+            expired = [name for name, candidate in entries.items() if candidate.expires_at <= now]
+            for name in expired:
+                del entries[name]
+            candidates = [
+                (name, candidate) for name, candidate in entries.items() if candidate.vector is not None
+            ]
+        # Scanned outside the lock: ~50 ms for 1000 entries of 768 dimensions.
+        best_key, best = None, self._threshold
+        for candidate_key, candidate in candidates:
+            similarity = sum(map(operator.mul, vector, candidate.vector))
+            if similarity >= best:
+                best_key, best = candidate_key, similarity
+        with self._lock:
+            entry = entries.get(best_key) if best_key is not None else None
+            if entry is None:
+                self.misses += 1
+                return None, vector
+            entries.move_to_end(best_key)
+            return self._hit(entry, "semantic", best), vector
+
+    def _hit(self, entry: CacheEntry, tier: str, similarity: float = 1.0) -> CacheHit:
+        self.hits[tier] += 1
+        self.tokens_saved += entry.tokens
+        return CacheHit(entry.response, entry.tokens, tier, similarity)
+
+    def store(
+        self,
+        tenant: str,
+        model: str,
+        prompt: str,
+        response: Any,
+        tokens: int,
+        vector: Optional[list[float]] = None,
+    ) -> None:
+        key = self.key(prompt)
+        entry = CacheEntry(response, tokens, self._clock() + self._ttl, vector)
+        with self._lock:
+            entries = self._entries.setdefault((tenant, model), OrderedDict())
+            entries[key] = entry
+            entries.move_to_end(key)
+            while len(entries) > self._maxsize:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            size = sum(len(entries) for entries in self._entries.values())
+        lookups = self.hits["exact"] + self.hits["semantic"] + self.misses
+        return {
+            "llm_cache_size": size,
+            "llm_cache_hits_exact": self.hits["exact"],
+            "llm_cache_hits_semantic": self.hits["semantic"],
+            "llm_cache_misses": self.misses,
+            "llm_cache_hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "llm_cache_evictions": self.evictions,
+            "llm_cache_tokens_saved": self.tokens_saved,
+            "llm_cache_embed_errors": self.embed_errors,
+        }
@@ -0,0 +1,281 @@
+"""
+Fair scheduling of model calls in the LLM orchestrator.
+
+Every `/nlu/generate` used to be an independent blocking predict holding a
+threadpool slot, so a burst from one tenant could take every slot and make
+the other tenants wait behind it. `FairScheduler` queues requests per tenant
+and starts model calls from an asyncio loop:
+
+- at most `max_concurrency` model calls run at once, and each tenant has at
+  most `tenant_concurrency` requests in them;
+- tenants take turns (round-robin over the tenants with queued requests), so
+  a noisy tenant only delays its own requests;
+- requests for the same model are sent together in one call, up to
+  `batch_size(model)` instances, for backends that accept several
+  `instances`. The first request of a batch waits at most `batch_window`
+  seconds for company.
+
+Each tenant may queue `max_queued` requests; past that `submit()` raises
+`SchedulerFull`. The time spent queued (`llm_queue_wait_ms{tenant}`) and the
+time in the model call (`llm_model_latency_ms{model}`) are observed
+separately.
+
+`submit_from_thread()` queues work from a worker thread, such as the
+conversation summaries made in background tasks, so it waits its turn like
+any other request. `hold(tenant)` takes a slot through the same queue for work the scheduler
+does not run itself (streamed generations); the caller releases it when done.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from shared import metrics
+
+logger = logging.getLogger("agentes-ia-log")
+
+queue_wait = metrics.registry.histogram(
+    "llm_queue_wait_ms", "Time a generation waited for a model slot", ("tenant",)
+)
+model_latency = metrics.registry.histogram(
+    "llm_model_latency_ms", "Duration of model calls", ("model",)
+)
+batch_sizes = metrics.registry.histogram(
+    "llm_batch_size",
+    "Instances per model call",
+    ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class SchedulerFull(Exception):
+    def __init__(self, tenant: str, retry_after: float) -> None:
+        super().__init__(f"Too many queued generations for tenant {tenant}")
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Request:
+    tenant: str
+    # The model; None for `hold()`, which is never batched.
+    key: Optional[str]
+    payload: Any
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        run_batch: Callable[[str, list[Any]], Awaitable[list[Any]]],
+        max_concurrency: int = 16,
+        tenant_concurrency: int = 4,
+        batch_size: Callable[[str], int] = lambda model: 1,
+        batch_window: float = 0.005,
+        max_queued: int = 100,
+    ) -> None:
+        self._run_batch = run_batch
+        self._max_concurrency = max_concurrency
+        self._tenant_concurrency = tenant_concurrency
+        self._batch_size = batch_size
+        self._batch_window = batch_window
+        self._max_queued = max_queued
+        self._queues: dict[str, deque[_Request]] = {}
+        # Tenants with queued requests, in turn order.
+        self._turns: deque[str] = deque()
+        self._tenant_active: dict[str, int] = {}
+        self._active = 0
+        self._inflight: set[asyncio.Task] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop_ref: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.calls = 0
+        self.batched = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        self._wake = asyncio.Event()
+        self._loop_ref = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._loop(), name="llm-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._inflight, return_exceptions=True)
+            self._task = None
+        for queue in self._queues.values():
+            for request in queue:
+                request.future.cancel()
+        self._queues.clear()
+        self._turns.clear()
+
+    async def submit(self, tenant: str, model: str, payload: Any) -> Any:
+        """Queue `payload` for `model` and return its result."""
+        return await self._queue(tenant, model, payload)
+
+    def submit_from_thread(self, tenant: str, model: str, payload: Any) -> Any:
+        """
+        `submit()` for code running in a worker thread (not the event loop's):
+        block until the result.
+        """
+        if self._loop_ref is None:
+            raise RuntimeError("FairScheduler is not started")
+        return asyncio.run_coroutine_threadsafe(
+            self.submit(tenant, model, payload), self._loop_ref
+        ).result()
+
+    async def hold(self, tenant: str) -> Callable[[], None]:
+        """Wait for a slot; return the function that releases it."""
+        future = self._queue(tenant, None, None)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Granted just as the caller gave up: give the slot back.
+            if future.done() and not future.cancelled():
+                future.result()()
+            raise
+
+    def _queue(self, tenant: str, key: Optional[str], payload: Any) -> asyncio.Future:
+        if self._wake is None:
+            raise RuntimeError("FairScheduler is not started")
+        queue = self._queues.get(tenant)
+        if queue is None:
+            queue = self._queues[tenant] = deque()
+        if len(queue) >= self._max_queued:
+            self.rejected += 1
+            raise SchedulerFull(tenant, retry_after=1.0)
+        if not queue:
+            self._turns.append(tenant)
+        request = _Request(tenant, key, payload, asyncio.get_running_loop().create_future())
+        queue.append(request)
+        self._wake.set()
+        return request.future
+
+    def _head(self, tenant: str) -> Optional[_Request]:
+        """The tenant's next live request, dropping those whose caller left."""
+        queue = self._queues.get(tenant)
+        while queue and queue[0].future.cancelled():
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def _pop(self, tenant: str) -> _Request:
+        request = self._queues[tenant].popleft()
+        if not self._queues[tenant]:
+            del self._queues[tenant]
+            self._turns.remove(tenant)
+        self._tenant_active[tenant] = self._tenant_active.get(tenant, 0) + 1
+        queue_wait.observe((time.perf_counter() - request.enqueued_at) * 1000, tenant=tenant)
+        return request
+
+    def _take(self, key: Optional[str], limit: int) -> list[_Request]:
+        """
+        Take up to `limit` requests, one per tenant per turn. With `key` only
+        requests for that model at the head of a tenant's queue qualify;
+        without it the first eligible tenant's head request is taken alone.
+        """
+        taken: list[_Request] = []
+        progress = True
+        while progress and len(taken) < limit:
+            progress = False
+            for _ in range(len(self._turns)):
+                if not self._turns:
+                    break
+                tenant = self._turns[0]
+                self._turns.rotate(-1)
+                head = self._head(tenant)
+                if head is None:
+                    self._queues.pop(tenant, None)
+                    self._turns.remove(tenant)
+                    continue
+                if self._tenant_active.get(tenant, 0) >= self._tenant_concurrency:
+                    continue
+                if key is not None and head.key != key:
+                    continue
+                taken.append(self._pop(tenant))
+                progress = True
+                if key is None or len(taken) >= limit:
+                    return taken
+        return taken
+
+    async def _loop(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._active < self._max_concurrency:
+                batch = self._take(None, 1)
+                if not batch:
+                    break
+                key = batch[0].key
+                if key is None:
+                    self._active += 1
+                    batch[0].future.set_result(self._releaser(batch[0].tenant))
+                    continue
+                limit = max(self._batch_size(key), 1)
+                batch += self._take(key, limit - len(batch))
+                if len(batch) < limit and self._batch_window > 0:
+                    await asyncio.sleep(self._batch_window)
+                    batch += self._take(key, limit - len(batch))
+                self._active += 1
+                task = asyncio.create_task(self._call(key, batch))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    def _releaser(self, tenant: str) -> Callable[[], None]:
+        released = False
+
+        def release_now() -> None:
+            self._done(tenant)
+            self._active -= 1
+            self._wake.set()
+
+        def release() -> None:
+            # May be called from a worker thread (streamed responses are
+            # iterated in the threadpool).
+            nonlocal released
+            if not released:
+                released = True
+                self._loop_ref.call_soon_threadsafe(release_now)
+
+        return release
+
+    def _done(self, tenant: str) -> None:
+        self._tenant_active[tenant] -= 1
+        if not self._tenant_active[tenant]:
+            del self._tenant_active[tenant]
+
+    async def _call(self, model: str, batch: list[_Request]) -> None:
+        start = time.perf_counter()
+        try:
+            results = await self._run_batch(model, [request.payload for request in batch])
+        except Exception as exc:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(exc)
+        else:
+            for request, result in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result(result)
+        finally:
+            model_latency.observe((time.perf_counter() - start) * 1000, model=model)
+            batch_sizes.observe(len(batch), model=model)
+            self.calls += 1
+            self.batched += len(batch)
+            for request in batch:
+                self._done(request.tenant)
+            self._active -= 1
+            self._wake.set()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "llm_queued": sum(len(queue) for queue in self._queues.values()),
+            "llm_queued_tenants": len(self._turns),
+            "llm_active_calls": self._active,
+            "llm_model_calls": self.calls,
+            "llm_batched_requests": self.batched,
+            "llm_rejected": self.rejected,
+        }
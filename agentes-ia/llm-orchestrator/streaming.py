@@ -0,0 +1,126 @@
+"""
+Streamed generations for `/nlu/generate?stream=true`.
+
+`events()` turns the chunks of a streaming Gemini call
+(`generate_content(..., stream=True)`) into NDJSON lines as they arrive:
+
+    {"type": "delta", "text": "Hola, el equipaje"}
+    {"type": "message", "text": "Hola, el equipaje incluido es de 23 kg."}
+    {"type": "done", "response": "...", "tokens": 57}
+
+`message` is emitted for every complete paragraph (text up to a blank
+line), so the dispatcher can send it as a WhatsApp message, or show the
+typing indicator, while the rest is still being generated; the remainder
+comes in a last `message` before `done`. A failure after the stream started
+ends it with `{"type": "error", "error": "..."}`, since the status code was
+already sent. If the client goes away first, the lines are closed early:
+the Gemini stream is closed with them, so it stops generating, and
+`on_done` is not called.
+
+`ReleasingResponse` streams the lines while holding a scheduler slot and
+gives it back when the response ends, however it ends.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger("agentes-ia-log")
+
+PARAGRAPH = "\n\n"
+
+
+def _line(event: dict[str, Any]) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+def events(
+    chunks: Iterable[Any],
+    on_done: Optional[Callable[[str, int], None]] = None,
+    on_first: Optional[Callable[[float], None]] = None,
+) -> Iterator[str]:
+    """
+    Yield NDJSON events for `chunks`. `on_first(ms)` gets the time to the
+    first text and `on_done(response, tokens)` the full answer.
+    """
+    start = time.perf_counter()
+    parts: list[str] = []
+    pending = ""
+    tokens = 0
+    stream = iter(chunks)
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage is not None and usage.total_token_count:
+                tokens = usage.total_token_count
+            text = _text(chunk)
+            if not text:
+                continue
+            if not parts and on_first is not None:
+                on_first((time.perf_counter() - start) * 1000)
+            parts.append(text)
+            yield _line({"type": "delta", "text": text})
+            pending += text
+            while PARAGRAPH in pending:
+                paragraph, pending = pending.split(PARAGRAPH, 1)
+                if paragraph.strip():
+                    yield _line({"type": "message", "text": paragraph.strip()})
+    except Exception as exc:
+        logger.exception("Streamed generation failed")
+        yield _line({"type": "error", "error": str(exc)})
+        return
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    if pending.strip():
+        yield _line({"type": "message", "text": pending.strip()})
+    response = "".join(parts)
+    if on_done is not None:
+        on_done(response, tokens)
+    yield _line({"type": "done", "response": response, "tokens": tokens})
+
+
+def _text(chunk: Any) -> str:
+    if isinstance(chunk, str):
+        return chunk
+    # `chunk.text` raises when the chunk has no text part (e.g. only the
+    # final usage metadata or a safety block).
+    try:
+        return chunk.text or ""
+    except (AttributeError, ValueError):
+        return ""
+
+
+class ReleasingResponse(StreamingResponse):
+    """
+    A `StreamingResponse` of `lines` that calls `release()` once they are
+    exhausted, and in any case when the response ends. A client that
+    disconnects before the first line, or a failure sending the response
+    start, never runs the generator's own cleanup, so the slot would leak.
+    `release` must be idempotent.
+    """
+
+    def __init__(self, lines: Iterable[str], release: Callable[[], None], **kwargs: Any) -> None:
+        super().__init__(_released(lines, release), **kwargs)
+        self._release = release
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+def _released(lines: Iterable[str], release: Callable[[], None]) -> Iterator[str]:
+    # Release as soon as the model is done, before the background tasks run.
+    try:
+        yield from lines
+    finally:
+        release()
@@ -1,12 +1,26 @@
 
-from fastapi import FastAPI, HTTPException
-from google.cloud import firestore
-from google.cloud import secretmanager
+from typing import Any
 
-app = FastAPI()
+from fastapi import Depends, FastAPI
+import google.cloud.logging
+
+from shared import clients, logs, metrics
+from shared.latency import LatencyMiddleware
+
+# Attaches a batching Cloud Logging handler so request latency records reach
+# Cloud Logging like in the other services.
+logs.setup_logging(google.cloud.logging.Client())
+
+app = FastAPI(lifespan=clients.lifespan("firestore", "secretmanager"))
+app.add_middleware(LatencyMiddleware, service="tenants-admin")
+app.include_router(metrics.router)
 
 @app.post("/tenants")
-def create_tenant(request: dict):
+def create_tenant(
+    request: dict,
+    db: Any = Depends(clients.get_firestore),
+    secrets_client: Any = Depends(clients.get_secret_manager),
+):
     tenant_key = request.get("tenant_key")
     meta_token = request.get("meta_token")
     phone_id = request.get("phone_id")
@@ -17,7 +31,6 @@ def create_tenant(request: dict):
     tenant_templates = request.get("tenant_templates")
 
     # Create secrets
-    secrets_client = secretmanager.SecretManagerServiceClient()
     project_id = "agentes-ia-dev"
 
     for secret_id, secret_value in [("META_TOKEN", meta_token), ("PHONE_ID", phone_id), ("VERIFY_TOKEN", verify_token), ("META_APP_SECRET", meta_app_secret)]:
@@ -34,7 +47,6 @@ def create_tenant(request: dict):
         )
 
     # Create Firestore document
-    db = firestore.Client()
     tenant_ref = db.collection("tenants").document(tenant_key)
     tenant_ref.set({
         "phone_id": phone_id,
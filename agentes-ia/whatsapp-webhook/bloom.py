@@ -0,0 +1,81 @@
+"""
+Compact Bloom filter for phone numbers.
+
+A filter answers "definitely not present" or "maybe present" using a fixed bit
+array, roughly 1.2 bytes per entry for a 1% false positive rate, instead of
+the ~100 bytes per entry of a Python set of strings.
+
+Positions come from Python's own `hash()` (double hashing on its two 32-bit
+halves). String hashes are cached on the object and randomized per process,
+which is fine because filters are always rebuilt in-process from the stored
+numbers and never persisted.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Iterable
+
+_MASK32 = (1 << 32) - 1
+
+
+class BloomFilter:
+    __slots__ = ("capacity", "size", "hashes", "_bits", "count")
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be between 0 and 1")
+        size = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.capacity = capacity
+        self.size = max(size, 8)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, item: str) -> None:
+        value = hash(item)
+        first = value & _MASK32
+        second = ((value >> 32) & _MASK32) | 1
+        bits = self._bits
+        for index in range(self.hashes):
+            position = (first + index * second) % self.size
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        # Same as calling add() in a loop, with the attribute lookups hoisted
+        # out since this runs over whole blacklists on load.
+        bits = self._bits
+        size = self.size
+        offsets = range(self.hashes)
+        added = 0
+        for item in items:
+            value = hash(item)
+            first = value & _MASK32
+            second = ((value >> 32) & _MASK32) | 1
+            for index in offsets:
+                position = (first + index * second) % size
+                bits[position >> 3] |= 1 << (position & 7)
+            added += 1
+        self.count += added
+
+    def __contains__(self, item: str) -> bool:
+        value = hash(item)
+        first = value & _MASK32
+        second = ((value >> 32) & _MASK32) | 1
+        bits = self._bits
+        for index in range(self.hashes):
+            position = (first + index * second) % self.size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def saturated(self) -> bool:
+        return self.count > self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
@@ -0,0 +1,187 @@
+"""
+Deduplication of webhook deliveries by message id.
+
+Meta redelivers a message (same `messages[].id`, the `wamid.*` value) when the
+webhook does not answer in time, so the same message can reach us several
+times. `Deduplicator` remembers every message id it has processed for
+`window` seconds:
+
+- In memory: an insertion-ordered map of id -> expiry. The window is the same
+  for every id, so insertion order is also expiry order and expired ids are
+  dropped from the front as new ones come in. At most `maxsize` ids are kept;
+  past that the oldest ids are forgotten first.
+- Optionally, a shared store (`FirestoreDedupStore`) so that a redelivery
+  landing on another Cloud Run instance is also recognized. The store is only
+  asked about ids this instance has not seen; if it fails, the message is
+  processed (a duplicate reply is better than a lost message).
+
+An id is recorded when its message starts being processed, so concurrent
+redeliveries are dropped too. If processing fails the caller `forget()`s the
+ids, so Meta's redelivery is processed instead of being dropped.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+
+class FirestoreDedupStore:
+    """
+    One document per message id under `collection`.
+
+    `claim()` uses `create()`, which fails if the document already exists, so
+    exactly one instance wins each id. Documents carry an `expires_at` field
+    meant for a Firestore TTL policy that deletes them once the window passed.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        collection: str = "webhook_deliveries",
+        window: float = 86400.0,
+    ) -> None:
+        self._client_factory = client_factory
+        self._collection = collection
+        self._window = window
+
+    def claim(self, message_id: str) -> bool:
+        """Record `message_id`; return False if it was already recorded."""
+        from google.api_core.exceptions import AlreadyExists
+
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=self._window
+        )
+        # Message ids are base64 and may contain "/", which Firestore reads
+        # as a path separator.
+        document = (
+            self._client_factory()
+            .collection(self._collection)
+            .document(message_id.replace("/", "_"))
+        )
+        try:
+            document.create({"expires_at": expires_at})
+        except AlreadyExists:
+            return False
+        return True
+
+    def release(self, message_id: str) -> None:
+        """Delete the record of `message_id` so it can be claimed again."""
+        (
+            self._client_factory()
+            .collection(self._collection)
+            .document(message_id.replace("/", "_"))
+            .delete()
+        )
+
+
+class Deduplicator:
+    def __init__(
+        self,
+        window: float = 86400.0,
+        maxsize: int = 100_000,
+        store: Optional[Any] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self._window = window
+        self._maxsize = maxsize
+        self._store = store
+        self._clock = clock
+        self._expiry: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+        self.store_duplicates = 0
+        self.store_errors = 0
+
+    def __contains__(self, message_id: str) -> bool:
+        """Whether `message_id` was seen by this instance; records nothing."""
+        expires_at = self._expiry.get(message_id)
+        return expires_at is not None and expires_at > self._clock()
+
+    def all_seen(self, message_ids: list[str]) -> bool:
+        """
+        Whether every id was already seen by this instance; records nothing.
+
+        Lets the webhook answer a verified redelivery without processing it.
+        """
+        if not message_ids or not all(message_id in self for message_id in message_ids):
+            return False
+        with self._lock:
+            self.checked += len(message_ids)
+            self.duplicates += len(message_ids)
+        return True
+
+    def seen(self, message_id: str) -> bool:
+        """Record `message_id`; return True if it is a duplicate."""
+        now = self._clock()
+        with self._lock:
+            self.checked += 1
+            self._expire(now)
+            expires_at = self._expiry.get(message_id)
+            if expires_at is not None and expires_at > now:
+                self.duplicates += 1
+                return True
+            self._expiry[message_id] = now + self._window
+            self._expiry.move_to_end(message_id)
+            while len(self._expiry) > self._maxsize:
+                self._expiry.popitem(last=False)
+
+        if self._store is None:
+            return False
+        try:
+            claimed = self._store.claim(message_id)
+        except Exception:
+            logger.exception("Deduplication store failed; processing message anyway.")
+            self.store_errors += 1
+            return False
+        if not claimed:
+            with self._lock:
+                self.duplicates += 1
+                self.store_duplicates += 1
+            return True
+        return False
+
+    def forget(self, message_ids: list[str]) -> None:
+        """Drop ids recorded by `seen()` whose processing failed."""
+        with self._lock:
+            for message_id in message_ids:
+                self._expiry.pop(message_id, None)
+        if self._store is None:
+            return
+        for message_id in message_ids:
+            try:
+                self._store.release(message_id)
+            except Exception:
+                logger.exception("Deduplication store failed to release %s.", message_id)
+                self.store_errors += 1
+
+    def _expire(self, now: float) -> None:
+        expiry = self._expiry
+        while expiry:
+            message_id, expires_at = next(iter(expiry.items()))
+            if expires_at > now:
+                break
+            del expiry[message_id]
+
+    def stats(self) -> dict[str, Any]:
+        """Counters published as gauges by the `/metrics` collectors."""
+        with self._lock:
+            return {
+                "dedup_size": len(self._expiry),
+                "dedup_checked": self.checked,
+                "dedup_duplicates": self.duplicates,
+                "dedup_store_duplicates": self.store_duplicates,
+                "dedup_store_errors": self.store_errors,
+                "dedup_duplicate_rate": (
+                    round(self.duplicates / self.checked, 4) if self.checked else 0.0
+                ),
+            }
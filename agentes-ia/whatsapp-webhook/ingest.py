@@ -0,0 +1,273 @@
+"""
+Acknowledge-fast ingestion for webhook deliveries.
+
+Meta retries deliveries that are not acknowledged quickly, so in ingest mode
+the HTTP handler only validates the signature, hands the raw body to an
+`IngestPipeline` and returns. A pool of asyncio workers drains the queue and
+runs the actual processing.
+
+Queues share a small async interface (`put`, `poll`, `get`, `ack`, `qsize`)
+so the in-process `MemoryQueue` can be swapped for a durable backend.
+`SpoolQueue` is the local durable stand-in: one file per event in a directory,
+deleted only after the event has been processed, so pending events survive a
+restart. Its file reads and writes go through `run` (e.g.
+`BlockingExecutor.run`) so disk I/O stays off the event loop. It can also be
+used as the overflow ("spill-to-disk") queue behind a `MemoryQueue`; without
+an overflow queue a full pipeline raises `QueueFull`, which the handler turns
+into a 429.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Event:
+    tenant: str
+    body: bytes
+    received_at: float = field(default_factory=time.time)
+    # Set by SpoolQueue so the event file can be removed once processed.
+    spool_path: Optional[Path] = None
+
+
+async def _inline(func: Callable[..., Any], *args: Any) -> Any:
+    return func(*args)
+
+
+class MemoryQueue:
+    def __init__(self, maxsize: int = 1000) -> None:
+        self._queue: asyncio.Queue[Event] = asyncio.Queue(maxsize)
+
+    async def put(self, event: Event) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            raise QueueFull() from None
+
+    async def poll(self) -> Optional[Event]:
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    async def get(self, timeout: float) -> Optional[Event]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, event: Event) -> None:
+        pass
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class SpoolQueue:
+    def __init__(
+        self,
+        directory: Path,
+        maxsize: Optional[int] = None,
+        poll_interval: float = 0.05,
+        run: Callable[..., Awaitable[Any]] = _inline,
+    ) -> None:
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._maxsize = maxsize
+        self._poll_interval = poll_interval
+        self._run = run
+        self._sequence = itertools.count()
+        # Events left over from a previous process are picked up first.
+        self._pending: deque[Path] = deque(sorted(self._directory.glob("*.json")))
+        # Events being written; they count against `maxsize`.
+        self._writing = 0
+
+    async def put(self, event: Event) -> None:
+        if self._maxsize is not None and self.qsize() >= self._maxsize:
+            raise QueueFull()
+        name = f"{time.time_ns():020d}-{next(self._sequence):08d}.json"
+        record = {
+            "tenant": event.tenant,
+            "received_at": event.received_at,
+            "body": base64.b64encode(event.body).decode("ascii"),
+        }
+        self._writing += 1
+        try:
+            path = await self._run(self._write, self._directory / name, json.dumps(record))
+        finally:
+            self._writing -= 1
+        self._pending.append(path)
+
+    @staticmethod
+    def _write(path: Path, data: str) -> Path:
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(data, encoding="utf-8")
+        os.replace(tmp_path, path)
+        return path
+
+    async def poll(self) -> Optional[Event]:
+        while self._pending:
+            path = self._pending.popleft()
+            event = await self._run(self._read, path)
+            if event is not None:
+                return event
+        return None
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Event]:
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            logger.error("Discarding unreadable spooled event %s: %s", path, exc)
+            path.unlink(missing_ok=True)
+            return None
+        return Event(
+            tenant=record["tenant"],
+            body=base64.b64decode(record["body"]),
+            received_at=record["received_at"],
+            spool_path=path,
+        )
+
+    @staticmethod
+    def _delete(path: Path) -> None:
+        path.unlink(missing_ok=True)
+
+    async def get(self, timeout: float) -> Optional[Event]:
+        deadline = time.monotonic() + timeout
+        while True:
+            event = await self.poll()
+            if event is not None or time.monotonic() >= deadline:
+                return event
+            await asyncio.sleep(self._poll_interval)
+
+    async def ack(self, event: Event) -> None:
+        if event.spool_path is not None:
+            await self._run(self._delete, event.spool_path)
+
+    def qsize(self) -> int:
+        return len(self._pending) + self._writing
+
+
+EventHandler = Callable[[Event], Awaitable[None]]
+
+
+class IngestPipeline:
+    def __init__(
+        self,
+        handler: EventHandler,
+        queue,
+        overflow=None,
+        workers: int = 4,
+        poll_interval: float = 0.1,
+    ) -> None:
+        self._handler = handler
+        self._queue = queue
+        self._overflow = overflow
+        self._workers = workers
+        self._poll_interval = poll_interval
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+        self.accepted = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    async def submit(self, event: Event) -> None:
+        """Enqueue an event; raise QueueFull when it cannot be accepted."""
+        try:
+            await self._queue.put(event)
+        except QueueFull:
+            if self._overflow is None:
+                self.rejected += 1
+                raise
+            try:
+                await self._overflow.put(event)
+            except QueueFull:
+                self.rejected += 1
+                raise
+            self.spilled += 1
+        self.accepted += 1
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"ingest-worker-{index}")
+            for index in range(self._workers)
+        ]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Let the workers drain pending events, then cancel them."""
+        self._stopping = True
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "ingest_queue_depth": self._queue.qsize(),
+            "ingest_spill_depth": self._overflow.qsize() if self._overflow else 0,
+            "ingest_lag_ms": round(self.last_lag_ms, 3),
+            "ingest_max_lag_ms": round(self.max_lag_ms, 3),
+            "ingest_accepted": self.accepted,
+            "ingest_spilled": self.spilled,
+            "ingest_rejected": self.rejected,
+            "ingest_processed": self.processed,
+            "ingest_failed": self.failed,
+        }
+
+    async def _next(self):
+        event = await self._queue.poll()
+        if event is not None:
+            return event, self._queue
+        if self._overflow is not None:
+            event = await self._overflow.poll()
+            if event is not None:
+                return event, self._overflow
+        event = await self._queue.get(self._poll_interval)
+        return event, self._queue
+
+    async def _worker(self) -> None:
+        while True:
+            event, source = await self._next()
+            if event is None:
+                if self._stopping:
+                    return
+                continue
+
+            lag_ms = (time.time() - event.received_at) * 1000
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            try:
+                await self._handler(event)
+            except Exception:
+                self.failed += 1
+                logger.exception("Failed to process webhook event for %s", event.tenant)
+            else:
+                self.processed += 1
+            # Failed events are logged and dropped so a poison message cannot
+            # block the queue.
+            await source.ack(event)
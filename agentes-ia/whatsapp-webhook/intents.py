@@ -0,0 +1,128 @@
+"""
+Keyword-based intent classification for inbound messages.
+
+All keywords of a tenant are compiled into a single regular expression with one
+group per intent, so one scan over the message returns every matched intent.
+Keywords match at the start of a word ("cliente" matches "Clientes" but not
+"subcliente"). Text and keywords go through the same normalization (NFKD,
+accents stripped, casefolded) so "PROVEEDÓR" matches "proveedor".
+
+Tenants can override the keyword list of any intent with an `intents` map in
+their tenant document, e.g. `{"provider": ["proveedor", "agencia"]}`.
+`IntentMatchers` keeps one compiled matcher per tenant and rebuilds it only
+when that map changes. A malformed map is logged and the tenant gets the
+default intents.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import unicodedata
+from typing import Any, Iterable, Mapping, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+DEFAULT_INTENTS: dict[str, tuple[str, ...]] = {
+    "provider": ("proveedor", "proveedora", "supplier"),
+    "client": ("cliente", "client"),
+}
+
+
+_COMBINING_MARKS = re.compile("[\u0300-\u036f]")
+
+
+def normalize(text: str) -> str:
+    if text.isascii():
+        return text.lower()
+    return _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text)).casefold()
+
+
+class IntentMatcher:
+    def __init__(self, intents: Mapping[str, Iterable[str]]) -> None:
+        self._names: dict[str, str] = {}
+        alternatives = []
+        first_chars = set()
+        for index, (intent, keywords) in enumerate(intents.items()):
+            # Longest first so "proveedora" wins over "proveedor".
+            normalized = sorted(
+                {normalize(keyword) for keyword in keywords if keyword}, key=len, reverse=True
+            )
+            if not normalized:
+                continue
+            first_chars.update(keyword[0] for keyword in normalized)
+            group = f"i{index}"
+            self._names[group] = intent
+            pattern = "|".join(re.escape(keyword) for keyword in normalized)
+            alternatives.append(f"(?P<{group}>{pattern})")
+        # The lookahead on first characters lets the scanner skip most word
+        # starts without trying every alternative.
+        self._pattern = (
+            re.compile(
+                r"\b(?=[" + re.escape("".join(sorted(first_chars))) + "])(?:"
+                + "|".join(alternatives)
+                + ")"
+            )
+            if alternatives
+            else None
+        )
+
+    def match(self, text: str) -> set[str]:
+        """Return every intent with at least one keyword in `text`."""
+        if self._pattern is None or not text:
+            return set()
+        names = self._names
+        return {names[found.lastgroup] for found in self._pattern.finditer(normalize(text))}
+
+
+def tenant_intents(overrides: Optional[Mapping[str, Any]]) -> dict[str, tuple[str, ...]]:
+    """
+    The default intents with `overrides` applied; raise ValueError unless
+    `overrides` maps intent names to a keyword or a list of keywords.
+    """
+    if overrides is not None and not isinstance(overrides, Mapping):
+        raise ValueError(f"intents must be a map, not {type(overrides).__name__}")
+    intents = dict(DEFAULT_INTENTS)
+    for intent, keywords in (overrides or {}).items():
+        if isinstance(keywords, str):
+            keywords = (keywords,)
+        if (
+            not isinstance(intent, str)
+            or not isinstance(keywords, (list, tuple))
+            or not all(isinstance(keyword, str) for keyword in keywords)
+        ):
+            raise ValueError(f"intent {intent!r} must map to a list of keywords")
+        intents[intent] = tuple(keywords)
+    return intents
+
+
+class IntentMatchers:
+    def __init__(self) -> None:
+        self._matchers: dict[str, tuple[Any, tuple, IntentMatcher]] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, tenant: str, overrides: Optional[Mapping[str, Any]]) -> IntentMatcher:
+        cached = self._matchers.get(tenant)
+        # The tenant cache hands out the same dict until the document is
+        # reloaded, so an identity check covers the steady state.
+        if cached is not None and cached[0] is overrides:
+            return cached[2]
+
+        try:
+            intents = tenant_intents(overrides)
+        except ValueError as exc:
+            # Logged once per tenant document: the matcher is cached below.
+            logger.error("Invalid intents for tenant %s, using the defaults: %s", tenant, exc)
+            intents = dict(DEFAULT_INTENTS)
+        key = tuple(sorted(intents.items()))
+        with self._lock:
+            cached = self._matchers.get(tenant)
+            if cached is not None and cached[1] == key:
+                matcher = cached[2]
+            else:
+                matcher = IntentMatcher(intents)
+                self.builds += 1
+            self._matchers[tenant] = (overrides, key, matcher)
+        return matcher
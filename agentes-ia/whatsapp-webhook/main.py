@@ -1,23 +1,37 @@
-
 from fastapi import FastAPI, Request, HTTPException, Response
 from pathlib import Path
-from typing import Any, List, Tuple
+from typing import Any, List
 import hashlib
 import hmac
-import json
-from google.cloud import firestore
-from google.cloud import secretmanager
+import os
 import google.cloud.logging
 import logging
 
-app = FastAPI()
+from dedup import Deduplicator, FirestoreDedupStore
+from ingest import Event, IngestPipeline, MemoryQueue, QueueFull, SpoolQueue
+from intents import IntentMatchers
+from payload import PayloadError, iter_messages, message_ids
+from providers import FileProviderStore, FirestoreProviderStore, ProviderRegistry
+from shared import clients, latency, logs, metrics
+from shared.actions import (
+    ActionPipeline,
+    DispatcherPublisher,
+    EmbeddedDispatcher,
+    OrchestratorDelegate,
+)
+from shared.graph import GraphClient
+from shared.offload import BlockingExecutor
+from shared.ratelimit import RateLimiter
+from shared.secrets import SecretProvider
+from shared.tenant_cache import TenantCache
 
 # Instantiates a client
 client = google.cloud.logging.Client()
 
-# Retrieves a Cloud Logging handler; you can log standard Python
-# logging messages to Cloud Logging
-client.setup_logging()
+# Attaches a batching Cloud Logging handler: standard Python logging
+# messages are queued and written to Cloud Logging off the request path.
+# Per-provider "Ignoring message" lines are sampled under load.
+log_handler = logs.setup_logging(client, low_value=("Ignoring message from provider",))
 
 # The name of the log to write to
 log_name = "agentes-ia-log"
@@ -33,82 +47,209 @@ CLIENT_ACK = (
     "Perfecto, gracias por confirmarlo. Compártenos tu consulta y un asesor te apoyará."
 )
 
-def load_providers() -> set[str]:
-    if not PROVIDERS_FILE.exists():
-        return set()
 
-    try:
-        with PROVIDERS_FILE.open("r", encoding="utf-8") as handle:
-            data = json.load(handle)
-    except json.JSONDecodeError as exc:
-        logger.error("Providers blacklist is not valid JSON: %s", exc)
-        return set()
+def load_tenant(tenant: str) -> dict[str, Any] | None:
+    tenant_doc = clients.registry.firestore().collection("tenants").document(tenant).get()
+    if not tenant_doc.exists:
+        return None
+    return tenant_doc.to_dict()
+
+
+tenant_cache = TenantCache(
+    load_tenant,
+    maxsize=int(os.environ.get("TENANT_CACHE_MAXSIZE", "256")),
+    ttl=float(os.environ.get("TENANT_CACHE_TTL_SECONDS", "300")),
+    negative_ttl=float(os.environ.get("TENANT_CACHE_NEGATIVE_TTL_SECONDS", "30")),
+)
+
+secret_provider = SecretProvider(
+    client_factory=clients.get_secret_manager,
+    ttl=float(os.environ.get("SECRETS_CACHE_TTL_SECONDS", "600")),
+)
+
+
+def build_provider_registry() -> ProviderRegistry:
+    if os.environ.get("PROVIDERS_STORE", "file") == "firestore":
+        store = FirestoreProviderStore(clients.get_firestore)
+    else:
+        store = FileProviderStore(
+            Path(os.environ.get("PROVIDERS_DIR", str(DATA_DIR / "providers"))),
+            legacy_file=PROVIDERS_FILE,
+            legacy_tenant=os.environ.get("PROVIDERS_LEGACY_TENANT", "viajes-bumeran"),
+        )
+    return ProviderRegistry(
+        store,
+        flush_interval=float(os.environ.get("PROVIDERS_FLUSH_SECONDS", "1")),
+        compact_interval=float(os.environ.get("PROVIDERS_COMPACT_SECONDS", "300")),
+        false_positive_rate=float(os.environ.get("PROVIDERS_FILTER_FP_RATE", "0.01")),
+        memory_budget=int(os.environ.get("PROVIDERS_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024))),
+    )
 
-    providers = data.get("providers", [])
-    if not isinstance(providers, list):
-        logger.warning("Providers blacklist has unexpected format. Resetting.")
-        return set()
 
-    return {str(provider) for provider in providers}
+provider_registry = build_provider_registry()
+intent_matchers = IntentMatchers()
 
 
-def save_providers(providers: set[str]) -> None:
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with PROVIDERS_FILE.open("w", encoding="utf-8") as handle:
-        json.dump({"providers": sorted(providers)}, handle, ensure_ascii=False, indent=2)
+def build_deduplicator() -> Deduplicator:
+    window = float(os.environ.get("DEDUP_WINDOW_SECONDS", "86400"))
+    store = None
+    if os.environ.get("DEDUP_STORE", "memory") == "firestore":
+        store = FirestoreDedupStore(
+            clients.get_firestore,
+            collection=os.environ.get("DEDUP_COLLECTION", "webhook_deliveries"),
+            window=window,
+        )
+    return Deduplicator(
+        window=window,
+        maxsize=int(os.environ.get("DEDUP_MAXSIZE", "100000")),
+        store=store,
+    )
 
 
-def extract_messages(payload: dict[str, Any]) -> List[Tuple[str, str]]:
-    results: List[Tuple[str, str]] = []
-    for entry in payload.get("entry", []):
-        for change in entry.get("changes", []):
-            value = change.get("value", {})
-            for message in value.get("messages", []):
-                sender = message.get("from", "")
-                text = extract_message_text(message)
-                results.append((sender, text))
-    return results
+deduplicator = build_deduplicator()
 
+# Firestore and Secret Manager clients are blocking; cache misses and event
+# processing run here instead of on the event loop.
+blocking = BlockingExecutor(
+    max_workers=int(os.environ.get("BLOCKING_IO_THREADS", "32")), name="blocking_io"
+)
 
-def extract_message_text(message: dict[str, Any]) -> str:
-    message_type = message.get("type", "")
-    if message_type == "text":
-        return message.get("text", {}).get("body", "")
 
-    if message_type == "interactive":
-        interactive = message.get("interactive", {})
-        if interactive.get("type") == "button_reply":
-            return interactive.get("button_reply", {}).get("title", "")
-        if interactive.get("type") == "list_reply":
-            return interactive.get("list_reply", {}).get("title", "")
+async def get_tenant(tenant: str) -> dict[str, Any] | None:
+    found, tenant_config = tenant_cache.cached(tenant)
+    if found:
+        return tenant_config
+    return await blocking.run(tenant_cache.get, tenant)
+
+
+async def get_secret(secret_id: str) -> str:
+    value = secret_provider.cached(secret_id)
+    if value is None:
+        value = await blocking.run(secret_provider.get, secret_id)
+    return value
+
+
+async def tenant_credentials(tenant: str) -> tuple[str, str]:
+    """The tenant's `(phone_id, META_TOKEN)`, for sending replies from here."""
+    tenant_config = await get_tenant(tenant)
+    if tenant_config is None:
+        raise LookupError(f"Tenant {tenant} not found")
+    token = await get_secret(tenant_config["secrets"]["meta_token"])
+    return tenant_config["phone_id"], token
+
+
+def build_action_pipeline() -> ActionPipeline | None:
+    """
+    ACTIONS_MODE selects what happens to the generated replies: `return`
+    (default) only returns them in the response, `embedded` sends them from
+    this service and `publish` sends them in batches to the dispatcher at
+    DISPATCHER_URL.
+
+    With LLM_ORCHESTRATOR_URL set, `delegate_to_llm` turns are answered by
+    the orchestrator with LLM_MODEL once their acknowledgement is delivered.
+    """
+    mode = os.environ.get("ACTIONS_MODE", "return")
+    if mode == "embedded":
+        # Same limits as the dispatcher, but counted by this instance only.
+        recipient_interval = float(os.environ.get("RATE_LIMIT_RECIPIENT_INTERVAL_SECONDS", "6"))
+        limiter = RateLimiter(
+            phone_rate=float(os.environ.get("RATE_LIMIT_PHONE_MPS", "80")),
+            phone_burst=int(os.environ.get("RATE_LIMIT_PHONE_BURST", "1")),
+            recipient_rate=1 / recipient_interval,
+            recipient_burst=int(os.environ.get("RATE_LIMIT_RECIPIENT_BURST", "10")),
+            max_wait=float(os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", "60")),
+        )
+        sink = EmbeddedDispatcher(GraphClient(), tenant_credentials, limiter=limiter)
+    elif mode == "publish":
+        sink = DispatcherPublisher(os.environ["DISPATCHER_URL"])
+    else:
+        return None
+    delegate = None
+    if os.environ.get("LLM_ORCHESTRATOR_URL"):
+        delegate = OrchestratorDelegate(
+            os.environ["LLM_ORCHESTRATOR_URL"], os.environ.get("LLM_MODEL", "gemini-1.5-pro")
+        )
+    return ActionPipeline(
+        sink,
+        batch_size=int(os.environ.get("ACTIONS_BATCH_SIZE", "50")),
+        linger=float(os.environ.get("ACTIONS_LINGER_MS", "2")) / 1000,
+        maxsize=int(os.environ.get("ACTIONS_QUEUE_MAXSIZE", "10000")),
+        coalesce_window=float(os.environ.get("ACTIONS_COALESCE_MS", "0")) / 1000,
+        coalesce_max_delay=float(os.environ.get("ACTIONS_COALESCE_MAX_MS", "5000")) / 1000,
+        delegate=delegate,
+    )
+
 
-    return ""
+action_pipeline = build_action_pipeline()
 
 
-def is_provider_intent(text: str) -> bool:
-    normalized = text.lower()
-    return any(keyword in normalized for keyword in ("proveedor", "proveedora", "supplier"))
+async def on_startup(app: FastAPI) -> None:
+    if os.environ.get("TENANT_CACHE_WATCH", "").lower() in ("1", "true", "yes"):
+        tenant_cache.watch(clients.registry.firestore().collection("tenants"))
+    provider_registry.start()
+    if action_pipeline is not None:
+        await action_pipeline.start()
+    if ingest_pipeline is not None:
+        await ingest_pipeline.start()
 
 
-def is_client_intent(text: str) -> bool:
-    normalized = text.lower()
-    return any(keyword in normalized for keyword in ("cliente", "client"))
+async def on_shutdown(app: FastAPI) -> None:
+    if ingest_pipeline is not None:
+        await ingest_pipeline.stop()
+    if action_pipeline is not None:
+        await action_pipeline.stop()
+    provider_registry.stop()
+    tenant_cache.close()
+    secret_provider.close()
+    blocking.close()
+
+
+app = FastAPI(
+    lifespan=clients.lifespan(
+        "firestore", "secretmanager", startup=on_startup, shutdown=on_shutdown
+    )
+)
+# Feeds the log-based metric webhook_latency_ms (jsonPayload.latency).
+app.add_middleware(
+    latency.LatencyMiddleware, service="whatsapp-webhook", metric="webhook_latency_ms"
+)
+app.include_router(metrics.router)
+
+incoming_messages = metrics.registry.counter(
+    "incoming_messages_total", "Inbound WhatsApp messages", ("tenant", "category")
+)
+duplicate_messages = metrics.registry.counter(
+    "duplicate_messages_total", "Redelivered WhatsApp messages dropped", ("tenant",)
+)
+providers_added = metrics.registry.counter(
+    "providers_total", "Numbers added to the provider blacklist", ("tenant",)
+)
+actions_total = metrics.registry.counter(
+    "actions_total", "Replies generated by the router", ("tenant", "next")
+)
+for collector in (
+    tenant_cache.stats,
+    secret_provider.stats,
+    provider_registry.stats,
+    deduplicator.stats,
+    blocking.stats,
+    log_handler.stats,
+):
+    metrics.registry.add_collector(collector)
+if action_pipeline is not None:
+    metrics.registry.add_collector(action_pipeline.stats)
 
 
 @app.get("/api/webhook/{tenant}")
 def verify_webhook(tenant: str, request: Request):
     # Your verify token. Should be a random string.
-    db = firestore.Client()
-    tenant_ref = db.collection("tenants").document(tenant)
-    tenant_doc = tenant_ref.get()
+    tenant_config = tenant_cache.get(tenant)
 
-    if not tenant_doc.exists:
+    if tenant_config is None:
         raise HTTPException(status_code=404, detail="Tenant not found")
+    latency.set_tenant(tenant)
 
-    secrets_client = secretmanager.SecretManagerServiceClient()
-    verify_token_name = f"projects/agentes-ia-dev/secrets/{tenant_doc.to_dict()['secrets']['verify_token']}/versions/latest"
-    response = secrets_client.access_secret_version(request={"name": verify_token_name})
-    verify_token = response.payload.data.decode("UTF-8")
+    verify_token = secret_provider.get(tenant_config["secrets"]["verify_token"])
 
     # Parse params from the webhook verification request
     mode = request.query_params.get("hub.mode")
@@ -129,97 +270,138 @@ def verify_webhook(tenant: str, request: Request):
         # Responds with '404 Not Found' if verify tokens do not match
         raise HTTPException(status_code=404, detail="Not Found")
 
-@app.post("/api/webhook/{tenant}")
-async def webhook(tenant: str, request: Request):
-    db = firestore.Client()
-    tenant_ref = db.collection("tenants").document(tenant)
-    tenant_doc = tenant_ref.get()
-
-    if not tenant_doc.exists:
-        raise HTTPException(status_code=404, detail="Tenant not found")
 
-    secrets_client = secretmanager.SecretManagerServiceClient()
-    meta_app_secret_name = f"projects/agentes-ia-dev/secrets/{tenant_doc.to_dict()['secrets']['meta_app_secret']}/versions/latest"
-    response = secrets_client.access_secret_version(request={"name": meta_app_secret_name})
-    meta_app_secret = response.payload.data.decode("UTF-8")
-
-    # Get the request body and signature
-    body = await request.body()
-    signature = request.headers.get("x-hub-signature-256")
-
-    if not signature:
-        raise HTTPException(status_code=400, detail="Missing signature")
-
-    # Validate the signature
-    if not validate_signature(body, signature, meta_app_secret):
-        raise HTTPException(status_code=401, detail="Invalid signature")
+def process_event(tenant: str, body: bytes) -> List[dict[str, Any]]:
+    """Route the messages of a verified delivery and return the actions to send."""
+    claimed: List[str] = []
+    try:
+        return route_event(tenant, body, claimed)
+    except Exception:
+        # Nothing of this delivery was answered: let Meta's redelivery be
+        # processed instead of dropped as a duplicate.
+        deduplicator.forget(claimed)
+        raise
 
-    body = json.loads(body)
 
-    providers = load_providers()
-    providers_updated = False
+def route_event(tenant: str, body: bytes, claimed: List[str]) -> List[dict[str, Any]]:
+    """`process_event()`; the ids recorded as seen are appended to `claimed`."""
     actions: List[dict[str, Any]] = []
-
-    for sender, message_text in extract_messages(body):
-        if not sender:
-            logger.warning("Skipping message without sender information.")
-            continue
-
-        if sender in providers:
-            logger.info(
-                "Ignoring message from provider",
-                extra={
-                    "json_fields": {
-                        "app": "agentes-ia",
-                        "env": "dev",
-                        "tenant": tenant,
-                        "metric": "incoming_messages_total",
-                        "category": "provider",
-                        "sender": sender,
+    skipped = 0
+    duplicates = 0
+    with latency.phase("tenant_lookup"):
+        tenant_config = tenant_cache.get(tenant) or {}
+    matcher = intent_matchers.get(tenant, tenant_config.get("intents"))
+
+    with latency.phase("parsing"):
+        messages = list(iter_messages(body))
+
+    with latency.phase("routing"):
+        for message in messages:
+            sender = message.sender
+            message_text = message.text
+            category = message.category
+            if not sender:
+                logger.warning("Skipping message without sender information.")
+                continue
+
+            # Redeliveries of a message already handled are dropped before any
+            # store lookup or reply.
+            with latency.phase("persistence"):
+                duplicate = bool(message.id) and deduplicator.seen(message.id)
+            if duplicate:
+                duplicates += 1
+                duplicate_messages.inc(tenant=tenant)
+                continue
+            if message.id:
+                claimed.append(message.id)
+
+            incoming_messages.inc(tenant=tenant, category=category)
+
+            # Reactions, system notices and unsupported messages never get a reply.
+            if category == "ignore":
+                skipped += 1
+                continue
+
+            if provider_registry.contains(tenant, sender):
+                logger.info(
+                    "Ignoring message from provider",
+                    extra={
+                        "json_fields": {
+                            "app": "agentes-ia",
+                            "env": "dev",
+                            "tenant": tenant,
+                            "metric": "incoming_messages_total",
+                            "category": "provider",
+                            "sender": sender,
+                        }
+                    },
+                )
+                continue
+
+            if category == "welcome":
+                actions.append(
+                    {
+                        "to": sender,
+                        "type": "text",
+                        "message": WELCOME_PROMPT,
+                        "next": "await_intent",
+                        # Every action carries the user's text, so a coalesced
+                        # burst keeps all of it.
+                        "text": message_text,
                     }
-                },
-            )
-            continue
-
-        if is_provider_intent(message_text):
-            providers.add(sender)
-            providers_updated = True
-            logger.info(
-                "Provider added to blacklist",
-                extra={
-                    "json_fields": {
-                        "app": "agentes-ia",
-                        "env": "dev",
-                        "tenant": tenant,
-                        "metric": "providers_total",
-                        "sender": sender,
+                )
+                continue
+
+            # Media without a caption carries no intent to classify; answering it
+            # with the welcome prompt only spends Graph API quota.
+            if category == "media" and not message_text:
+                skipped += 1
+                continue
+
+            intents = matcher.match(message_text)
+
+            if "provider" in intents:
+                with latency.phase("persistence"):
+                    provider_registry.add(tenant, sender)
+                providers_added.inc(tenant=tenant)
+                logger.info(
+                    "Provider added to blacklist",
+                    extra={
+                        "json_fields": {
+                            "app": "agentes-ia",
+                            "env": "dev",
+                            "tenant": tenant,
+                            "metric": "providers_total",
+                            "sender": sender,
+                        }
+                    },
+                )
+                continue
+
+            if "client" in intents:
+                actions.append(
+                    {
+                        "to": sender,
+                        "type": "text",
+                        "message": CLIENT_ACK,
+                        "next": "delegate_to_llm",
+                        "text": message_text,
                     }
-                },
-            )
-            continue
+                )
+                continue
 
-        if is_client_intent(message_text):
             actions.append(
                 {
                     "to": sender,
                     "type": "text",
-                    "message": CLIENT_ACK,
-                    "next": "delegate_to_llm",
+                    "message": WELCOME_PROMPT,
+                    "next": "await_intent",
+                    "text": message_text,
                 }
             )
-            continue
-
-        actions.append(
-            {
-                "to": sender,
-                "type": "text",
-                "message": WELCOME_PROMPT,
-                "next": "await_intent",
-            }
-        )
 
-    if providers_updated:
-        save_providers(providers)
+    for action in actions:
+        actions_total.inc(tenant=tenant, next=action["next"])
 
     logger.info(
         "Incoming message",
@@ -230,10 +412,103 @@ async def webhook(tenant: str, request: Request):
                 "tenant": tenant,
                 "metric": "incoming_messages_total",
                 "actions_generated": len(actions),
+                "messages_skipped": skipped,
+                "messages_duplicated": duplicates,
             }
         },
     )
 
+    return actions
+
+
+async def handle_event(event: Event) -> None:
+    # Loading a tenant blacklist for the first time hits the store; keep that
+    # off the event loop.
+    actions = await blocking.run(process_event, event.tenant, event.body)
+    if action_pipeline is not None:
+        action_pipeline.submit(event.tenant, actions)
+
+
+def build_ingest_pipeline() -> IngestPipeline | None:
+    if os.environ.get("WEBHOOK_INGEST_MODE", "sync") != "async":
+        return None
+
+    maxsize = int(os.environ.get("INGEST_QUEUE_MAXSIZE", "1000"))
+    spool_dir = Path(os.environ.get("INGEST_SPOOL_DIR", "/tmp/webhook-spool"))
+    if os.environ.get("INGEST_BACKEND", "memory") == "spool":
+        queue = SpoolQueue(spool_dir, maxsize=maxsize, run=blocking.run)
+        overflow = None
+    else:
+        queue = MemoryQueue(maxsize)
+        overflow = (
+            SpoolQueue(spool_dir, run=blocking.run)
+            if os.environ.get("INGEST_OVERFLOW") == "spill"
+            else None
+        )
+
+    return IngestPipeline(
+        handle_event,
+        queue,
+        overflow=overflow,
+        workers=int(os.environ.get("INGEST_WORKERS", "4")),
+    )
+
+
+ingest_pipeline = build_ingest_pipeline()
+if ingest_pipeline is not None:
+    metrics.registry.add_collector(ingest_pipeline.stats)
+
+
+@app.post("/api/webhook/{tenant}")
+async def webhook(tenant: str, request: Request):
+    body = await request.body()
+
+    with latency.phase("tenant_lookup"):
+        tenant_config = await get_tenant(tenant)
+
+    if tenant_config is None:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    latency.set_tenant(tenant)
+
+    with latency.phase("secret_fetch"):
+        meta_app_secret = await get_secret(tenant_config["secrets"]["meta_app_secret"])
+
+    # Get the signature
+    signature = request.headers.get("x-hub-signature-256")
+
+    if not signature:
+        raise HTTPException(status_code=400, detail="Missing signature")
+
+    # Validate the signature
+    with latency.phase("signature"):
+        valid = validate_signature(body, signature, meta_app_secret)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    # A redelivery whose messages were all processed already is answered
+    # right away, without queueing or routing it.
+    try:
+        with latency.phase("parsing"):
+            ids = message_ids(body)
+    except PayloadError:
+        ids = []
+    if deduplicator.all_seen(ids):
+        duplicate_messages.inc(len(ids), tenant=tenant)
+        return {"status": "duplicate"}
+
+    if ingest_pipeline is not None:
+        try:
+            await ingest_pipeline.submit(Event(tenant=tenant, body=body))
+        except QueueFull:
+            raise HTTPException(status_code=429, detail="Too many pending events")
+        return {"status": "accepted"}
+
+    try:
+        actions = await blocking.run(process_event, tenant, body)
+    except PayloadError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    if action_pipeline is not None:
+        action_pipeline.submit(tenant, actions)
     return {"status": "success", "actions": actions}
 
 @app.get("/healthz")
@@ -0,0 +1,379 @@
+"""
+Parsing of WhatsApp Cloud API webhook payloads.
+
+`iter_messages(body)` takes the raw request body and lazily yields one
+`InboundMessage` per entry of `entry[].changes[].value.messages[]`.
+
+When `msgspec` is installed the body is decoded straight into typed structs
+that only declare the fields we use: `statuses`, `contacts`, `metadata` and
+any other block are skipped by the decoder without building Python objects.
+Without `msgspec` the body is decoded with `json` into dicts and walked the
+same way.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Iterator, Optional
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - exercised when msgspec is missing
+    msgspec = None
+
+
+class PayloadError(ValueError):
+    pass
+
+
+# How the router treats each message type. Unknown types are ignored.
+CATEGORIES = {
+    "text": "conversation",
+    "interactive": "conversation",
+    "button": "conversation",
+    "image": "media",
+    "audio": "media",
+    "video": "media",
+    "document": "media",
+    "sticker": "media",
+    "location": "media",
+    "contacts": "media",
+    "order": "media",
+    "request_welcome": "welcome",
+    "reaction": "ignore",
+    "system": "ignore",
+    "unsupported": "ignore",
+}
+
+
+class InboundMessage:
+    """
+    One inbound message, whatever its type.
+
+    - `text`: what the user wrote or picked: text body, reply/button title,
+      media caption, location name, reaction emoji, system notice.
+    - `reply_id`: id of the interactive reply or payload of a template button.
+    - `media_id`: Graph API id of an image/audio/video/document/sticker.
+    - `location`: `(latitude, longitude)` of a location message.
+    - `target_id`: message a reaction refers to.
+    """
+
+    __slots__ = ("sender", "id", "type", "text", "reply_id", "media_id", "location", "target_id")
+
+    def __init__(
+        self,
+        sender: str,
+        id: str,
+        type: str,
+        text: str = "",
+        reply_id: str = "",
+        media_id: str = "",
+        location: Optional[tuple[float, float]] = None,
+        target_id: str = "",
+    ) -> None:
+        self.sender = sender
+        self.id = id
+        self.type = type
+        self.text = text
+        self.reply_id = reply_id
+        self.media_id = media_id
+        self.location = location
+        self.target_id = target_id
+
+    @property
+    def category(self) -> str:
+        return CATEGORIES.get(self.type, "ignore")
+
+    def __repr__(self) -> str:
+        return (
+            f"InboundMessage(sender={self.sender!r}, id={self.id!r}, "
+            f"type={self.type!r}, text={self.text!r})"
+        )
+
+
+# Dict fallback: one extractor per message type.
+
+
+def _dict_base(message: dict[str, Any], **fields: Any) -> InboundMessage:
+    return InboundMessage(
+        message.get("from", ""), message.get("id", ""), message.get("type", ""), **fields
+    )
+
+
+def _dict_text(message: dict[str, Any]) -> InboundMessage:
+    return _dict_base(message, text=message.get("text", {}).get("body", ""))
+
+
+def _dict_interactive(message: dict[str, Any]) -> InboundMessage:
+    interactive = message.get("interactive", {})
+    reply = interactive.get(interactive.get("type", ""), {})
+    if not isinstance(reply, dict):
+        reply = {}
+    if interactive.get("type") == "nfm_reply":
+        return _dict_base(message, text=reply.get("body", ""), reply_id=reply.get("name", ""))
+    return _dict_base(message, text=reply.get("title", ""), reply_id=reply.get("id", ""))
+
+
+def _dict_button(message: dict[str, Any]) -> InboundMessage:
+    button = message.get("button", {})
+    return _dict_base(message, text=button.get("text", ""), reply_id=button.get("payload", ""))
+
+
+def _dict_media(message: dict[str, Any]) -> InboundMessage:
+    media = message.get(message.get("type", ""), {})
+    return _dict_base(message, text=media.get("caption", ""), media_id=media.get("id", ""))
+
+
+def _dict_location(message: dict[str, Any]) -> InboundMessage:
+    location = message.get("location", {})
+    return _dict_base(
+        message,
+        text=location.get("name", ""),
+        location=(location.get("latitude", 0.0), location.get("longitude", 0.0)),
+    )
+
+
+def _dict_reaction(message: dict[str, Any]) -> InboundMessage:
+    reaction = message.get("reaction", {})
+    return _dict_base(
+        message, text=reaction.get("emoji", ""), target_id=reaction.get("message_id", "")
+    )
+
+
+def _dict_order(message: dict[str, Any]) -> InboundMessage:
+    return _dict_base(message, text=message.get("order", {}).get("text", ""))
+
+
+def _dict_system(message: dict[str, Any]) -> InboundMessage:
+    return _dict_base(message, text=message.get("system", {}).get("body", ""))
+
+
+_DICT_EXTRACTORS = {
+    "text": _dict_text,
+    "interactive": _dict_interactive,
+    "button": _dict_button,
+    "image": _dict_media,
+    "audio": _dict_media,
+    "video": _dict_media,
+    "document": _dict_media,
+    "sticker": _dict_media,
+    "location": _dict_location,
+    "reaction": _dict_reaction,
+    "order": _dict_order,
+    "system": _dict_system,
+}
+
+
+def _iter_dict_messages(body: bytes) -> Iterator[InboundMessage]:
+    try:
+        payload = json.loads(body)
+    except ValueError as exc:
+        raise PayloadError(str(exc)) from exc
+    if not isinstance(payload, dict):
+        raise PayloadError("Payload must be a JSON object")
+
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            for message in value.get("messages", []):
+                extractor = _DICT_EXTRACTORS.get(message.get("type", ""), _dict_base)
+                yield extractor(message)
+
+
+if msgspec is not None:
+
+    class _Text(msgspec.Struct):
+        body: str = ""
+
+    class _Reply(msgspec.Struct):
+        id: str = ""
+        title: str = ""
+
+    class _FlowReply(msgspec.Struct):
+        name: str = ""
+        body: str = ""
+
+    class _Interactive(msgspec.Struct):
+        type: str = ""
+        button_reply: Optional[_Reply] = None
+        list_reply: Optional[_Reply] = None
+        nfm_reply: Optional[_FlowReply] = None
+
+    class _Button(msgspec.Struct):
+        text: str = ""
+        payload: str = ""
+
+    class _Media(msgspec.Struct):
+        id: str = ""
+        caption: str = ""
+
+    class _Location(msgspec.Struct):
+        latitude: float = 0.0
+        longitude: float = 0.0
+        name: str = ""
+
+    class _Reaction(msgspec.Struct):
+        message_id: str = ""
+        emoji: str = ""
+
+    class _Order(msgspec.Struct):
+        text: str = ""
+
+    class _System(msgspec.Struct):
+        body: str = ""
+
+    class _Message(msgspec.Struct):
+        sender: str = msgspec.field(default="", name="from")
+        id: str = ""
+        type: str = ""
+        text: Optional[_Text] = None
+        interactive: Optional[_Interactive] = None
+        button: Optional[_Button] = None
+        image: Optional[_Media] = None
+        audio: Optional[_Media] = None
+        video: Optional[_Media] = None
+        document: Optional[_Media] = None
+        sticker: Optional[_Media] = None
+        location: Optional[_Location] = None
+        reaction: Optional[_Reaction] = None
+        order: Optional[_Order] = None
+        system: Optional[_System] = None
+
+    class _Value(msgspec.Struct):
+        messages: list[_Message] = []
+
+    class _Change(msgspec.Struct):
+        value: _Value = msgspec.field(default_factory=_Value)
+
+    class _Entry(msgspec.Struct):
+        changes: list[_Change] = []
+
+    class _Payload(msgspec.Struct):
+        entry: list[_Entry] = []
+
+    _decoder = msgspec.json.Decoder(_Payload)
+
+    # Ids only, for deduplication before the full parse.
+    class _IdMessage(msgspec.Struct):
+        id: str = ""
+
+    class _IdValue(msgspec.Struct):
+        messages: list[_IdMessage] = []
+
+    class _IdChange(msgspec.Struct):
+        value: _IdValue = msgspec.field(default_factory=_IdValue)
+
+    class _IdEntry(msgspec.Struct):
+        changes: list[_IdChange] = []
+
+    class _IdPayload(msgspec.Struct):
+        entry: list[_IdEntry] = []
+
+    _id_decoder = msgspec.json.Decoder(_IdPayload)
+
+    def _struct_base(message: _Message, **fields: Any) -> InboundMessage:
+        return InboundMessage(message.sender, message.id, message.type, **fields)
+
+    def _struct_text(message: _Message) -> InboundMessage:
+        return _struct_base(message, text=message.text.body if message.text else "")
+
+    def _struct_interactive(message: _Message) -> InboundMessage:
+        interactive = message.interactive
+        if interactive is None:
+            return _struct_base(message)
+        if interactive.type == "nfm_reply" and interactive.nfm_reply:
+            reply = interactive.nfm_reply
+            return _struct_base(message, text=reply.body, reply_id=reply.name)
+        reply = getattr(interactive, interactive.type, None)
+        if not isinstance(reply, _Reply):
+            return _struct_base(message)
+        return _struct_base(message, text=reply.title, reply_id=reply.id)
+
+    def _struct_button(message: _Message) -> InboundMessage:
+        button = message.button
+        if button is None:
+            return _struct_base(message)
+        return _struct_base(message, text=button.text, reply_id=button.payload)
+
+    def _struct_media(message: _Message) -> InboundMessage:
+        media = getattr(message, message.type)
+        if media is None:
+            return _struct_base(message)
+        return _struct_base(message, text=media.caption, media_id=media.id)
+
+    def _struct_location(message: _Message) -> InboundMessage:
+        location = message.location
+        if location is None:
+            return _struct_base(message)
+        return _struct_base(
+            message, text=location.name, location=(location.latitude, location.longitude)
+        )
+
+    def _struct_reaction(message: _Message) -> InboundMessage:
+        reaction = message.reaction
+        if reaction is None:
+            return _struct_base(message)
+        return _struct_base(message, text=reaction.emoji, target_id=reaction.message_id)
+
+    def _struct_order(message: _Message) -> InboundMessage:
+        return _struct_base(message, text=message.order.text if message.order else "")
+
+    def _struct_system(message: _Message) -> InboundMessage:
+        return _struct_base(message, text=message.system.body if message.system else "")
+
+    _STRUCT_EXTRACTORS = {
+        "text": _struct_text,
+        "interactive": _struct_interactive,
+        "button": _struct_button,
+        "image": _struct_media,
+        "audio": _struct_media,
+        "video": _struct_media,
+        "document": _struct_media,
+        "sticker": _struct_media,
+        "location": _struct_location,
+        "reaction": _struct_reaction,
+        "order": _struct_order,
+        "system": _struct_system,
+    }
+
+    def _iter_struct_messages(body: bytes) -> Iterator[InboundMessage]:
+        try:
+            payload = _decoder.decode(body)
+        except msgspec.DecodeError as exc:
+            raise PayloadError(str(exc)) from exc
+
+        for entry in payload.entry:
+            for change in entry.changes:
+                for message in change.value.messages:
+                    extractor = _STRUCT_EXTRACTORS.get(message.type, _struct_base)
+                    yield extractor(message)
+
+    def _struct_message_ids(body: bytes) -> list[str]:
+        try:
+            payload = _id_decoder.decode(body)
+        except msgspec.DecodeError as exc:
+            raise PayloadError(str(exc)) from exc
+        return [
+            message.id
+            for entry in payload.entry
+            for change in entry.changes
+            for message in change.value.messages
+        ]
+
+    PARSER = "msgspec"
+else:
+    PARSER = "json"
+
+
+def iter_messages(body: bytes, fast: bool = True) -> Iterator[InboundMessage]:
+    """Yield the messages of a webhook body; raise PayloadError if malformed."""
+    if fast and msgspec is not None:
+        return _iter_struct_messages(body)
+    return _iter_dict_messages(body)
+
+
+def message_ids(body: bytes) -> list[str]:
+    """Ids of the messages of a webhook body; raise PayloadError if malformed."""
+    if msgspec is not None:
+        return _struct_message_ids(body)
+    return [message.id for message in _iter_dict_messages(body)]
@@ -0,0 +1,427 @@
+"""
+Provider blacklist registry.
+
+Numbers that declared themselves providers are kept per tenant, loaded once
+from a store. Each tenant has a Bloom filter that always stays in memory, so
+the common "sender is not a provider" answer needs neither a set lookup nor a
+storage hit. Filter hits are confirmed against the exact set of numbers; exact
+sets are kept within `memory_budget` bytes overall, and when a tenant's set is
+evicted its filter hits are confirmed with a point read against the store
+instead.
+
+Additions are write-behind: `add()` only updates memory and buffers the number;
+a background thread flushes the buffer to the store every `flush_interval`
+seconds and compacts the store every `compact_interval` seconds.
+
+Stores:
+
+- `FileProviderStore`: per-tenant JSON snapshot (`{tenant}.json`) plus an
+  append-only log (`{tenant}.wal`, one number per line). Flushing appends to
+  the log; compaction rewrites the snapshot atomically and truncates the log.
+  A point read scans the tenant's files without keeping them in memory.
+- `FirestoreProviderStore`: one document per number under
+  `tenants/{tenant}/providers`. A snapshot listener feeds additions made by
+  other instances back into memory so every instance converges.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import itertools
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+from bloom import BloomFilter
+
+logger = logging.getLogger("agentes-ia-log")
+
+
+class FileProviderStore:
+    compacts = True
+
+    def __init__(
+        self,
+        directory: Path,
+        legacy_file: Optional[Path] = None,
+        legacy_tenant: Optional[str] = None,
+    ) -> None:
+        self._directory = Path(directory)
+        self._legacy_file = legacy_file
+        self._legacy_tenant = legacy_tenant
+
+    def _snapshot_path(self, tenant: str) -> Path:
+        return self._directory / f"{tenant}.json"
+
+    def _wal_path(self, tenant: str) -> Path:
+        return self._directory / f"{tenant}.wal"
+
+    def load(self, tenant: str) -> set[str]:
+        providers = set()
+        if self._legacy_file is not None and tenant == self._legacy_tenant:
+            # The legacy global blacklist belongs to the original tenant only.
+            providers |= _read_snapshot(self._legacy_file)
+        providers |= _read_snapshot(self._snapshot_path(tenant))
+        wal_path = self._wal_path(tenant)
+        if wal_path.exists():
+            with wal_path.open("r", encoding="utf-8") as handle:
+                providers.update(line.strip() for line in handle if line.strip())
+        return providers
+
+    def contains(self, tenant: str, number: str) -> bool:
+        # The log is read before the snapshot: compaction replaces the
+        # snapshot before removing the log, so a number is always seen in one.
+        try:
+            with self._wal_path(tenant).open("r", encoding="utf-8") as handle:
+                if any(line.strip() == number for line in handle):
+                    return True
+        except FileNotFoundError:
+            pass
+        if number in _read_snapshot(self._snapshot_path(tenant)):
+            return True
+        if self._legacy_file is not None and tenant == self._legacy_tenant:
+            return number in _read_snapshot(self._legacy_file)
+        return False
+
+    def append(self, tenant: str, numbers: Iterable[str]) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        with self._wal_path(tenant).open("a", encoding="utf-8") as handle:
+            handle.writelines(f"{number}\n" for number in numbers)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def compact(self, tenant: str, providers: set[str]) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        path = self._snapshot_path(tenant)
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump({"providers": sorted(providers)}, handle, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._wal_path(tenant).unlink(missing_ok=True)
+
+    def subscribe(self, tenant: str, on_add: Callable[[Iterable[str]], None]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FirestoreProviderStore:
+    compacts = False
+
+    def __init__(self, client_factory: Callable[[], Any]) -> None:
+        self._client_factory = client_factory
+        self._watches: list[Any] = []
+
+    def _collection(self, tenant: str):
+        return (
+            self._client_factory()
+            .collection("tenants")
+            .document(tenant)
+            .collection("providers")
+        )
+
+    def load(self, tenant: str) -> set[str]:
+        return {document.id for document in self._collection(tenant).select([]).stream()}
+
+    def contains(self, tenant: str, number: str) -> bool:
+        return self._collection(tenant).document(number).get().exists
+
+    def append(self, tenant: str, numbers: Iterable[str]) -> None:
+        collection = self._collection(tenant)
+        batch = self._client_factory().batch()
+        pending = 0
+        for number in numbers:
+            batch.set(collection.document(number), {"number": number})
+            pending += 1
+            # Firestore batches are limited to 500 writes.
+            if pending == 500:
+                batch.commit()
+                batch = self._client_factory().batch()
+                pending = 0
+        if pending:
+            batch.commit()
+
+    def compact(self, tenant: str, providers: set[str]) -> None:
+        # Every number is already its own document; never called.
+        pass
+
+    def subscribe(self, tenant: str, on_add: Callable[[Iterable[str]], None]) -> None:
+        def on_snapshot(_docs, changes, _read_time) -> None:
+            on_add(
+                change.document.id
+                for change in changes
+                if change.type.name != "REMOVED"
+            )
+
+        self._watches.append(self._collection(tenant).on_snapshot(on_snapshot))
+
+    def close(self) -> None:
+        for watch in self._watches:
+            watch.unsubscribe()
+        self._watches = []
+
+
+def _read_snapshot(path: Path) -> set[str]:
+    if not path.exists():
+        return set()
+
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except json.JSONDecodeError as exc:
+        logger.error("Providers blacklist %s is not valid JSON: %s", path, exc)
+        return set()
+
+    providers = data.get("providers", [])
+    if not isinstance(providers, list):
+        logger.warning("Providers blacklist %s has unexpected format. Ignoring.", path)
+        return set()
+
+    return {str(provider) for provider in providers}
+
+
+def _estimate_set_bytes(numbers: set[str]) -> int:
+    size = sys.getsizeof(numbers)
+    if numbers:
+        # Numbers have similar lengths, so one sample is a good estimate.
+        size += len(numbers) * sys.getsizeof(next(iter(numbers)))
+    return size
+
+
+class _TenantProviders:
+    __slots__ = ("filter", "numbers", "last_used")
+
+    def __init__(self, bloom: BloomFilter, numbers: Optional[set[str]]) -> None:
+        self.filter = bloom
+        self.numbers = numbers
+        self.last_used = 0
+
+    @property
+    def set_bytes(self) -> int:
+        return 0 if self.numbers is None else _estimate_set_bytes(self.numbers)
+
+
+class ProviderRegistry:
+    def __init__(
+        self,
+        store,
+        flush_interval: float = 1.0,
+        compact_interval: float = 300.0,
+        false_positive_rate: float = 0.01,
+        memory_budget: int = 64 * 1024 * 1024,
+    ) -> None:
+        self._store = store
+        self._flush_interval = flush_interval
+        self._compact_interval = compact_interval
+        self._false_positive_rate = false_positive_rate
+        self._memory_budget = memory_budget
+        self._tenants: dict[str, _TenantProviders] = {}
+        self._pending: dict[str, list[str]] = {}
+        self._dirty: set[str] = set()
+        self._ticks = itertools.count(1)
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.filter_negatives = 0
+        self.store_confirmations = 0
+        self.evictions = 0
+
+    def _tenant(self, tenant: str) -> _TenantProviders:
+        entry = self._tenants.get(tenant)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._tenants.get(tenant)
+            if entry is None:
+                numbers = self._store.load(tenant)
+                entry = _TenantProviders(self._build_filter(numbers), numbers)
+                entry.last_used = next(self._ticks)
+                self._tenants[tenant] = entry
+                self._store.subscribe(tenant, lambda numbers: self._merge(tenant, numbers))
+                self._enforce_budget()
+                logger.info(
+                    "Providers blacklist loaded",
+                    extra={
+                        "json_fields": {
+                            "app": "agentes-ia",
+                            "env": "dev",
+                            "tenant": tenant,
+                            "providers_loaded": len(numbers),
+                            **self.memory(tenant),
+                        }
+                    },
+                )
+        return entry
+
+    def _build_filter(self, numbers: set[str]) -> BloomFilter:
+        bloom = BloomFilter(max(2 * len(numbers), 1024), self._false_positive_rate)
+        bloom.update(numbers)
+        return bloom
+
+    def contains(self, tenant: str, number: str) -> bool:
+        entry = self._tenant(tenant)
+        if number not in entry.filter:
+            self.filter_negatives += 1
+            return False
+
+        entry.last_used = next(self._ticks)
+        numbers = entry.numbers
+        if numbers is not None:
+            return number in numbers
+
+        # The exact set was evicted to respect the memory budget: confirm the
+        # filter hit against the buffered additions and then the store.
+        with self._lock:
+            if number in self._pending.get(tenant, ()):
+                return True
+        self.store_confirmations += 1
+        return self._store.contains(tenant, number)
+
+    def add(self, tenant: str, number: str) -> bool:
+        """Add `number` to the tenant blacklist; return False if already present."""
+        if self.contains(tenant, number):
+            return False
+        with self._lock:
+            entry = self._tenants[tenant]
+            entry.filter.add(number)
+            if entry.numbers is not None:
+                entry.numbers.add(number)
+            self._pending.setdefault(tenant, []).append(number)
+            if entry.filter.saturated:
+                self._rebuild_filter(tenant, entry)
+            self._enforce_budget()
+        if self._thread is None:
+            # Without a background writer, persist synchronously.
+            self.flush()
+        return True
+
+    def size(self, tenant: str) -> int:
+        """Number of providers; approximate when the exact set was evicted."""
+        entry = self._tenant(tenant)
+        if entry.numbers is not None:
+            return len(entry.numbers)
+        return entry.filter.count
+
+    def memory(self, tenant: str) -> dict[str, int]:
+        entry = self._tenants.get(tenant)
+        if entry is None:
+            return {"providers_filter_bytes": 0, "providers_set_bytes": 0}
+        return {
+            "providers_filter_bytes": entry.filter.nbytes,
+            "providers_set_bytes": entry.set_bytes,
+        }
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries = list(self._tenants.values())
+        return {
+            "providers_tenants": len(entries),
+            "providers_filter_bytes": sum(entry.filter.nbytes for entry in entries),
+            "providers_set_bytes": sum(entry.set_bytes for entry in entries),
+            "providers_filter_negatives": self.filter_negatives,
+            "providers_store_confirmations": self.store_confirmations,
+            "providers_set_evictions": self.evictions,
+        }
+
+    def flush(self) -> None:
+        """Append buffered additions to the store."""
+        with self._flush_lock:
+            with self._lock:
+                pending = {
+                    tenant: list(numbers)
+                    for tenant, numbers in self._pending.items()
+                    if numbers
+                }
+            for tenant, numbers in pending.items():
+                try:
+                    self._store.append(tenant, numbers)
+                except Exception:
+                    logger.exception("Failed to persist providers for %s", tenant)
+                    continue
+                # Numbers stay pending until stored so lookups on an evicted
+                # tenant still see them; only flush() removes them.
+                with self._lock:
+                    del self._pending[tenant][: len(numbers)]
+                self._dirty.add(tenant)
+
+    def compact(self) -> None:
+        """Flush, then rewrite the snapshot of every tenant that changed."""
+        self.flush()
+        with self._flush_lock:
+            dirty, self._dirty = self._dirty, set()
+            if not self._store.compacts:
+                return
+            for tenant in dirty:
+                with self._lock:
+                    numbers = self._tenants[tenant].numbers
+                    snapshot = None if numbers is None else set(numbers)
+                if snapshot is None:
+                    snapshot = self._store.load(tenant)
+                self._store.compact(tenant, snapshot)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="providers-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.compact()
+        self._store.close()
+
+    def _run(self) -> None:
+        elapsed = 0.0
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+            elapsed += self._flush_interval
+            if elapsed >= self._compact_interval:
+                elapsed = 0.0
+                self.compact()
+
+    def _rebuild_filter(self, tenant: str, entry: _TenantProviders) -> None:
+        # Called with the lock held, once the filter holds more numbers than it
+        # was sized for and its false positive rate starts to climb.
+        numbers = entry.numbers
+        if numbers is None:
+            numbers = self._store.load(tenant)
+            numbers.update(self._pending.get(tenant, ()))
+        entry.filter = self._build_filter(numbers)
+
+    def _enforce_budget(self) -> None:
+        # Called with the lock held. Filters always stay resident; exact sets
+        # of the least recently used tenants are dropped first, and their
+        # filter hits are then confirmed with a point read.
+        resident = [entry for entry in self._tenants.values() if entry.numbers is not None]
+        total = sum(entry.set_bytes for entry in resident)
+        for entry in sorted(resident, key=lambda entry: entry.last_used):
+            if total <= self._memory_budget:
+                break
+            total -= entry.set_bytes
+            entry.numbers = None
+            self.evictions += 1
+
+    def _merge(self, tenant: str, numbers: Iterable[str]) -> None:
+        with self._lock:
+            entry = self._tenants[tenant]
+            for number in numbers:
+                if entry.numbers is not None:
+                    if number in entry.numbers:
+                        continue
+                    entry.numbers.add(number)
+                elif number in entry.filter:
+                    continue
+                entry.filter.add(number)
+            if entry.filter.saturated:
+                self._rebuild_filter(tenant, entry)
@@ -0,0 +1,119 @@
+"""
+Benchmark: latency from a routed webhook reply to its delivery.
+
+Replies are submitted to an `ActionPipeline` at `--rate` actions/s, in
+bursts of two (a webhook event usually yields one or two), and the time from
+`submit()` to the Graph API answer is measured per action. Sends go to the
+local mock Graph API (`mock_graph_api.py`, in a child process). Two sinks are
+compared:
+
+- `embedded`: `EmbeddedDispatcher`, the Graph API call is made here.
+- `publish`: `DispatcherPublisher` posting batches to the dispatcher's
+  `/send/actions`. The dispatcher app runs in-process behind the ASGI
+  interface (see `bench_batch.py`), so the figure includes its request
+  handling but not a network round trip to another container.
+
+    python benchmarks/bench_actions.py --actions 2000 --rate 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import httpx  # noqa: E402
+
+from bench_batch import load_main  # noqa: E402
+from mock_graph_api import start_in_process  # noqa: E402
+from shared import actions  # noqa: E402
+from shared.actions import ActionPipeline, DispatcherPublisher, EmbeddedDispatcher  # noqa: E402
+from shared.graph import GraphClient  # noqa: E402
+
+
+class Recorder:
+    """Collects `action_delivery_ms` observations instead of bucketing them."""
+
+    def __init__(self):
+        self.values: list[float] = []
+
+    def observe(self, value: float, **labels) -> None:
+        self.values.append(value)
+
+
+async def credentials(tenant: str) -> tuple[str, str]:
+    return "123456", "bench-token"
+
+
+async def run(sink, count: int, rate: float, batch_size: int, linger: float) -> Recorder:
+    recorder = Recorder()
+    actions.action_delivery = recorder
+    pipeline = ActionPipeline(sink, batch_size=batch_size, linger=linger)
+    await pipeline.start()
+    interval = 2 / rate
+    start = time.perf_counter()
+    for index in range(0, count, 2):
+        pipeline.submit(
+            "bench",
+            [
+                {"to": f"57300{index + offset:06d}", "type": "text", "message": "Hola"}
+                for offset in range(min(2, count - index))
+            ],
+        )
+        delay = start + (index // 2 + 1) * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    await pipeline.stop(timeout=60)
+    return recorder
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--actions", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200.0)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--linger-ms", type=float, default=2.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=18445)
+    args = parser.parse_args()
+
+    stats, stop = start_in_process(args.latency_ms / 1000, args.port)
+    base_url = f"https://127.0.0.1:{args.port}"
+    dispatcher = load_main(base_url, 1_000_000)
+
+    sinks = {
+        "embedded": lambda: EmbeddedDispatcher(
+            GraphClient(base_url=base_url, verify=False), credentials
+        ),
+        "publish": lambda: DispatcherPublisher(
+            "http://dispatcher", transport=httpx.ASGITransport(app=dispatcher.app)
+        ),
+    }
+    try:
+        for label, sink in sinks.items():
+
+            async def scenario():
+                recorder = await run(
+                    sink(), args.actions, args.rate, args.batch_size, args.linger_ms / 1000
+                )
+                await dispatcher.graph.close()
+                return recorder
+
+            values = sorted(asyncio.run(scenario()).values)
+            p50 = statistics.median(values)
+            p99 = values[int(len(values) * 0.99) - 1]
+            print(
+                f"{label:9} {len(values):6d} actions  p50 {p50:7.2f} ms  "
+                f"p99 {p99:7.2f} ms  max {values[-1]:7.2f} ms"
+            )
+    finally:
+        stop()
+
+
+if __name__ == "__main__":
+    main()
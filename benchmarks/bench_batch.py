@@ -0,0 +1,160 @@
+"""
+Benchmark: sending one template to many recipients through the dispatcher.
+
+The dispatcher app runs in-process (driven through the ASGI interface) with
+an in-memory tenant and secret, and sends to the local mock Graph API
+(`mock_graph_api.py`, in a child process). Two ways of reaching `--recipients`
+contacts are compared:
+
+- `single`: one `POST /send` per recipient, `--concurrency` in flight, which
+  is what a campaign had to do before `/send/batch`.
+- `batch`: one streamed `POST /send/batch` with every recipient.
+
+The phone number limit defaults to `--mps 1000000` so the benchmark measures
+the dispatcher; with the real 80 messages/s limit both take
+recipients / 80 seconds.
+
+    python benchmarks/bench_batch.py --recipients 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(ROOT / "agentes-ia" / "dispatcher"))
+
+import google.cloud.logging  # noqa: E402
+import httpx  # noqa: E402
+
+from mock_graph_api import start_in_process  # noqa: E402
+
+TENANT = {"phone_id": "123456", "secrets": {"meta_token": "META_TOKEN"}}
+TEMPLATE = {"name": "reapertura_bumeran", "language": "es"}
+
+
+class Store:
+    """In-memory Firestore / Secret Manager stand-in."""
+
+    def collection(self, name):
+        return self
+
+    def document(self, name):
+        return SimpleNamespace(
+            get=lambda: SimpleNamespace(exists=name == "bench", to_dict=lambda: dict(TENANT))
+        )
+
+    def access_secret_version(self, request):
+        return SimpleNamespace(payload=SimpleNamespace(data=b"bench-token"))
+
+    def close(self) -> None:
+        pass
+
+
+def load_main(base_url: str, mps: float):
+    os.environ["RATE_LIMIT_PHONE_MPS"] = str(mps)
+    os.environ["RATE_LIMIT_PHONE_BURST"] = str(int(mps))
+
+    # There are no credentials here; keep the module-level Cloud Logging
+    # client from reaching GCP and silence the per-message logs.
+    from shared import clients, logs
+    from shared.graph import GraphClient
+
+    google.cloud.logging.Client = lambda: SimpleNamespace(project="bench")
+    logs.setup_logging = lambda client, **kwargs: logs.BatchingHandler(
+        logs.StdoutSink(io.StringIO())
+    )
+    store = Store()
+    clients.registry.register("firestore", lambda: store)
+    clients.registry.register("secretmanager", lambda: store)
+
+    import main
+
+    main.logger.disabled = True
+    main.graph = GraphClient(base_url=base_url, verify=False)
+    return main
+
+
+async def single(main, recipients: list[str], concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+
+        async def send(phone_number: str) -> bool:
+            async with semaphore:
+                response = await http.post(
+                    "/send",
+                    json={
+                        "tenant": "bench",
+                        "phone_number": phone_number,
+                        "message": TEMPLATE,
+                        "message_type": "template",
+                    },
+                )
+                return response.status_code == 200
+
+        results = await asyncio.gather(*(send(phone_number) for phone_number in recipients))
+    return sum(results)
+
+
+async def batch(main, recipients: list[str]) -> int:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as http:
+        response = await http.post(
+            "/send/batch",
+            json={"tenant": "bench", "template": TEMPLATE, "recipients": recipients},
+        )
+        lines = response.text.splitlines()
+    return json.loads(lines[-1])["summary"]["sent"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--recipients", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--mps", type=float, default=1_000_000)
+    parser.add_argument("--port", type=int, default=18444)
+    args = parser.parse_args()
+
+    stats, stop = start_in_process(args.latency_ms / 1000, args.port)
+    dispatcher = load_main(f"https://127.0.0.1:{args.port}", args.mps)
+    dispatcher.BATCH_CONCURRENCY = args.concurrency
+    recipients = [f"57300{index:06d}" for index in range(args.recipients)]
+
+    try:
+        for label, scenario in (
+            ("single", lambda: single(dispatcher, recipients, args.concurrency)),
+            ("batch", lambda: batch(dispatcher, recipients)),
+        ):
+
+            async def run():
+                start = time.perf_counter()
+                sent = await scenario()
+                elapsed = time.perf_counter() - start
+                await dispatcher.graph.close()
+                return sent, elapsed
+
+            sent, elapsed = asyncio.run(run())
+            print(
+                f"{label:7} {sent:6d}/{args.recipients} sent  {elapsed:7.2f} s  "
+                f"{sent / elapsed:8.0f} messages/s"
+            )
+    finally:
+        stop()
+
+
+if __name__ == "__main__":
+    main()
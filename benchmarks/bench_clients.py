@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: per-request cost of building GCP clients inline versus
+reusing the process-wide instances from `shared.clients`.
+
+Only client construction is measured (no RPC is issued), which is the overhead
+every handler paid before the registry existed. Anonymous credentials are used
+so the benchmark runs without a GCP project:
+
+    python benchmarks/bench_clients.py --requests 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+from google.cloud import firestore, secretmanager  # noqa: E402
+
+from shared.clients import ClientRegistry  # noqa: E402
+
+
+def build_firestore():
+    return firestore.Client(project="bench", credentials=AnonymousCredentials())
+
+
+def build_secret_manager():
+    return secretmanager.SecretManagerServiceClient(credentials=AnonymousCredentials())
+
+
+def inline_request() -> None:
+    db = build_firestore()
+    db.collection("tenants").document("bench")
+    secrets_client = build_secret_manager()
+    secrets_client.transport.close()
+    db.close()
+
+
+def make_registry_request(registry: ClientRegistry):
+    def registry_request() -> None:
+        registry.firestore().collection("tenants").document("bench")
+        registry.secret_manager()
+
+    return registry_request
+
+
+def measure(label: str, handler, requests: int) -> None:
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter_ns()
+        handler()
+        samples.append((time.perf_counter_ns() - start) / 1_000)
+    samples.sort()
+    p99 = samples[max(0, int(len(samples) * 0.99) - 1)]
+    print(
+        f"{label:<10} mean={statistics.fmean(samples):10.1f}us "
+        f"p50={samples[len(samples) // 2]:10.1f}us p99={p99:10.1f}us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    registry = ClientRegistry()
+    registry.register("firestore", build_firestore)
+    registry.register("secretmanager", build_secret_manager)
+    registry.warm("firestore", "secretmanager")
+
+    measure("inline", inline_request, args.requests)
+    measure("registry", make_registry_request(registry), args.requests)
+    registry.close()
+
+
+if __name__ == "__main__":
+    main()
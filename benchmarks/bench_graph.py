@@ -0,0 +1,102 @@
+"""
+Throughput benchmark: outbound messages against the local mock Graph API.
+
+Sends `--messages` text messages with `--concurrency` in flight and compares:
+
+- `per-message`: a new client (and TLS connection) per message, which is what
+  calling `requests.post()` without a session does.
+- `pooled-h1`: `GraphClient` with HTTP/1.1 keep-alive.
+- `pooled-h2`: `GraphClient` with HTTP/2 (requires `h2`).
+
+    python benchmarks/bench_graph.py --messages 2000 --concurrency 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import httpx  # noqa: E402
+
+from mock_graph_api import start_in_process  # noqa: E402
+from shared.graph import HTTP2_AVAILABLE, GraphClient  # noqa: E402
+
+PHONE_ID = "123456"
+TOKEN = "bench-token"
+
+
+async def per_message(base_url: str, index: int) -> None:
+    async with httpx.AsyncClient(verify=False) as client:
+        response = await client.post(
+            f"{base_url}/v20.0/{PHONE_ID}/messages",
+            json={"messaging_product": "whatsapp", "to": f"57300{index}", "type": "text",
+                  "text": {"body": "Hola"}},
+            headers={"Authorization": f"Bearer {TOKEN}"},
+        )
+        response.raise_for_status()
+
+
+async def run(send, messages: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            await send(index)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(messages)))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=18443)
+    args = parser.parse_args()
+
+    stats, stop = start_in_process(args.latency_ms / 1000, args.port)
+    base_url = f"https://127.0.0.1:{args.port}"
+
+    scenarios = {"per-message": lambda index: per_message(base_url, index)}
+    clients = {}
+    for label, http2 in (("pooled-h1", False), ("pooled-h2", True)):
+        if http2 and not HTTP2_AVAILABLE:
+            print("pooled-h2 skipped: install httpx[http2]")
+            continue
+        graph = clients[label] = GraphClient(base_url=base_url, http2=http2, verify=False)
+        scenarios[label] = (
+            lambda index, graph=graph: graph.send_text(PHONE_ID, TOKEN, f"57300{index}", "Hola")
+        )
+
+    try:
+        for label, send in scenarios.items():
+            stats["reset"] = True
+            time.sleep(0.2)
+
+            async def scenario() -> float:
+                elapsed = await run(send, args.messages, args.concurrency)
+                if label in clients:
+                    await clients[label].close()
+                return elapsed
+
+            elapsed = asyncio.run(scenario())
+            time.sleep(0.2)
+            print(
+                f"{label:12} {args.messages / elapsed:8.0f} messages/s  "
+                f"{stats['connections']:5d} connections  "
+                f"HTTP/{'+'.join(stats['http_versions'])}"
+            )
+    finally:
+        stop()
+
+
+if __name__ == "__main__":
+    main()
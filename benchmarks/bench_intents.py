@@ -0,0 +1,103 @@
+"""
+Throughput of intent classification, in messages per second.
+
+Compares the original per-intent keyword scans (`is_provider_intent` and
+`is_client_intent` called one after the other) with `IntentMatcher`, first
+with the two default intents and then with a larger tenant vocabulary where
+the per-intent scans have to run once per intent:
+
+    python benchmarks/bench_intents.py --messages 200000 --intents 8 --keywords 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "agentes-ia" / "whatsapp-webhook"))
+
+from intents import IntentMatcher, tenant_intents  # noqa: E402
+
+SAMPLES = [
+    "Hola, buenas tardes",
+    "Soy cliente, quiero información sobre el paquete a Cartagena",
+    "Buenas, somos PROVEEDÓR de transporte terrestre",
+    "¿Cuánto cuesta el equipaje adicional para el vuelo del viernes?",
+    "Clientes corporativos: necesito cotizar 20 tiquetes",
+    "ok",
+    "Gracias!!",
+    "Quisiera saber los medios de pago y el horario de atención de la oficina de Bogotá",
+]
+
+
+def is_provider_intent(text: str) -> bool:
+    normalized = text.lower()
+    return any(keyword in normalized for keyword in ("proveedor", "proveedora", "supplier"))
+
+
+def is_client_intent(text: str) -> bool:
+    normalized = text.lower()
+    return any(keyword in normalized for keyword in ("cliente", "client"))
+
+
+def legacy(text: str) -> set[str]:
+    if is_provider_intent(text):
+        return {"provider"}
+    if is_client_intent(text):
+        return {"client"}
+    return set()
+
+
+def sequential_scans(intents: dict[str, tuple[str, ...]]):
+    def classify(text: str) -> set[str]:
+        normalized = text.lower()
+        return {
+            intent
+            for intent, keywords in intents.items()
+            if any(keyword in normalized for keyword in keywords)
+        }
+
+    return classify
+
+
+def measure(label: str, classify, messages: list[str]) -> None:
+    start = time.perf_counter()
+    for message in messages:
+        classify(message)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(messages) / elapsed:14,.0f} messages/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Intent classification throughput.")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--intents", type=int, default=8)
+    parser.add_argument("--keywords", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    messages = [rng.choice(SAMPLES) for _ in range(args.messages)]
+
+    print("default intents")
+    measure("legacy", legacy, messages)
+    measure("matcher", IntentMatcher(tenant_intents(None)).match, messages)
+
+    vocabulary = {
+        f"intent{index}": tuple(
+            f"{rng.choice('abcdefghijklmnopqrstuvwxyz')}palabra{index}x{keyword}"
+            for keyword in range(args.keywords)
+        )
+        for index in range(args.intents)
+    }
+    intents = tenant_intents(vocabulary)
+    print(f"{len(intents)} intents, {sum(map(len, intents.values()))} keywords")
+    measure("legacy", sequential_scans(intents), messages)
+    measure("matcher", IntentMatcher(intents).match, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark: time spent on the request thread per log record.
+
+Compares the handler installed by `client.setup_logging()` on Cloud Run
+(`StructuredLogHandler`, which formats and writes every record inline) with
+`shared.logs.BatchingHandler`, whose `emit()` only enqueues the record. Both
+write JSON lines to /dev/null:
+
+    python benchmarks/bench_logging.py --records 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from google.cloud.logging_v2.handlers import StructuredLogHandler  # noqa: E402
+
+from shared.logs import BatchingHandler, StdoutSink  # noqa: E402
+
+
+def measure(label: str, handler: logging.Handler, records: int) -> None:
+    logger = logging.getLogger(f"bench-{label}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    fields = {
+        "app": "agentes-ia",
+        "env": "dev",
+        "tenant": "bench",
+        "metric": "incoming_messages_total",
+        "actions_generated": 1,
+    }
+    start = time.perf_counter_ns()
+    for _ in range(records):
+        logger.info("Incoming message", extra={"json_fields": fields})
+    elapsed = time.perf_counter_ns() - start
+    handler.flush()
+    handler.close()
+    print(f"{label:12} {elapsed / records / 1000:8.2f} us/record on the calling thread")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with open("/dev/null", "w") as devnull:
+        measure("structured", StructuredLogHandler(stream=devnull), args.records)
+        batching = BatchingHandler(StdoutSink(devnull), maxsize=args.records + 1)
+        measure("batching", batching, args.records)
+        print(f"batching     {batching.stats()['logging_batches']} batches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark of webhook payload parsing.
+
+Compares the original path (`json.loads` into dicts, then building a list of
+`(sender, text)` tuples) with `payload.iter_messages` using the dict fallback
+and the msgspec fast path, on synthetic deliveries that batch many messages
+and statuses:
+
+    python benchmarks/bench_payload.py --messages 1000
+    python benchmarks/bench_payload.py --corpus deliveries.jsonl
+
+`--corpus` takes a JSON Lines file with one captured webhook body per line.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "agentes-ia" / "whatsapp-webhook"))
+
+import payload  # noqa: E402
+
+
+def legacy_text(message: dict[str, Any]) -> str:
+    message_type = message.get("type", "")
+    if message_type == "text":
+        return message.get("text", {}).get("body", "")
+
+    if message_type == "interactive":
+        interactive = message.get("interactive", {})
+        if interactive.get("type") == "button_reply":
+            return interactive.get("button_reply", {}).get("title", "")
+        if interactive.get("type") == "list_reply":
+            return interactive.get("list_reply", {}).get("title", "")
+
+    return ""
+
+
+def legacy_extract(body: bytes) -> list[tuple[str, str]]:
+    data: dict[str, Any] = json.loads(body)
+    results = []
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            for message in value.get("messages", []):
+                results.append((message.get("from", ""), legacy_text(message)))
+    return results
+
+
+def synthetic_body(messages: int, statuses_per_message: int = 2, per_entry: int = 50) -> bytes:
+    entries = []
+    for start in range(0, messages, per_entry):
+        batch = range(start, min(start + per_entry, messages))
+        entries.append(
+            {
+                "id": "102290129340398",
+                "changes": [
+                    {
+                        "field": "messages",
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "metadata": {
+                                "display_phone_number": "15550783881",
+                                "phone_number_id": "106540352242922",
+                            },
+                            "contacts": [
+                                {"profile": {"name": f"Cliente {index}"}, "wa_id": f"57300{index:07d}"}
+                                for index in batch
+                            ],
+                            "messages": [
+                                {
+                                    "from": f"57300{index:07d}",
+                                    "id": f"wamid.HBgLMTU1NTA{index:010d}",
+                                    "timestamp": "1749416383",
+                                    "type": "text",
+                                    "text": {"body": f"Hola, quiero información del paquete {index}"},
+                                }
+                                for index in batch
+                            ],
+                            "statuses": [
+                                {
+                                    "id": f"wamid.STATUS{index:010d}{offset}",
+                                    "status": "delivered",
+                                    "timestamp": "1749416384",
+                                    "recipient_id": f"57300{index:07d}",
+                                    "conversation": {
+                                        "id": "CONVERSATION_ID",
+                                        "origin": {"type": "service"},
+                                    },
+                                    "pricing": {
+                                        "billable": True,
+                                        "pricing_model": "CBP",
+                                        "category": "service",
+                                    },
+                                }
+                                for index in batch
+                                for offset in range(statuses_per_message)
+                            ],
+                        },
+                    }
+                ],
+            }
+        )
+    return json.dumps({"object": "whatsapp_business_account", "entry": entries}).encode()
+
+
+def measure(label: str, func, bodies: list[bytes], repeat: int) -> None:
+    count = sum(len(func(body)) for body in bodies)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            func(body)
+    elapsed = time.perf_counter() - start
+    per_body = elapsed / (repeat * len(bodies)) * 1e6
+    rate = count * repeat / elapsed
+    print(f"{label:<16} {per_body:12.1f} us/body {rate:14,.0f} messages/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Webhook payload parsing benchmark.")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--corpus", type=Path)
+    args = parser.parse_args()
+
+    if args.corpus:
+        lines = args.corpus.read_text(encoding="utf-8").splitlines()
+        bodies = [line.encode() for line in lines if line.strip()]
+    else:
+        bodies = [synthetic_body(args.messages)]
+    size = sum(len(body) for body in bodies)
+    print(f"{len(bodies)} bodies, {size / 1024:.0f} KiB, parser={payload.PARSER}")
+
+    measure("legacy", legacy_extract, bodies, args.repeat)
+    measure("dict", lambda body: list(payload.iter_messages(body, fast=False)), bodies, args.repeat)
+    if payload.msgspec is not None:
+        measure("msgspec", lambda body: list(payload.iter_messages(body)), bodies, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
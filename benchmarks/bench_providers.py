@@ -0,0 +1,137 @@
+"""
+Benchmark of the provider blacklist with a large number of entries.
+
+Compares the legacy approach (re-read and rewrite the whole JSON file on every
+webhook call) with `ProviderRegistry` backed by `FileProviderStore`, and shows
+the memory used by the Bloom filter front versus the exact set:
+
+    python benchmarks/bench_providers.py --numbers 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "agentes-ia" / "whatsapp-webhook"))
+
+from providers import FileProviderStore, ProviderRegistry  # noqa: E402
+
+
+class PointReadStore:
+    """Wraps the file store with O(1) point reads, standing in for Firestore."""
+
+    compacts = False
+    point_reads = True
+
+    def __init__(self, store: FileProviderStore) -> None:
+        self._store = store
+        self._index: dict[str, set[str]] = {}
+
+    def load(self, tenant: str) -> set[str]:
+        numbers = self._store.load(tenant)
+        self._index[tenant] = set(numbers)
+        return numbers
+
+    def contains(self, tenant: str, number: str) -> bool:
+        return number in self._index[tenant]
+
+    def append(self, tenant, numbers) -> None:
+        self._store.append(tenant, numbers)
+
+    def subscribe(self, tenant, on_add) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def timed(label: str, func, operations: int = 1):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    per_op = elapsed / operations * 1e6
+    print(f"{label:<36} {elapsed * 1000:10.1f} ms total {per_op:12.2f} us/op")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Provider blacklist benchmark.")
+    parser.add_argument("--numbers", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--additions", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    numbers = [str(573_000_000_000 + rng.randrange(10**9)) for _ in range(args.numbers)]
+    probes = [str(573_000_000_000 + rng.randrange(10**9)) for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        legacy = directory / "providers_blacklist.json"
+        legacy.write_text(json.dumps({"providers": sorted(numbers)}), encoding="utf-8")
+
+        def legacy_request():
+            with legacy.open("r", encoding="utf-8") as handle:
+                providers = set(json.load(handle)["providers"])
+            providers.add("573999999999")
+            with legacy.open("w", encoding="utf-8") as handle:
+                json.dump({"providers": sorted(providers)}, handle)
+
+        timed("legacy load+save per request", legacy_request)
+
+        store = FileProviderStore(directory / "providers")
+        store.compact("bench", set(numbers))
+        registry = ProviderRegistry(store)
+        timed("registry cold load", lambda: registry.size("bench"))
+        timed(
+            "registry lookups (non-providers)",
+            lambda: sum(registry.contains("bench", probe) for probe in probes),
+            len(probes),
+        )
+        hits = numbers[: len(probes)]
+        timed(
+            "registry lookups (providers)",
+            lambda: sum(registry.contains("bench", number) for number in hits),
+            len(hits),
+        )
+        memory = registry.memory("bench")
+        print(
+            f"memory: filter={memory['providers_filter_bytes'] / 2**20:.1f} MiB "
+            f"set={memory['providers_set_bytes'] / 2**20:.1f} MiB"
+        )
+
+        registry.start()
+        additions = [str(574_000_000_000 + index) for index in range(args.additions)]
+        timed(
+            "registry add (write-behind)",
+            lambda: [registry.add("bench", number) for number in additions],
+            len(additions),
+        )
+        timed("flush to log", registry.flush)
+        timed("compaction", registry.compact)
+        registry.stop()
+
+        # Same tenant with no room for exact sets: only the filter stays
+        # resident and filter hits are confirmed with a point read, as the
+        # Firestore store does.
+        bounded = ProviderRegistry(
+            PointReadStore(FileProviderStore(directory / "providers")), memory_budget=0
+        )
+        bounded.size("bench")
+        timed(
+            "filter-only lookups (non-providers)",
+            lambda: sum(bounded.contains("bench", probe) for probe in probes),
+            len(probes),
+        )
+        print(f"filter-only stats: {bounded.stats()}")
+
+
+if __name__ == "__main__":
+    main()
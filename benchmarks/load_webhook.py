@@ -0,0 +1,228 @@
+"""
+Load test: concurrent throughput of `POST /api/webhook/{tenant}`.
+
+Firestore and Secret Manager are replaced by an in-process stand-in that
+answers every call after `--latency-ms`, like a local emulator would. Unless
+`--warm` is given, tenant and secret caches are disabled so every request pays
+those round trips, which is the worst case for head-of-line blocking.
+
+Two handlers are driven through the ASGI interface with the same requests:
+
+- `inline`: the original handler, which called the blocking clients directly
+  from the `async def` endpoint.
+- `offload`: the current `main.app`, which runs cache misses and event
+  processing on the bounded `BlockingExecutor` pool.
+
+    python benchmarks/load_webhook.py --requests 400 --concurrency 1 10 50 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "agentes-ia" / "whatsapp-webhook"))
+
+import google.cloud.logging  # noqa: E402
+import httpx  # noqa: E402
+from fastapi import FastAPI, HTTPException, Request  # noqa: E402
+
+SECRET = "bench-secret"
+TENANT = {"secrets": {"meta_app_secret": "META_APP_SECRET", "verify_token": "VERIFY"}}
+
+
+class _EmulatorDocument:
+    def __init__(self, emulator: "Emulator", path: str) -> None:
+        self._emulator = emulator
+        self.id = path.rsplit("/", 1)[-1]
+        self._path = path
+
+    def collection(self, name: str) -> "_EmulatorCollection":
+        return _EmulatorCollection(self._emulator, f"{self._path}/{name}")
+
+    def get(self):
+        data = self._emulator.read(self._path)
+        return SimpleNamespace(id=self.id, exists=data is not None, to_dict=lambda: data)
+
+
+class _EmulatorCollection:
+    def __init__(self, emulator: "Emulator", path: str) -> None:
+        self._emulator = emulator
+        self._path = path
+
+    def document(self, name: str) -> _EmulatorDocument:
+        return _EmulatorDocument(self._emulator, f"{self._path}/{name}")
+
+    def select(self, _fields):
+        return self
+
+    def stream(self):
+        return iter(())
+
+
+class Emulator:
+    """Blocking Firestore / Secret Manager stand-in with a fixed latency."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.documents = {"tenants/bench": TENANT}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self) -> None:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    def read(self, path: str):
+        self._round_trip()
+        return self.documents.get(path)
+
+    # Firestore surface.
+    def collection(self, name: str) -> _EmulatorCollection:
+        return _EmulatorCollection(self, name)
+
+    def batch(self):
+        return SimpleNamespace(set=lambda *args: None, commit=self._round_trip)
+
+    # Secret Manager surface.
+    def access_secret_version(self, request):
+        self._round_trip()
+        return SimpleNamespace(payload=SimpleNamespace(data=SECRET.encode()))
+
+    def close(self) -> None:
+        pass
+
+
+def load_main(emulator: Emulator, cold: bool):
+    if cold:
+        os.environ.setdefault("TENANT_CACHE_TTL_SECONDS", "0")
+        os.environ.setdefault("TENANT_CACHE_NEGATIVE_TTL_SECONDS", "0")
+        os.environ.setdefault("SECRETS_CACHE_TTL_SECONDS", "0")
+    os.environ.setdefault("PROVIDERS_DIR", tempfile.mkdtemp(prefix="bench-providers-"))
+    os.environ.pop("WEBHOOK_INGEST_MODE", None)
+
+    # There are no credentials here; keep the module-level Cloud Logging
+    # client from reaching GCP and silence the per-event logs.
+    from shared import clients, logs
+
+    google.cloud.logging.Client = lambda: SimpleNamespace(project="bench")
+    logs.setup_logging = lambda client, **kwargs: logs.BatchingHandler(
+        logs.StdoutSink(io.StringIO())
+    )
+
+    clients.registry.register("firestore", lambda: emulator)
+    clients.registry.register("secretmanager", lambda: emulator)
+
+    import main
+
+    main.logger.disabled = True
+    return main
+
+
+def build_inline_app(main) -> FastAPI:
+    """The webhook as it was: blocking client calls inside `async def`."""
+    from shared import clients
+
+    app = FastAPI()
+
+    @app.post("/api/webhook/{tenant}")
+    async def webhook(tenant: str, request: Request):
+        tenant_doc = clients.registry.firestore().collection("tenants").document(tenant).get()
+        if not tenant_doc.exists:
+            raise HTTPException(status_code=404, detail="Tenant not found")
+        tenant_config = tenant_doc.to_dict()
+        name = f"projects/bench/secrets/{tenant_config['secrets']['meta_app_secret']}/versions/latest"
+        response = clients.registry.secret_manager().access_secret_version(request={"name": name})
+        meta_app_secret = response.payload.data.decode("UTF-8")
+
+        body = await request.body()
+        signature = request.headers.get("x-hub-signature-256")
+        if not main.validate_signature(body, signature, meta_app_secret):
+            raise HTTPException(status_code=401, detail="Invalid signature")
+        return {"status": "success", "actions": main.process_event(tenant, body)}
+
+    return app
+
+
+def make_requests(count: int, offset: int) -> list[tuple[bytes, str]]:
+    requests = []
+    for index in range(offset, offset + count):
+        message = {
+            "from": f"57300{index % 1000:04d}",
+            "id": f"wamid.bench.{index}",
+            "type": "text",
+            "text": {"body": "hola, soy cliente"},
+        }
+        body = json.dumps({"entry": [{"changes": [{"value": {"messages": [message]}}]}]}).encode()
+        signature = "sha256=" + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+        requests.append((body, signature))
+    return requests
+
+
+async def drive(app: FastAPI, requests: list[tuple[bytes, str]], concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+
+        async def send(body: bytes, signature: str) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await http.post(
+                    "/api/webhook/bench",
+                    content=body,
+                    headers={"x-hub-signature-256": signature},
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(body, signature) for body, signature in requests))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    return len(requests) / elapsed, statistics.median(latencies), p99
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--warm", action="store_true", help="keep tenant and secret caches on")
+    args = parser.parse_args()
+
+    emulator = Emulator(args.latency_ms / 1000)
+    webhook = load_main(emulator, cold=not args.warm)
+    apps = {"inline": build_inline_app(webhook), "offload": webhook.app}
+
+    offset = 0
+    print(f"{'handler':8} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for concurrency in args.concurrency:
+        for label, app in apps.items():
+            requests = make_requests(args.requests, offset)
+            offset += args.requests
+            throughput, p50, p99 = asyncio.run(drive(app, requests, concurrency))
+            print(f"{label:8} {concurrency:5d} {throughput:9.0f} {p50:8.1f} {p99:8.1f}")
+    webhook.blocking.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Local stand-in for the Meta Graph API messages endpoint.
+
+Answers `POST /{version}/{phone_id}/messages` like the real API after
+`--latency-ms`, and counts the TCP connections it sees so benchmarks can show
+connection reuse. With `--fail-every N` every Nth request gets a 429 with a
+`Retry-After` header.
+
+Served by hypercorn over TLS with a throwaway self-signed certificate, so
+HTTP/2 is negotiated through ALPN like with graph.facebook.com:
+
+    python benchmarks/mock_graph_api.py --port 8443
+    GRAPH_API_URL=https://127.0.0.1:8443 ...   (clients need verify=False)
+
+`start_in_process()` runs the same server next to a benchmark.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class MockGraphAPI:
+    def __init__(self, latency: float = 0.0, fail_every: int = 0, retry_after: float = 1.0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.connections: set[tuple[str, int]] = set()
+        self.http_versions: set[str] = set()
+        self._ids = itertools.count(1)
+        self.app = Starlette(
+            routes=[Route("/{version}/{phone_id}/messages", self.messages, methods=["POST"])]
+        )
+
+    async def messages(self, request: Request) -> JSONResponse:
+        self.requests += 1
+        self.connections.add(tuple(request.scope["client"] or ("", 0)))
+        self.http_versions.add(request.scope["http_version"])
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return JSONResponse({"error": {"message": "Invalid OAuth access token"}}, 401)
+        payload = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_every and self.requests % self.fail_every == 0:
+            return JSONResponse(
+                {"error": {"message": "Rate limit hit", "code": 130429}},
+                429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        to = payload.get("to", "")
+        return JSONResponse(
+            {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": to, "wa_id": to}],
+                "messages": [{"id": f"wamid.mock.{next(self._ids)}"}],
+            }
+        )
+
+
+def self_signed_certificate(directory: Path) -> tuple[str, str]:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_file, key_file = directory / "cert.pem", directory / "key.pem"
+    cert_file.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_file.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return str(cert_file), str(key_file)
+
+
+async def serve(mock: MockGraphAPI, port: int, shutdown: asyncio.Event) -> None:
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.certfile, config.keyfile = self_signed_certificate(Path(tempfile.mkdtemp()))
+    config.alpn_protocols = ["h2", "http/1.1"]
+    config.accesslog = None
+    config.errorlog = None
+    config.keep_alive_timeout = 60
+    # hypercorn closes a connection after 1000 requests by default, which
+    # would make the benchmarks measure reconnects.
+    config.keep_alive_max_requests = 10**9
+    await hypercorn_serve(mock.app, config, shutdown_trigger=shutdown.wait)
+
+
+def _serve_in_process(
+    latency: float, port: int, stats, fail_every: int, retry_after: float
+) -> None:
+    mock = MockGraphAPI(latency=latency, fail_every=fail_every, retry_after=retry_after)
+
+    async def run() -> None:
+        shutdown = asyncio.Event()
+
+        async def report() -> None:
+            # Publish counters to the parent process; "reset" clears them.
+            while True:
+                if stats.get("reset"):
+                    mock.connections.clear()
+                    mock.http_versions.clear()
+                    stats["reset"] = False
+                stats["connections"] = len(mock.connections)
+                stats["http_versions"] = sorted(mock.http_versions)
+                await asyncio.sleep(0.05)
+
+        asyncio.create_task(report())
+        await serve(mock, port, shutdown)
+
+    asyncio.run(run())
+
+
+def start_in_process(
+    latency: float, port: int, fail_every: int = 0, retry_after: float = 1.0
+):
+    """
+    Serve a mock from a child process, so it does not compete with the
+    benchmark for the GIL. Return `(stats, stop)`: a shared dict with
+    `connections` and `http_versions` (set `reset` to clear them) and a
+    function that stops the server.
+    """
+    manager = multiprocessing.Manager()
+    stats = manager.dict(connections=0, http_versions=[], reset=False)
+    process = multiprocessing.Process(
+        target=_serve_in_process,
+        args=(latency, port, stats, fail_every, retry_after),
+        daemon=True,
+    )
+    process.start()
+    time.sleep(1.5)
+
+    def stop() -> None:
+        process.terminate()
+        process.join(timeout=5)
+        manager.shutdown()
+
+    return stats, stop
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+    mock = MockGraphAPI(latency=args.latency_ms / 1000, fail_every=args.fail_every)
+    asyncio.run(serve(mock, args.port, asyncio.Event()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Delivery of the replies generated by the webhook router.
+
+`process_event()` returns actions (`to`, `type`, `message`, `next`). An
+`ActionPipeline` takes them off the request path and hands them, in small
+batches, to a sink:
+
+- `EmbeddedDispatcher` sends them to the Graph API from this process, with
+  the same pooled client (`shared.graph`) and rate limiter
+  (`shared.ratelimit`) as the dispatcher service. No extra hop.
+- `DispatcherPublisher` POSTs each batch to the dispatcher service's
+  `/send/actions` over one persistent connection (HTTP/2 when `h2` is
+  installed), so the dispatcher stays the only sender. With its outbox
+  enabled the dispatcher queues the batch and answers 202 right away.
+
+`submit()` never blocks the caller: actions wait in a bounded in-memory
+queue, and when it is full they are dropped and counted.
+
+With `coalesce_window` set, a sender's actions are held for that long first
+(debounced: every new message from the sender restarts the window, up to
+`coalesce_max_delay` after the first one). Users often send three or four
+short messages in a row; within the window an action identical to one
+already pending for the same `to` (same `type`, `message` and `next`) is
+dropped, and the inbound `text` it carries is appended to the pending one.
+
+With a `delegate` (`OrchestratorDelegate`), each delivered `delegate_to_llm`
+action's `text` (the whole burst, when it was coalesced) is sent to the LLM
+orchestrator as one turn, and its answer is queued as a reply to the
+sender.
+
+The worker takes whatever is queued (up to `batch_size`, waiting at most
+`linger` seconds for more once the first action arrived) and delivers each
+batch as its own task, with at most `max_batches` in flight. The time from `submit()` to delivery
+is observed in the `action_delivery_ms{mode}` histogram.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+
+from shared import metrics
+from shared.graph import HTTP2, HTTP2_AVAILABLE
+
+logger = logging.getLogger("agentes-ia-log")
+
+action_delivery = metrics.registry.histogram(
+    "action_delivery_ms", "Time from routing a reply to its delivery", ("mode",)
+)
+
+Action = dict[str, Any]
+
+# Longer than the dispatcher's RATE_LIMIT_MAX_WAIT_SECONDS (60): a batch still
+# waiting for its rate limits will be sent, so timing out first would count it
+# as failed and invite duplicate retries.
+DISPATCHER_TIMEOUT_SECONDS = float(os.environ.get("DISPATCHER_TIMEOUT_SECONDS", "90"))
+# A generation may wait in the orchestrator's scheduler queue before it runs.
+ORCHESTRATOR_TIMEOUT_SECONDS = float(os.environ.get("ORCHESTRATOR_TIMEOUT_SECONDS", "60"))
+
+
+def _log_failure(message: str, tenant: Optional[str], error: Any) -> None:
+    logger.warning(
+        message,
+        extra={
+            "json_fields": {
+                "app": "agentes-ia",
+                "env": "dev",
+                "tenant": tenant,
+                "metric": "action_failures_total",
+                "error": error,
+            }
+        },
+    )
+
+
+class EmbeddedDispatcher:
+    """
+    Sends actions straight to the Graph API. `credentials(tenant)` returns
+    the tenant's `(phone_id, META_TOKEN)`.
+    """
+
+    mode = "embedded"
+
+    def __init__(
+        self,
+        graph: Any,
+        credentials: Callable[[str], Awaitable[tuple[str, str]]],
+        limiter: Optional[Any] = None,
+    ) -> None:
+        self._graph = graph
+        self._credentials = credentials
+        self._limiter = limiter
+
+    async def _send(self, action: Action) -> bool:
+        try:
+            phone_id, token = await self._credentials(action["tenant"])
+            if self._limiter is not None:
+                await self._limiter.acquire(phone_id, action["to"])
+            if action.get("type", "text") == "template":
+                await self._graph.send_template(
+                    phone_id, token, to=action["to"], name=action["message"]
+                )
+            else:
+                await self._graph.send_text(
+                    phone_id, token, to=action["to"], body=action["message"]
+                )
+        except Exception as exc:
+            _log_failure("Action delivery failed", action.get("tenant"), repr(exc))
+            return False
+        return True
+
+    async def deliver(self, actions: list[Action]) -> int:
+        """Send every action concurrently; return how many failed."""
+        results = await asyncio.gather(*(self._send(action) for action in actions))
+        return results.count(False)
+
+    async def close(self) -> None:
+        await self._graph.close()
+
+
+class _LoopClients:
+    """
+    One `httpx.AsyncClient` per event loop: a connection belongs to the loop
+    that created it.
+    """
+
+    def __init__(
+        self,
+        http2: bool,
+        timeout: float,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self._http2 = http2 and HTTP2_AVAILABLE
+        self._timeout = timeout
+        self._transport = transport
+        self._clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            for stale in [stale for stale in self._clients if stale.is_closed()]:
+                del self._clients[stale]
+            client = self._clients[loop] = httpx.AsyncClient(
+                http2=self._http2, timeout=self._timeout, transport=self._transport
+            )
+        return client
+
+    async def close(self) -> None:
+        current = asyncio.get_running_loop()
+        clients, self._clients = self._clients, {}
+        for loop, client in clients.items():
+            if loop is current:
+                await client.aclose()
+            elif loop.is_running():
+                await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                )
+
+
+class DispatcherPublisher:
+    """POSTs batches of actions to the dispatcher service."""
+
+    mode = "publish"
+
+    def __init__(
+        self,
+        url: str,
+        http2: bool = HTTP2,
+        timeout: float = DISPATCHER_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.url = url.rstrip("/") + "/send/actions"
+        self._clients = _LoopClients(http2, timeout, transport)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._clients.get()
+
+    async def deliver(self, actions: list[Action]) -> int:
+        """Publish one batch; return how many actions the dispatcher could not send."""
+        try:
+            response = await self.client.post(self.url, json={"actions": actions})
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            _log_failure("Publishing actions failed", None, repr(exc))
+            return len(actions)
+        return response.json().get("failed", 0)
+
+    async def close(self) -> None:
+        await self._clients.close()
+
+
+class OrchestratorDelegate:
+    """
+    Answers `delegate_to_llm` actions: POSTs the user's `text` to the LLM
+    orchestrator's `/nlu/generate` (with `sender`, so the orchestrator keeps
+    the conversation) and returns the answer as a new action for the sender.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        model: str,
+        http2: bool = HTTP2,
+        timeout: float = ORCHESTRATOR_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.url = url.rstrip("/") + "/nlu/generate"
+        self._model = model
+        self._clients = _LoopClients(http2, timeout, transport)
+
+    async def reply(self, action: Action) -> Optional[Action]:
+        """The orchestrator's answer to `action`, or None if it failed."""
+        try:
+            response = await self._clients.get().post(
+                self.url,
+                json={
+                    "tenant": action["tenant"],
+                    "model": self._model,
+                    "prompt": action["text"],
+                    "sender": action["to"],
+                },
+            )
+            response.raise_for_status()
+            content = response.json()["response"]
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as exc:
+            _log_failure("LLM delegation failed", action["tenant"], repr(exc))
+            return None
+        return {
+            "tenant": action["tenant"],
+            "to": action["to"],
+            "type": "text",
+            "message": content,
+            "next": "llm_reply",
+        }
+
+    async def close(self) -> None:
+        await self._clients.close()
+
+
+@dataclass
+class _Turn:
+    """A sender's actions held during the coalescing window."""
+
+    submitted_at: float
+    deadline: float
+    actions: list[Action] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class ActionPipeline:
+    def __init__(
+        self,
+        sink: Any,
+        batch_size: int = 50,
+        linger: float = 0.002,
+        maxsize: int = 10_000,
+        max_batches: int = 8,
+        coalesce_window: float = 0.0,
+        coalesce_max_delay: float = 5.0,
+        delegate: Optional[OrchestratorDelegate] = None,
+    ) -> None:
+        self._sink = sink
+        self._delegate = delegate
+        self._batch_size = batch_size
+        self._linger = linger
+        self._maxsize = maxsize
+        self._max_batches = max_batches
+        self._coalesce_window = coalesce_window
+        self._coalesce_max_delay = coalesce_max_delay
+        self._turns: dict[tuple[str, str], _Turn] = {}
+        self._batches: Optional[asyncio.Semaphore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set[asyncio.Task] = set()
+        self.mode = getattr(sink, "mode", "")
+        self.submitted = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.delegated = 0
+        self.delegate_failures = 0
+        self.delivered = 0
+        self.failed = 0
+        self.batches = 0
+
+    def submit(self, tenant: str, actions: list[Action]) -> None:
+        """Queue the tenant's actions for delivery; never blocks."""
+        if self._queue is None:
+            raise RuntimeError("ActionPipeline is not started")
+        now = time.perf_counter()
+        for action in actions:
+            action = {"tenant": tenant, **action}
+            if self._coalesce_window > 0:
+                self._hold(now, action)
+            else:
+                self._enqueue(now, action)
+
+    def _enqueue(self, submitted_at: float, action: Action) -> None:
+        try:
+            self._queue.put_nowait((submitted_at, action))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            _log_failure("Action queue full; reply dropped", action["tenant"], "queue_full")
+        else:
+            self.submitted += 1
+
+    def _hold(self, now: float, action: Action) -> None:
+        key = (action["tenant"], action["to"])
+        loop = asyncio.get_running_loop()
+        turn = self._turns.get(key)
+        if turn is None:
+            turn = self._turns[key] = _Turn(now, loop.time() + self._coalesce_max_delay)
+        else:
+            turn.timer.cancel()
+        for held in turn.actions:
+            if all(held.get(name) == action.get(name) for name in ("type", "message", "next")):
+                if action.get("text"):
+                    held["text"] = "\n".join(filter(None, (held.get("text"), action["text"])))
+                self.coalesced += 1
+                break
+        else:
+            turn.actions.append(action)
+        delay = min(self._coalesce_window, turn.deadline - loop.time())
+        turn.timer = loop.call_later(max(delay, 0), self._release, key)
+
+    def _release(self, key: tuple[str, str]) -> None:
+        turn = self._turns.pop(key)
+        turn.timer.cancel()
+        for action in turn.actions:
+            self._enqueue(turn.submitted_at, action)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(self._maxsize)
+        self._batches = asyncio.Semaphore(self._max_batches)
+        self._task = asyncio.create_task(self._loop(), name="action-pipeline")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Deliver what is queued, then close the sink."""
+        for key in list(self._turns):
+            self._release(key)
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                pending = self.submitted - self.delivered - self.failed
+                logger.warning("Action pipeline stopped with %d replies pending.", pending)
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._inflight, return_exceptions=True)
+            self._task = None
+        await self._sink.close()
+        if self._delegate is not None:
+            await self._delegate.close()
+
+    async def _drain(self) -> None:
+        while self.delivered + self.failed < self.submitted:
+            await asyncio.sleep(0.01)
+
+    async def _next_batch(self) -> list[tuple[float, Action]]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self._linger
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            await self._batches.acquire()
+            task = asyncio.create_task(self._deliver(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, batch: list[tuple[float, Action]]) -> None:
+        try:
+            failed = await self._sink.deliver([action for _, action in batch])
+        except Exception:
+            logger.exception("Action sink failed")
+            failed = len(batch)
+        finally:
+            self._batches.release()
+        done = time.perf_counter()
+        if self._delegate is not None:
+            # Queued before this batch is counted, so `stop()` waits for the answers.
+            await self._delegate_turns([action for _, action in batch])
+        self.batches += 1
+        self.failed += failed
+        self.delivered += len(batch) - failed
+        for submitted_at, _ in batch:
+            action_delivery.observe((done - submitted_at) * 1000, mode=self.mode)
+
+    async def _delegate_turns(self, actions: list[Action]) -> None:
+        turns = [
+            action
+            for action in actions
+            if action.get("next") == "delegate_to_llm" and action.get("text")
+        ]
+        replies = await asyncio.gather(*(self._delegate.reply(action) for action in turns))
+        for reply in replies:
+            if reply is None:
+                self.delegate_failures += 1
+            else:
+                self.delegated += 1
+                self._enqueue(time.perf_counter(), reply)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "actions_queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "actions_submitted": self.submitted,
+            "actions_dropped": self.dropped,
+            "actions_coalesced": self.coalesced,
+            "actions_delegated": self.delegated,
+            "actions_delegate_failures": self.delegate_failures,
+            "actions_held_senders": len(self._turns),
+            "actions_delivered": self.delivered,
+            "actions_failed": self.failed,
+            "actions_batches": self.batches,
+        }
@@ -0,0 +1,150 @@
+"""
+Process-wide registry of Google Cloud clients.
+
+Creating a `firestore.Client()` or a `SecretManagerServiceClient()` sets up a
+gRPC channel and mints auth tokens, which is far too expensive to do per
+request. The registry creates each client once per process, hands out the same
+instance (and therefore the same channel) to every caller, and closes them when
+the FastAPI application shuts down.
+
+Typical wiring in a service::
+
+    app = FastAPI(lifespan=clients.lifespan("firestore", "secretmanager"))
+
+    @app.get("/x")
+    def handler(db=Depends(clients.get_firestore)):
+        ...
+"""
+
+from __future__ import annotations
+
+import inspect
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+
+def _firestore_client() -> Any:
+    from google.cloud import firestore
+
+    return firestore.Client()
+
+
+def _secret_manager_client() -> Any:
+    from google.cloud import secretmanager
+
+    return secretmanager.SecretManagerServiceClient()
+
+
+def _close_client(client: Any) -> None:
+    # Firestore clients expose close(); GAPIC clients close their transport.
+    close = getattr(client, "close", None)
+    if close is None and hasattr(client, "transport"):
+        close = client.transport.close
+    if close is not None:
+        close()
+
+
+class ClientRegistry:
+    def __init__(self) -> None:
+        self._factories: dict[str, Callable[[], Any]] = {}
+        self._closers: dict[str, Callable[[Any], None]] = {}
+        self._clients: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        close: Callable[[Any], None] = _close_client,
+    ) -> None:
+        """Declare how to build (and close) the client called `name`."""
+        with self._lock:
+            self._factories[name] = factory
+            self._closers[name] = close
+
+    def get(self, name: str) -> Any:
+        """Return the shared client called `name`, creating it on first use."""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                try:
+                    factory = self._factories[name]
+                except KeyError:
+                    raise KeyError(f"Unknown client: {name}") from None
+                client = self._clients[name] = factory()
+        return client
+
+    def warm(self, *names: str) -> None:
+        for name in names:
+            self.get(name)
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for name, client in clients.items():
+            try:
+                self._closers[name](client)
+            except Exception as exc:
+                logger.warning("Failed to close %s client: %s", name, exc)
+
+    def firestore(self) -> Any:
+        return self.get("firestore")
+
+    def secret_manager(self) -> Any:
+        return self.get("secretmanager")
+
+
+registry = ClientRegistry()
+registry.register("firestore", _firestore_client)
+registry.register("secretmanager", _secret_manager_client)
+
+
+def lifespan(
+    *warm: str,
+    startup: Optional[Callable[[Any], Any]] = None,
+    shutdown: Optional[Callable[[Any], Any]] = None,
+):
+    """
+    Build a FastAPI lifespan that creates the `warm` clients at startup and
+    closes every client of the registry at shutdown. `startup` and `shutdown`
+    hooks receive the application and run after warm-up / before closing; they
+    may be plain functions or coroutines.
+    """
+
+    @asynccontextmanager
+    async def _lifespan(app):
+        registry.warm(*warm)
+        app.state.clients = registry
+        if startup is not None:
+            await _maybe_await(startup(app))
+        try:
+            yield
+        finally:
+            if shutdown is not None:
+                await _maybe_await(shutdown(app))
+            registry.close()
+
+    return _lifespan
+
+
+async def _maybe_await(result: Any) -> None:
+    if inspect.isawaitable(result):
+        await result
+
+
+# FastAPI dependencies.
+
+
+def get_firestore() -> Any:
+    return registry.firestore()
+
+
+def get_secret_manager() -> Any:
+    return registry.secret_manager()
@@ -0,0 +1,203 @@
+"""
+Meta Graph API client for outbound WhatsApp messages.
+
+`GraphClient` keeps one `httpx.AsyncClient` per process, so every message
+reuses a warm TLS connection from a bounded pool instead of opening a new one.
+With the `h2` package installed (`httpx[http2]`) requests are multiplexed over
+HTTP/2 connections; without it the pool falls back to HTTP/1.1 keep-alive.
+
+Authentication is per tenant: each call takes the tenant's `META_TOKEN` and
+`phone_id`, so a single pool serves every tenant.
+
+    graph = GraphClient()
+    await graph.send_text(phone_id, token, to="57300...", body="Hola")
+    ...
+    await graph.close()
+
+Pool limits and timeouts default to the `GRAPH_API_*` environment variables
+below.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import logging
+import os
+import time
+from typing import Any, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # pragma: no cover - exercised when h2 is missing
+    HTTP2_AVAILABLE = False
+else:
+    HTTP2_AVAILABLE = True
+
+logger = logging.getLogger("agentes-ia-log")
+
+GRAPH_API_URL = os.environ.get("GRAPH_API_URL", "https://graph.facebook.com")
+GRAPH_API_VERSION = os.environ.get("GRAPH_API_VERSION", "v20.0")
+HTTP2 = os.environ.get("GRAPH_API_HTTP2", "1") != "0"
+MAX_CONNECTIONS = int(os.environ.get("GRAPH_API_MAX_CONNECTIONS", "100"))
+# Keep every pooled connection alive: with fewer keep-alive slots than
+# in-flight requests, bursts close and reopen TLS connections.
+MAX_KEEPALIVE = int(os.environ.get("GRAPH_API_MAX_KEEPALIVE", "100"))
+KEEPALIVE_SECONDS = float(os.environ.get("GRAPH_API_KEEPALIVE_SECONDS", "60"))
+TIMEOUT_SECONDS = float(os.environ.get("GRAPH_API_TIMEOUT_SECONDS", "10"))
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get("GRAPH_API_CONNECT_TIMEOUT_SECONDS", "5"))
+
+
+class GraphAPIError(Exception):
+    """A non-2xx answer from the Graph API."""
+
+    def __init__(self, status: int, body: Any, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"Graph API returned {status}: {body}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a `Retry-After` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class GraphClient:
+    def __init__(
+        self,
+        base_url: str = GRAPH_API_URL,
+        version: str = GRAPH_API_VERSION,
+        http2: bool = HTTP2,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive: int = MAX_KEEPALIVE,
+        keepalive_expiry: float = KEEPALIVE_SECONDS,
+        timeout: float = TIMEOUT_SECONDS,
+        connect_timeout: float = CONNECT_TIMEOUT_SECONDS,
+        verify: Any = True,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.version = version
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._verify = verify
+        self._transport = transport
+        # A pool belongs to the event loop that created it.
+        self._clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self.sent = 0
+        self.errors = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            # Pools of loops that are gone can no longer be closed; drop them
+            # so their connections are released.
+            for stale in [stale for stale in self._clients if stale.is_closed()]:
+                del self._clients[stale]
+            client = self._clients[loop] = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self._limits,
+                timeout=self._timeout,
+                verify=self._verify,
+                transport=self._transport,
+            )
+        return client
+
+    def messages_url(self, phone_id: str) -> str:
+        return f"{self.base_url}/{self.version}/{phone_id}/messages"
+
+    async def send_message(self, phone_id: str, token: str, payload: dict[str, Any]) -> dict:
+        """POST a message payload; return the JSON answer or raise GraphAPIError."""
+        response = await self.client.post(
+            self.messages_url(phone_id),
+            json={"messaging_product": "whatsapp", **payload},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        if response.status_code >= 400:
+            self.errors += 1
+            try:
+                body = response.json()
+            except ValueError:
+                body = response.text
+            raise GraphAPIError(
+                response.status_code,
+                body,
+                parse_retry_after(response.headers.get("retry-after")),
+            )
+        self.sent += 1
+        try:
+            return response.json()
+        except ValueError:
+            # Accepted, so the message is on its way; failing here would make
+            # callers retry it into a duplicate.
+            logger.warning("Graph API answered %s without JSON", response.status_code)
+            return {}
+
+    async def send_text(
+        self, phone_id: str, token: str, to: str, body: str, preview_url: bool = False
+    ) -> dict:
+        return await self.send_message(
+            phone_id,
+            token,
+            {"to": to, "type": "text", "text": {"body": body, "preview_url": preview_url}},
+        )
+
+    async def send_template(
+        self,
+        phone_id: str,
+        token: str,
+        to: str,
+        name: str,
+        language: str = "es",
+        components: Optional[list[dict[str, Any]]] = None,
+    ) -> dict:
+        template: dict[str, Any] = {"name": name, "language": {"code": language}}
+        if components:
+            template["components"] = components
+        return await self.send_message(
+            phone_id, token, {"to": to, "type": "template", "template": template}
+        )
+
+    def stats(self) -> dict[str, Any]:
+        """Counters published as gauges by the `/metrics` collectors."""
+        return {
+            "graph_sent": self.sent,
+            "graph_errors": self.errors,
+            "graph_http2": self.http2,
+        }
+
+    async def close(self) -> None:
+        """Close the pools, each on the loop that owns it."""
+        current = asyncio.get_running_loop()
+        clients, self._clients = self._clients, {}
+        for loop, client in clients.items():
+            if loop is current:
+                await client.aclose()
+            elif loop.is_running():
+                await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                )
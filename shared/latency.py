@@ -0,0 +1,157 @@
+"""
+Per-request latency logging for the FastAPI services.
+
+`LatencyMiddleware` is a plain ASGI middleware that measures the wall time of
+every HTTP request with `time.perf_counter_ns()` and writes one structured log
+record per request:
+
+    {"app": "agentes-ia", "env": "dev", "metric": "webhook_latency_ms",
+     "service": "whatsapp-webhook", "route": "/api/webhook/{tenant}",
+     "tenant": "...", "status": 200, "latency": 12.345,
+     "latency_tenant_lookup": 0.004, "latency_signature": 0.011, ...}
+
+`latency` (milliseconds) is what the log-based metric `webhook_latency_ms`
+extracts. The same value is observed in the `request_latency_ms` histogram of
+`shared.metrics`, labeled by service, route and tenant. The tenant label is
+only set by the handler once the tenant exists (`set_tenant()`); requests for
+unknown tenants are labeled `unknown`, so made-up paths cannot add series.
+Handlers break the latency down with `phase()`:
+
+    with latency.phase("tenant_lookup"):
+        tenant_config = await get_tenant(tenant)
+
+Each phase is added to the request's total for that name and logged as
+`latency_<name>`. Phases may nest (e.g. `persistence` inside `routing`), so
+they do not necessarily add up to `latency`. Outside a request `phase()` only
+costs a context variable lookup.
+"""
+
+from __future__ import annotations
+
+import logging
+from contextvars import ContextVar
+from time import perf_counter_ns
+from typing import Any, Iterable, Optional
+
+from shared import metrics
+
+logger = logging.getLogger("agentes-ia-log")
+
+request_latency = metrics.registry.histogram(
+    "request_latency_ms", "HTTP request latency in milliseconds", ("service", "route", "tenant")
+)
+
+
+class Timings:
+    __slots__ = ("phases", "tenant")
+
+    def __init__(self) -> None:
+        self.phases: dict[str, int] = {}
+        self.tenant: Optional[str] = None
+
+    def add(self, name: str, elapsed_ns: int) -> None:
+        self.phases[name] = self.phases.get(name, 0) + elapsed_ns
+
+
+_current: ContextVar[Optional[Timings]] = ContextVar("request_timings", default=None)
+
+
+def current() -> Optional[Timings]:
+    """Timings of the request being served, or None outside a request."""
+    return _current.get()
+
+
+class _Phase:
+    __slots__ = ("_name", "_timings", "_start")
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._timings = _current.get()
+        self._start = perf_counter_ns()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._timings is not None:
+            self._timings.add(self._name, perf_counter_ns() - self._start)
+
+
+def phase(name: str) -> _Phase:
+    """Context manager adding the time spent in the block to phase `name`."""
+    return _Phase(name)
+
+
+def set_tenant(tenant: str) -> None:
+    """Label the current request's metrics with `tenant`, a known tenant."""
+    timings = _current.get()
+    if timings is not None:
+        timings.tenant = tenant
+
+
+class LatencyMiddleware:
+    def __init__(
+        self,
+        app: Any,
+        service: str,
+        metric: str = "request_latency_ms",
+        exclude: Iterable[str] = ("/healthz", "/metrics"),
+    ) -> None:
+        self.app = app
+        self.service = service
+        self.metric = metric
+        self.exclude = frozenset(exclude)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = perf_counter_ns()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter_ns() - start
+            _current.reset(token)
+            self._log(scope, status, elapsed, timings)
+
+    def _log(self, scope, status: int, elapsed_ns: int, timings: Timings) -> None:
+        # The route template (not the raw path) keeps the field low-cardinality.
+        template = getattr(scope.get("route"), "path", None)
+        route = template or scope["path"]
+        tenant = scope.get("path_params", {}).get("tenant")
+        elapsed_ms = elapsed_ns / 1e6
+        if timings.tenant is not None:
+            tenant_label = timings.tenant
+        else:
+            tenant_label = "unknown" if tenant else ""
+        request_latency.observe(
+            elapsed_ms,
+            service=self.service,
+            route=template or "unmatched",
+            tenant=tenant_label,
+        )
+        fields: dict[str, Any] = {
+            "app": "agentes-ia",
+            "env": "dev",
+            "metric": self.metric,
+            "service": self.service,
+            "method": scope["method"],
+            "route": route,
+            "status": status,
+            "latency": round(elapsed_ms, 3),
+        }
+        if tenant is not None:
+            fields["tenant"] = tenant
+        for name, phase_ns in timings.phases.items():
+            fields[f"latency_{name}"] = round(phase_ns / 1e6, 3)
+        logger.info("Request latency", extra={"json_fields": fields})
@@ -0,0 +1,294 @@
+"""
+Non-blocking, batched logging to Cloud Logging.
+
+`client.setup_logging()` installs a handler that formats (and on Cloud Run
+writes) every record on the thread that logged it, i.e. inside the request.
+`setup_logging()` below installs `BatchingHandler` on the root logger instead:
+
+- `emit()` only appends the record to a bounded queue; a background thread
+  serializes records and writes them in batches of up to `batch_size`, or
+  whatever arrived within `flush_interval` seconds.
+- Under load (queue more than `high_water` full) records listed in
+  `low_value` are sampled at `sample_rate`; when the queue holds `maxsize`
+  records new records below WARNING are dropped. Both are counted in
+  `stats()`. Warnings and errors are always queued.
+- On Cloud Run (and GKE / Cloud Functions) a batch is one write of JSON
+  lines to stdout, which the platform ingests as structured logs. Elsewhere
+  batches go to the Cloud Logging API; if a write fails the batch is written
+  to stdout instead and the API is retried after `retry_after` seconds.
+
+Records keep the shape the log-based metrics expect: `json_fields` are merged
+at the top level of `jsonPayload` next to `message` and `severity`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Optional
+
+QUEUE_MAXSIZE = int(os.environ.get("LOG_QUEUE_MAXSIZE", "10000"))
+BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", "200"))
+FLUSH_SECONDS = float(os.environ.get("LOG_FLUSH_SECONDS", "1"))
+SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.1"))
+
+# Resource types whose platform ingests JSON lines written to stdout.
+_STDOUT_RESOURCES = ("cloud_run_revision", "k8s_container", "cloud_function")
+
+_STOP = object()
+
+
+def to_entry(record: logging.LogRecord) -> dict[str, Any]:
+    """Structured payload of a record: message, severity and json_fields."""
+    message = record.getMessage()
+    if record.exc_info:
+        message = f"{message}\n{''.join(traceback.format_exception(*record.exc_info))}"
+    entry: dict[str, Any] = {
+        "message": message,
+        "severity": record.levelname,
+        "logger": record.name,
+        "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+    }
+    fields = getattr(record, "json_fields", None)
+    if fields:
+        entry.update(fields)
+    return entry
+
+
+class StdoutSink:
+    def __init__(self, stream: Any = None) -> None:
+        # sys.__stdout__ so redirected stdout (e.g. by test runners) does not
+        # swallow the logs.
+        self._stream = stream or sys.__stdout__
+
+    def write(self, entries: list[dict[str, Any]]) -> None:
+        lines = [json.dumps(entry, ensure_ascii=False, default=str) for entry in entries]
+        self._stream.write("\n".join(lines) + "\n")
+        self._stream.flush()
+
+
+class CloudLoggingSink:
+    def __init__(
+        self, client: Any, log_name: str = "agentes-ia-log", resource: Any = None
+    ) -> None:
+        self._logger = client.logger(log_name)
+        self._resource = resource
+
+    def write(self, entries: list[dict[str, Any]]) -> None:
+        batch = self._logger.batch()
+        for entry in entries:
+            payload = dict(entry)
+            severity = payload.pop("severity")
+            batch.log_struct(payload, severity=severity, resource=self._resource)
+        batch.commit()
+
+
+class BatchingHandler(logging.Handler):
+    def __init__(
+        self,
+        sink: Any,
+        fallback: Optional[Any] = None,
+        maxsize: int = QUEUE_MAXSIZE,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_SECONDS,
+        low_value: Iterable[str] = (),
+        sample_rate: float = SAMPLE_RATE,
+        high_water: float = 0.5,
+        retry_after: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sampler: Callable[[], float] = random.random,
+    ) -> None:
+        super().__init__()
+        self._sink = sink
+        self._fallback = fallback
+        # SimpleQueue is the cheapest queue to put into; the bound is
+        # enforced in emit() from qsize().
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._maxsize = maxsize
+        # Records queued or being written; flush() waits for it to reach 0.
+        # Counted before the put, so a record the writer has just taken is
+        # never missed. The lock also guards the counters below.
+        self._unfinished = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._high_water = max(1, int(maxsize * high_water))
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._low_value = frozenset(low_value)
+        self._sample_rate = sample_rate
+        self._retry_after = retry_after
+        self._clock = clock
+        self._sampler = sampler
+        self._sink_down_until = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.fallbacks = 0
+        self.batches = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.levelno < logging.WARNING:
+            depth = self._queue.qsize()
+            if depth >= self._maxsize:
+                with self._lock:
+                    self.dropped += 1
+                return
+            if (
+                depth >= self._high_water
+                and record.msg in self._low_value
+                and self._sampler() >= self._sample_rate
+            ):
+                with self._lock:
+                    self.sampled_out += 1
+                return
+        with self._lock:
+            self._unfinished += 1
+        self._queue.put(record)
+        if self._thread is None:
+            self._start()
+
+    def _start(self) -> None:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is _STOP:
+                return
+            batch = [record]
+            deadline = self._clock() + self._flush_interval
+            stop = False
+            while len(batch) < self._batch_size:
+                remaining = deadline - self._clock()
+                try:
+                    record = (
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                    break
+                batch.append(record)
+            try:
+                self._write(batch)
+            finally:
+                with self._idle:
+                    self._unfinished -= len(batch)
+                    if not self._unfinished:
+                        self._idle.notify_all()
+            if stop:
+                return
+
+    def _write(self, records: list[logging.LogRecord]) -> None:
+        entries = []
+        for record in records:
+            try:
+                entries.append(to_entry(record))
+            except Exception:
+                self.handleError(record)
+        if not entries:
+            return
+
+        with self._lock:
+            self.batches += 1
+        sink = self._sink
+        if self._fallback is not None and self._clock() < self._sink_down_until:
+            sink = self._fallback
+        try:
+            sink.write(entries)
+        except Exception as exc:
+            if self._fallback is None or sink is self._fallback:
+                with self._lock:
+                    self.dropped += len(entries)
+                sys.__stderr__.write(f"Dropping {len(entries)} log records: {exc}\n")
+                return
+            self._sink_down_until = self._clock() + self._retry_after
+            with self._lock:
+                self.fallbacks += 1
+            try:
+                self._fallback.write(entries)
+            except Exception:
+                with self._lock:
+                    self.dropped += len(entries)
+                return
+        with self._lock:
+            self.written += len(entries)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait (up to `timeout` seconds) until every queued record is written."""
+        if self._thread is None:
+            return
+        with self._idle:
+            self._idle.wait_for(lambda: not self._unfinished, timeout)
+
+    def close(self) -> None:
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout=5.0)
+        self._thread = None
+        super().close()
+
+    def stats(self) -> dict[str, int]:
+        """Counters published as gauges by the `/metrics` collectors."""
+        return {
+            "logging_queue_depth": self._queue.qsize(),
+            "logging_written": self.written,
+            "logging_batches": self.batches,
+            "logging_dropped": self.dropped,
+            "logging_sampled_out": self.sampled_out,
+            "logging_fallbacks": self.fallbacks,
+        }
+
+
+def setup_logging(
+    client: Any,
+    log_name: str = "agentes-ia-log",
+    low_value: Iterable[str] = (),
+    level: int = logging.INFO,
+) -> BatchingHandler:
+    """
+    Replacement for `client.setup_logging()`: attach a `BatchingHandler` to
+    the root logger and return it.
+    """
+    from google.cloud.logging_v2.handlers._monitored_resources import detect_resource
+    from google.cloud.logging_v2.handlers.handlers import EXCLUDED_LOGGER_DEFAULTS
+
+    resource = detect_resource(client.project)
+    if resource.type in _STDOUT_RESOURCES:
+        handler = BatchingHandler(StdoutSink(), low_value=low_value)
+    else:
+        handler = BatchingHandler(
+            CloudLoggingSink(client, log_name, resource),
+            fallback=StdoutSink(),
+            low_value=low_value,
+        )
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    # The Cloud Logging client logs through these; routing them back into
+    # the handler could loop.
+    for name in EXCLUDED_LOGGER_DEFAULTS:
+        excluded = logging.getLogger(name)
+        excluded.propagate = False
+        excluded.addHandler(logging.StreamHandler())
+    return handler
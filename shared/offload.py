@@ -0,0 +1,83 @@
+"""
+Bounded offload of blocking calls from the event loop.
+
+The Google Cloud clients used by the services (Firestore, Secret Manager) are
+synchronous. Calling them from an `async def` handler blocks the event loop,
+so every other request on the instance waits behind that network round trip.
+`BlockingExecutor.run()` runs such calls on a dedicated thread pool and awaits
+the result instead:
+
+    blocking = BlockingExecutor(max_workers=32)
+    tenant = await blocking.run(tenant_cache.get, tenant_id)
+
+The pool is bounded so a burst of cache misses cannot open an unbounded number
+of concurrent Firestore calls; calls beyond `max_workers` wait in the pool's
+queue while the event loop keeps serving requests that need no I/O.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class BlockingExecutor:
+    def __init__(self, max_workers: int = 32, name: str = "blocking") -> None:
+        if max_workers <= 0:
+            raise ValueError("max_workers must be positive")
+        self.max_workers = max_workers
+        self._name = name
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.peak = 0
+        self.completed = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=self._name
+                    )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run `func(*args, **kwargs)` on the pool and return its result. Like
+        `asyncio.to_thread()`, the call sees the caller's context variables.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        with self._lock:
+            self.pending += 1
+            self.peak = max(self.peak, self.pending)
+        try:
+            return await loop.run_in_executor(
+                self._pool(), functools.partial(context.run, func, *args, **kwargs)
+            )
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    def stats(self) -> dict[str, int]:
+        """Counters published as gauges by the `/metrics` collectors."""
+        with self._lock:
+            return {
+                f"{self._name}_pending": self.pending,
+                f"{self._name}_peak": self.peak,
+                f"{self._name}_completed": self.completed,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
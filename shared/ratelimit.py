@@ -0,0 +1,197 @@
+"""
+Outbound rate limiting for the Graph API.
+
+WhatsApp Cloud API limits throughput per business phone number (`phone_id`,
+80 messages/s by default, higher on upgraded numbers) and per recipient (the
+"pair rate limit", about one message every 6 seconds with short bursts
+tolerated). `RateLimiter` keeps a token bucket for each phone number and one
+for each (phone number, recipient) pair, and makes a send wait until both
+have a token instead of failing it:
+
+    delay, scope = await limiter.acquire(phone_id, recipient)
+
+Buckets use virtual scheduling (GCRA): each bucket only stores the time its
+next token is due, and a send books the first free slot and advances it.
+Sends over the limit therefore queue in arrival order, each sleeping until
+its own slot, and a burst drains at exactly the configured rate. A bucket
+that has refilled holds no state worth keeping, so recipient buckets are kept
+in an LRU map of at most `max_recipients` entries.
+
+A send that would have to wait longer than `max_wait` seconds is rejected
+with `RateLimitExceeded` (and books nothing: a recipient slot booked before
+the phone number rejected the send is given back), so a flood cannot queue
+work indefinitely. A send cancelled while waiting gives its slots back too.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Rate limit exceeded; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` available at once."""
+
+    __slots__ = ("rate", "burst", "interval", "tolerance", "due")
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.due = 0.0
+        self.configure(rate, burst)
+
+    def configure(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1) * self.interval
+
+    def earliest(self, now: float) -> float:
+        """First instant at or after `now` with a token available."""
+        return max(now, self.due - self.tolerance)
+
+    def take(self, at: float) -> None:
+        """Consume the token at `at` (which must not precede `earliest()`)."""
+        self.due = max(self.due, at) + self.interval
+
+    def refund(self) -> None:
+        """Give back a token taken by `take()` that was not used."""
+        self.due -= self.interval
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        phone_rate: float = 80.0,
+        phone_burst: int = 1,
+        recipient_rate: float = 1 / 6,
+        recipient_burst: int = 10,
+        max_wait: Optional[float] = 60.0,
+        max_recipients: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> None:
+        if max_recipients <= 0:
+            raise ValueError("max_recipients must be positive")
+        self._phone_rate = phone_rate
+        self._phone_burst = phone_burst
+        self._recipient_rate = recipient_rate
+        self._recipient_burst = recipient_burst
+        self._max_wait = max_wait
+        self._max_recipients = max_recipients
+        self._clock = clock
+        self._sleep = sleep
+        self._phones: dict[str, TokenBucket] = {}
+        self._recipients: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        self.granted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+
+    def _phone_bucket(
+        self, phone_id: str, rate: Optional[float], burst: Optional[int]
+    ) -> TokenBucket:
+        rate = rate or self._phone_rate
+        burst = burst or self._phone_burst
+        bucket = self._phones.get(phone_id)
+        if bucket is None:
+            bucket = self._phones[phone_id] = TokenBucket(rate, burst)
+        elif (bucket.rate, bucket.burst) != (rate, burst):
+            # The tenant's limit changed (e.g. the number moved to a higher tier).
+            bucket.configure(rate, burst)
+        return bucket
+
+    def _recipient_bucket(self, key: tuple[str, str]) -> TokenBucket:
+        recipients = self._recipients
+        bucket = recipients.get(key)
+        if bucket is not None:
+            recipients.move_to_end(key)
+            return bucket
+        bucket = recipients[key] = TokenBucket(self._recipient_rate, self._recipient_burst)
+        while len(recipients) > self._max_recipients:
+            # The least recently used pair has almost always refilled already.
+            recipients.popitem(last=False)
+        return bucket
+
+    def _book(self, bucket: TokenBucket) -> float:
+        now = self._clock()
+        at = bucket.earliest(now)
+        delay = at - now
+        if self._max_wait is not None and delay > self._max_wait:
+            self.rejected += 1
+            raise RateLimitExceeded(delay)
+        bucket.take(at)
+        return max(0.0, delay)
+
+    async def _wait(self, delay: float) -> None:
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await self._sleep(delay)
+        finally:
+            self.waiting -= 1
+
+    async def acquire(
+        self,
+        phone_id: str,
+        recipient: str,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+    ) -> tuple[float, str]:
+        """
+        Wait until the recipient and then the phone number allow a send.
+
+        Return `(waited, scope)`: the seconds waited and which limit caused
+        most of it (`"phone"`, `"recipient"` or `""` when there was no wait).
+        `rate` and `burst` override the phone number's defaults. Raise
+        RateLimitExceeded if either wait would exceed `max_wait`.
+
+        The phone slot is only booked once the recipient allows the send, so
+        a throttled recipient never holds back other recipients.
+        """
+        pair_bucket = self._recipient_bucket((phone_id, recipient))
+        pair_delay = self._book(pair_bucket)
+        try:
+            if pair_delay:
+                await self._wait(pair_delay)
+            phone_bucket = self._phone_bucket(phone_id, rate, burst)
+            phone_delay = self._book(phone_bucket)
+        except BaseException:
+            # Rejected by the phone number (or cancelled) before sending.
+            pair_bucket.refund()
+            raise
+        if phone_delay:
+            try:
+                await self._wait(phone_delay)
+            except asyncio.CancelledError:
+                # Cancelled while waiting for the phone number: the send will
+                # not happen, so neither slot is used.
+                phone_bucket.refund()
+                pair_bucket.refund()
+                raise
+        self.granted += 1
+        if not (pair_delay or phone_delay):
+            return 0.0, ""
+        self.delayed += 1
+        return pair_delay + phone_delay, "phone" if phone_delay >= pair_delay else "recipient"
+
+    def stats(self) -> dict[str, Any]:
+        """Counters published as gauges by the `/metrics` collectors."""
+        return {
+            "ratelimit_granted": self.granted,
+            "ratelimit_delayed": self.delayed,
+            "ratelimit_rejected": self.rejected,
+            "ratelimit_waiting": self.waiting,
+            "ratelimit_peak_waiting": self.peak_waiting,
+            "ratelimit_phones": len(self._phones),
+            "ratelimit_recipients": len(self._recipients),
+        }
@@ -0,0 +1,162 @@
+"""
+Cached access to Secret Manager.
+
+`SecretProvider` keeps a single long-lived `SecretManagerServiceClient` per
+process and caches decoded secret payloads in memory:
+
+- Entries are served from memory for `ttl` seconds.
+- Once an entry is older than `refresh_after` seconds it is still served, but a
+  background refresh is started so callers never wait on Secret Manager for a
+  secret they already have.
+- Concurrent misses for the same secret are coalesced: the first caller fetches
+  it and everybody else waits for that result, so a burst of requests triggers
+  at most one `access_secret_version` call.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+DEFAULT_PROJECT = os.environ.get("GCP_PROJECT", "agentes-ia-dev")
+
+
+def secret_version_name(
+    secret_id: str, project: str = DEFAULT_PROJECT, version: str = "latest"
+) -> str:
+    return f"projects/{project}/secrets/{secret_id}/versions/{version}"
+
+
+def _default_client_factory() -> Any:
+    from google.cloud import secretmanager
+
+    return secretmanager.SecretManagerServiceClient()
+
+
+@dataclass
+class _Entry:
+    value: str
+    fetched_at: float
+
+
+class SecretProvider:
+    def __init__(
+        self,
+        client_factory: Callable[[], Any] = _default_client_factory,
+        project: str = DEFAULT_PROJECT,
+        ttl: float = 600.0,
+        refresh_after: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._client_factory = client_factory
+        self._client: Any = None
+        self.project = project
+        self._ttl = ttl
+        self._refresh_after = ttl * 0.8 if refresh_after is None else refresh_after
+        self._clock = clock
+        self._entries: dict[str, _Entry] = {}
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        self.fetches = 0
+        self.hits = 0
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def get(self, secret_id: str, version: str = "latest") -> str:
+        """Return the decoded payload of `secret_id` in the provider's project."""
+        name = secret_version_name(secret_id, self.project, version)
+        with self._lock:
+            value = self._cached(name)
+            if value is not None:
+                return value
+            future = self._inflight.get(name)
+            owner = future is None
+            if owner:
+                future = self._inflight[name] = Future()
+
+        if owner:
+            self._fetch(name, future)
+        return future.result()
+
+    def cached(self, secret_id: str, version: str = "latest") -> Optional[str]:
+        """Like `get()`, but return None instead of calling Secret Manager."""
+        with self._lock:
+            return self._cached(secret_version_name(secret_id, self.project, version))
+
+    def _cached(self, name: str) -> Optional[str]:
+        # Called with the lock held.
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        age = self._clock() - entry.fetched_at
+        if age >= self._ttl:
+            return None
+        self.hits += 1
+        if age >= self._refresh_after:
+            self._refresh_in_background(name)
+        return entry.value
+
+    def invalidate(self, secret_id: Optional[str] = None, version: str = "latest") -> None:
+        with self._lock:
+            if secret_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(secret_version_name(secret_id, self.project, version), None)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "secrets_cached": len(self._entries),
+                "secrets_hits": self.hits,
+                "secrets_fetches": self.fetches,
+            }
+
+    def close(self) -> None:
+        if self._refresher is not None:
+            self._refresher.shutdown(wait=False)
+            self._refresher = None
+
+    def _refresh_in_background(self, name: str) -> None:
+        # Called with the lock held.
+        if name in self._inflight:
+            return
+        future: Future = Future()
+        self._inflight[name] = future
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="secret-refresh"
+            )
+        # A failed refresh is logged and the cached value keeps being served
+        # until it expires.
+        self._refresher.submit(self._fetch, name, future)
+
+    def _fetch(self, name: str, future: Future) -> None:
+        try:
+            response = self.client.access_secret_version(request={"name": name})
+            value = response.payload.data.decode("UTF-8")
+        except Exception as exc:
+            logger.warning("Secret Manager fetch failed for %s: %s", name, exc)
+            with self._lock:
+                self._inflight.pop(name, None)
+            future.set_exception(exc)
+            return
+
+        with self._lock:
+            self.fetches += 1
+            self._entries[name] = _Entry(value, self._clock())
+            self._inflight.pop(name, None)
+        future.set_result(value)
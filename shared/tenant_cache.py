@@ -0,0 +1,152 @@
+"""
+Process-wide cache for tenant documents.
+
+Every webhook delivery needs the tenant configuration stored in Firestore
+(`tenants/{tenant}`). The cache keeps those documents in memory so that the
+steady state of the webhook never touches Firestore:
+
+- Bounded LRU: at most `maxsize` tenants are kept; the least recently used
+  entry is evicted first.
+- TTL: entries expire after `ttl` seconds and are reloaded on the next access.
+- Negative caching: unknown tenants are remembered for `negative_ttl` seconds
+  so that scans against random tenant keys do not hammer Firestore.
+- Optional snapshot listener: `watch()` subscribes to the `tenants`
+  collection and refreshes entries as soon as Firestore reports a change.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("agentes-ia-log")
+
+TenantLoader = Callable[[str], Optional[dict[str, Any]]]
+
+# Sentinel stored for tenants that do not exist.
+_MISSING = object()
+
+
+class TenantCache:
+    def __init__(
+        self,
+        loader: TenantLoader,
+        maxsize: int = 256,
+        ttl: float = 300.0,
+        negative_ttl: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self._loader = loader
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._watch = None
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, tenant: str) -> Optional[dict[str, Any]]:
+        """Return the tenant document, or None if the tenant does not exist."""
+        found, value = self.cached(tenant)
+        if found:
+            return value
+        with self._lock:
+            self.misses += 1
+
+        # Load outside the lock so a slow Firestore read does not block
+        # lookups for other tenants.
+        value = self._loader(tenant)
+        self.put(tenant, value)
+        return value
+
+    def cached(self, tenant: str) -> tuple[bool, Optional[dict[str, Any]]]:
+        """
+        Look the tenant up in memory only: `(True, document)` on a hit (the
+        document is None for a known-missing tenant), `(False, None)` when
+        `get()` would have to call the loader.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(tenant)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[tenant]
+                self.expirations += 1
+                return False, None
+            self._entries.move_to_end(tenant)
+            if value is _MISSING:
+                self.negative_hits += 1
+                return True, None
+            self.hits += 1
+            return True, value
+
+    def put(self, tenant: str, value: Optional[dict[str, Any]]) -> None:
+        """Store a tenant document; None records the tenant as missing."""
+        if value is None:
+            stored, ttl = _MISSING, self._negative_ttl
+        else:
+            stored, ttl = value, self._ttl
+        with self._lock:
+            self._entries[tenant] = (self._clock() + ttl, stored)
+            self._entries.move_to_end(tenant)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, tenant: Optional[str] = None) -> None:
+        """Drop one tenant, or every tenant when called without arguments."""
+        with self._lock:
+            if tenant is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(tenant, None)
+
+    def stats(self) -> dict[str, int]:
+        """Counters published as gauges by the `/metrics` collectors."""
+        with self._lock:
+            return {
+                "tenant_cache_size": len(self._entries),
+                "tenant_cache_hits": self.hits,
+                "tenant_cache_misses": self.misses,
+                "tenant_cache_negative_hits": self.negative_hits,
+                "tenant_cache_evictions": self.evictions,
+                "tenant_cache_expirations": self.expirations,
+            }
+
+    def watch(self, collection) -> None:
+        """
+        Keep the cache in sync with a Firestore collection reference.
+
+        The initial snapshot warms the cache with every existing tenant; later
+        snapshots update or remove the affected entries in place.
+        """
+        if self._watch is not None:
+            return
+
+        def on_snapshot(_docs, changes, _read_time) -> None:
+            for change in changes:
+                document = change.document
+                if change.type.name == "REMOVED":
+                    self.put(document.id, None)
+                else:
+                    self.put(document.id, document.to_dict())
+
+        self._watch = collection.on_snapshot(on_snapshot)
+        logger.info("Tenant cache listening for Firestore changes.")
+
+    def close(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
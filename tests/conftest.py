@@ -0,0 +1,96 @@
+import importlib.util
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# Service directories are not packages (their names contain dashes), so make
+# their helper modules importable the same way they are inside the container.
+for service in ("whatsapp-webhook", "dispatcher", "llm-orchestrator", "tenants-admin"):
+    path = str(ROOT / "agentes-ia" / service)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+SECRET = "app-secret"
+TENANTS = {
+    "bumeran": {
+        "phone_id": "1",
+        "secrets": {"meta_app_secret": "app", "verify_token": "verify", "meta_token": "t"},
+    }
+}
+
+
+class FakeLoggingClient:
+    project = "agentes-ia-test"
+
+
+class Snapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+class FakeFirestore:
+    def collection(self, name):
+        return self
+
+    def document(self, tenant):
+        self._tenant = tenant
+        return self
+
+    def get(self):
+        return Snapshot(TENANTS.get(self._tenant))
+
+
+class FakeSecretManager:
+    def access_secret_version(self, request):
+        return type("Version", (), {"payload": type("Payload", (), {"data": SECRET.encode()})})
+
+
+@pytest.fixture
+def load_service(monkeypatch, tmp_path):
+    """
+    Import a service's main.py as a fresh module, with fake Firestore, Secret
+    Manager and Cloud Logging clients. Every secret is `SECRET`.
+    """
+    import google.cloud.logging
+
+    from shared import clients, metrics
+
+    monkeypatch.setattr(google.cloud.logging, "Client", FakeLoggingClient)
+    # Cloud Run: logs go to stdout instead of the Cloud Logging API.
+    for name in ("K_SERVICE", "K_REVISION", "K_CONFIGURATION"):
+        monkeypatch.setenv(name, "agentes-ia")
+    monkeypatch.setenv("PROVIDERS_DIR", str(tmp_path / "providers"))
+    registry = clients.ClientRegistry()
+    registry.register("firestore", FakeFirestore)
+    registry.register("secretmanager", FakeSecretManager)
+    monkeypatch.setattr(clients, "registry", registry)
+    handlers = list(logging.getLogger().handlers)
+    # Services register their collectors at import; drop them afterwards so a
+    # later scrape does not call into a service (or database) that is gone.
+    monkeypatch.setattr(metrics.registry, "_collectors", list(metrics.registry._collectors))
+
+    def load(service):
+        spec = importlib.util.spec_from_file_location(
+            f"{service.replace('-', '_')}_main", ROOT / "agentes-ia" / service / "main.py"
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    yield load
+    for handler in list(logging.getLogger().handlers):
+        if handler not in handlers:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
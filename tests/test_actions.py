@@ -0,0 +1,259 @@
+import asyncio
+import json
+
+import httpx
+
+from shared.actions import (
+    ActionPipeline,
+    DispatcherPublisher,
+    EmbeddedDispatcher,
+    OrchestratorDelegate,
+)
+
+
+class FakeSink:
+    mode = "fake"
+
+    def __init__(self, fail=0, delay=0.0):
+        self.batches = []
+        self.fail = fail
+        self.delay = delay
+        self.closed = False
+
+    async def deliver(self, actions):
+        self.batches.append(actions)
+        await asyncio.sleep(self.delay)
+        return self.fail
+
+    async def close(self):
+        self.closed = True
+
+
+def action(to="57300", message="Hola"):
+    return {"to": to, "type": "text", "message": message, "next": "await_intent"}
+
+
+def test_pipeline_batches_submitted_actions_and_tags_tenant():
+    sink = FakeSink()
+    pipeline = ActionPipeline(sink, batch_size=10, linger=0.01)
+
+    async def run():
+        await pipeline.start()
+        pipeline.submit("bumeran", [action("1"), action("2")])
+        pipeline.submit("otro", [action("3")])
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+    assert len(sink.batches) == 1
+    assert [(item["tenant"], item["to"]) for item in sink.batches[0]] == [
+        ("bumeran", "1"),
+        ("bumeran", "2"),
+        ("otro", "3"),
+    ]
+    assert sink.closed
+    stats = pipeline.stats()
+    assert stats["actions_submitted"] == 3
+    assert stats["actions_delivered"] == 3
+    assert stats["actions_batches"] == 1
+
+
+def test_pipeline_splits_batches_and_counts_failures():
+    sink = FakeSink(fail=1)
+    pipeline = ActionPipeline(sink, batch_size=2, linger=0.01)
+
+    async def run():
+        await pipeline.start()
+        pipeline.submit("bumeran", [action(str(index)) for index in range(5)])
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+    assert [len(batch) for batch in sink.batches] == [2, 2, 1]
+    assert pipeline.stats()["actions_failed"] == 3
+    assert pipeline.stats()["actions_delivered"] == 2
+
+
+def test_pipeline_drops_actions_when_full():
+    sink = FakeSink(delay=0.05)
+    pipeline = ActionPipeline(sink, batch_size=1, maxsize=2, max_batches=1)
+
+    async def run():
+        await pipeline.start()
+        pipeline.submit("bumeran", [action(str(index)) for index in range(5)])
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+    stats = pipeline.stats()
+    assert stats["actions_dropped"] == 3
+    assert stats["actions_delivered"] == 2
+
+
+def test_pipeline_coalesces_a_burst_from_the_same_sender():
+    sink = FakeSink()
+    pipeline = ActionPipeline(sink, linger=0.001, coalesce_window=0.05)
+    llm = {"to": "1", "type": "text", "message": "ack", "next": "delegate_to_llm"}
+
+    async def run():
+        await pipeline.start()
+        pipeline.submit("bumeran", [{**action("1"), "text": "buenas"}, action("2")])
+        await asyncio.sleep(0.02)
+        pipeline.submit("bumeran", [{**action("1"), "text": "?"}, {**llm, "text": "hola"}])
+        await asyncio.sleep(0.02)
+        # Still inside the window: it restarted with the last message.
+        pipeline.submit("bumeran", [action("1"), {**llm, "text": "quiero info"}])
+        assert sink.batches == []
+        await asyncio.sleep(0.1)
+        assert pipeline.stats()["actions_held_senders"] == 0
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+    delivered = [item for batch in sink.batches for item in batch]
+    # Sender 2 wrote once, so its window closed first.
+    assert [(item["to"], item["next"]) for item in delivered] == [
+        ("2", "await_intent"),
+        ("1", "await_intent"),
+        ("1", "delegate_to_llm"),
+    ]
+    assert delivered[1]["text"] == "buenas\n?"
+    assert delivered[2]["text"] == "hola\nquiero info"
+    assert pipeline.stats()["actions_coalesced"] == 3
+    assert pipeline.stats()["actions_delivered"] == 3
+
+
+def test_pipeline_coalescing_is_capped_and_flushed_on_stop():
+    sink = FakeSink()
+    pipeline = ActionPipeline(
+        sink, linger=0.001, coalesce_window=0.05, coalesce_max_delay=0.08
+    )
+
+    async def run():
+        await pipeline.start()
+        # A sender that keeps writing is answered once the cap is reached.
+        for _ in range(6):
+            pipeline.submit("bumeran", [action("1")])
+            await asyncio.sleep(0.02)
+        assert len(sink.batches) == 1
+        pipeline.submit("bumeran", [action("2")])
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+    assert [[item["to"] for item in batch] for batch in sink.batches] == [["1"], ["1", "2"]]
+
+
+def test_pipeline_hands_a_coalesced_turn_to_the_orchestrator():
+    sink = FakeSink()
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        if requests[-1]["sender"] == "2":
+            return httpx.Response(503)
+        return httpx.Response(200, json={"response": "Claro, te ayudo."})
+
+    delegate = OrchestratorDelegate(
+        "https://llm.test/", "gemini-1.5-pro", transport=httpx.MockTransport(handler)
+    )
+    pipeline = ActionPipeline(sink, linger=0.001, coalesce_window=0.02, delegate=delegate)
+    llm = {"to": "1", "type": "text", "message": "ack", "next": "delegate_to_llm"}
+
+    async def run():
+        await pipeline.start()
+        pipeline.submit("bumeran", [{**llm, "text": "hola"}])
+        pipeline.submit("bumeran", [{**llm, "text": "quiero info"}])
+        pipeline.submit("bumeran", [{**llm, "to": "2", "text": "hola"}, action("3")])
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+    assert sorted(requests, key=lambda request: request["sender"]) == [
+        {"tenant": "bumeran", "model": "gemini-1.5-pro", "prompt": "hola\nquiero info",
+         "sender": "1"},
+        {"tenant": "bumeran", "model": "gemini-1.5-pro", "prompt": "hola", "sender": "2"},
+    ]
+    delivered = [item for batch in sink.batches for item in batch]
+    assert delivered[-1] == {
+        "tenant": "bumeran",
+        "to": "1",
+        "type": "text",
+        "message": "Claro, te ayudo.",
+        "next": "llm_reply",
+    }
+    stats = pipeline.stats()
+    assert stats["actions_delegated"] == 1
+    assert stats["actions_delegate_failures"] == 1
+    assert stats["actions_delivered"] == 4
+
+
+class FakeGraph:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def send_text(self, phone_id, token, to, body):
+        if to == "fail":
+            raise RuntimeError("Graph API down")
+        self.sent.append((phone_id, token, to, body))
+
+    async def close(self):
+        self.closed = True
+
+
+def test_embedded_dispatcher_sends_with_tenant_credentials():
+    graph = FakeGraph()
+
+    async def credentials(tenant):
+        return f"{tenant}-phone", f"{tenant}-token"
+
+    dispatcher = EmbeddedDispatcher(graph, credentials)
+
+    async def run():
+        failed = await dispatcher.deliver(
+            [
+                {"tenant": "bumeran", **action("57300", "Hola")},
+                {"tenant": "bumeran", **action("fail")},
+            ]
+        )
+        await dispatcher.close()
+        return failed
+
+    assert asyncio.run(run()) == 1
+    assert graph.sent == [("bumeran-phone", "bumeran-token", "57300", "Hola")]
+    assert graph.closed
+
+
+def test_publisher_posts_batches_to_the_dispatcher():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"status": "success", "sent": 1, "failed": 1})
+
+    publisher = DispatcherPublisher(
+        "https://dispatcher.test/", transport=httpx.MockTransport(handler)
+    )
+    actions = [{"tenant": "bumeran", **action("1")}, {"tenant": "bumeran", **action("2")}]
+
+    async def run():
+        failed = await publisher.deliver(actions)
+        await publisher.close()
+        return failed
+
+    assert asyncio.run(run()) == 1
+    assert str(requests[0].url) == "https://dispatcher.test/send/actions"
+    assert json.loads(requests[0].content) == {"actions": actions}
+
+
+def test_publisher_counts_the_batch_as_failed_when_the_dispatcher_is_down():
+    publisher = DispatcherPublisher(
+        "https://dispatcher.test",
+        transport=httpx.MockTransport(lambda request: httpx.Response(503)),
+    )
+
+    async def run():
+        return await publisher.deliver([action("1"), action("2")])
+
+    assert asyncio.run(run()) == 2
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from batch import fan_out, invalid_recipients, recipient_template
+
+
+def collect(items, handle, concurrency):
+    async def run():
+        return [result async for result in fan_out(items, handle, concurrency)]
+
+    return asyncio.run(run())
+
+
+def test_fan_out_bounds_concurrency_and_returns_every_result():
+    active = 0
+    peak = 0
+
+    async def handle(item):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.001 * (item % 3))
+        active -= 1
+        return item * 2
+
+    results = collect(range(100), handle, concurrency=8)
+
+    assert sorted(results) == [item * 2 for item in range(100)]
+    assert peak == 8
+
+
+def test_fan_out_yields_results_as_they_complete():
+    async def handle(item):
+        await asyncio.sleep(0.02 if item == 0 else 0)
+        return item
+
+    assert collect(range(3), handle, concurrency=3) == [1, 2, 0]
+
+
+def test_fan_out_raises_handler_errors_and_stops_workers():
+    started = []
+
+    async def handle(item):
+        started.append(item)
+        if item == 2:
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.01)
+        return item
+
+    with pytest.raises(RuntimeError, match="boom"):
+        collect(range(1000), handle, concurrency=4)
+    assert len(started) < 1000
+
+
+def test_closing_the_stream_cancels_workers():
+    started = []
+    cancelled = []
+
+    async def handle(item):
+        started.append(item)
+        try:
+            await asyncio.sleep(0 if item == 0 else 10)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+        return item
+
+    async def run():
+        stream = fan_out(range(10), handle, concurrency=4)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(run()) == 0
+    assert sorted(cancelled) == sorted(started[1:])
+
+
+def test_closing_early_with_a_full_buffer_does_not_hang():
+    async def handle(item):
+        return item
+
+    async def run():
+        stream = fan_out(range(100), handle, concurrency=1)
+        first = await stream.__anext__()
+        # Let the worker fill the buffer and block on it.
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(stream.aclose(), timeout=1)
+        return first
+
+    assert asyncio.run(run()) == 0
+
+
+def test_fan_out_with_no_items():
+    async def handle(item):
+        return item
+
+    assert collect([], handle, concurrency=4) == []
+
+
+def test_recipient_template_parameters():
+    template = {"name": "reapertura_bumeran", "language": "es"}
+    assert recipient_template(template, {"phone_number": "57300"}) is template
+    assert recipient_template(template, {"parameters": ["Ana", 3]})["components"] == [
+        {
+            "type": "body",
+            "parameters": [{"type": "text", "text": "Ana"}, {"type": "text", "text": "3"}],
+        }
+    ]
+    header = [{"type": "header", "parameters": []}]
+    assert recipient_template(template, {"components": header})["components"] == header
+    assert "components" not in template
+
+
+def test_invalid_recipients():
+    assert invalid_recipients(["57300", {"phone_number": "57301", "parameters": ["Ana"]}]) == []
+    assert invalid_recipients(["57300", 57301, {"parameters": ["Ana"]}, None]) == [1, 2, 3]
+    assert invalid_recipients("57300") == [-1]
@@ -0,0 +1,33 @@
+import pytest
+
+from bloom import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(1000)
+    numbers = [str(573000000000 + index) for index in range(1000)]
+    bloom.update(numbers)
+    assert all(number in bloom for number in numbers)
+
+
+def test_false_positive_rate_is_close_to_target():
+    bloom = BloomFilter(10_000, false_positive_rate=0.01)
+    bloom.update(str(573000000000 + index) for index in range(10_000))
+    probes = [str(574000000000 + index) for index in range(20_000)]
+    false_positives = sum(probe in bloom for probe in probes)
+    assert false_positives / len(probes) < 0.03
+
+
+def test_saturation_and_size():
+    bloom = BloomFilter(10)
+    bloom.update(str(index) for index in range(11))
+    assert bloom.saturated
+    # ~9.6 bits per entry at 1%.
+    assert BloomFilter(1_000_000).nbytes < 1_300_000
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        BloomFilter(0)
+    with pytest.raises(ValueError):
+        BloomFilter(10, false_positive_rate=1.5)
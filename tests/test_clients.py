@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+from shared.clients import ClientRegistry
+from shared import clients
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_client_is_created_once():
+    created = []
+    registry = ClientRegistry()
+    registry.register("fake", lambda: created.append(FakeClient()) or created[-1])
+    assert registry.get("fake") is registry.get("fake")
+    assert len(created) == 1
+
+
+def test_close_closes_and_forgets_clients():
+    registry = ClientRegistry()
+    registry.register("fake", FakeClient)
+    first = registry.get("fake")
+    registry.close()
+    assert first.closed
+    assert registry.get("fake") is not first
+
+
+def test_lifespan_warms_and_closes(monkeypatch):
+    registry = ClientRegistry()
+    registry.register("fake", FakeClient)
+    monkeypatch.setattr(clients, "registry", registry)
+    app = SimpleNamespace(state=SimpleNamespace())
+    seen = []
+
+    async def run():
+        async with clients.lifespan("fake", startup=seen.append)(app):
+            seen.append(registry.get("fake"))
+
+    asyncio.run(run())
+    assert seen[0] is app
+    assert app.state.clients is registry
+    assert seen[1].closed
@@ -0,0 +1,140 @@
+from conversations import Conversation, ConversationStore
+
+
+def words(text):
+    return len(text.split())
+
+
+def test_prompt_carries_summary_and_recent_turns():
+    store = ConversationStore(count_tokens=words)
+    assert store.prompt("bumeran", "573", "Hola") == "Hola"
+
+    store.append("bumeran", "573", "Quiero ir a Cartagena", "¿En qué fechas?")
+    store.get("bumeran", "573").summary = "Cliente interesado en viajar."
+
+    assert store.prompt("bumeran", "573", "En julio") == (
+        "Resumen de la conversación: Cliente interesado en viajar.\n"
+        "user: Quiero ir a Cartagena\n"
+        "model: ¿En qué fechas?\n"
+        "user: En julio"
+    )
+    assert store.prompt("bumeran", "otro", "Hola") == "Hola"
+
+
+def test_old_turns_are_folded_into_the_summary_incrementally():
+    calls = []
+
+    def summarize(tenant, summary, turns):
+        calls.append((tenant, summary, [turn.text for turn in turns]))
+        return f"{summary}+{len(turns)}"
+
+    store = ConversationStore(
+        budget=10, low_water=0.5, min_turns=2, count_tokens=words, summarize=summarize
+    )
+    for index in range(6):
+        store.append("bumeran", "573", f"pregunta numero {index}", f"respuesta {index}")
+
+    conversation = store.get("bumeran", "573")
+    # Each fold only sees the turns it removes and the previous summary.
+    assert calls[0] == (
+        "bumeran",
+        "",
+        ["pregunta numero 0", "respuesta 0", "pregunta numero 1", "respuesta 1"],
+    )
+    assert calls[1][1] == "+4"
+    assert conversation.tokens <= 10
+    assert [turn.text for turn in conversation.turns][-2:] == ["pregunta numero 5", "respuesta 5"]
+    assert store.stats()["conversations_folds"] == len(calls)
+
+
+def test_without_a_summarizer_old_turns_are_dropped_and_recent_ones_kept():
+    store = ConversationStore(budget=5, min_turns=2, count_tokens=words)
+    store.append("bumeran", "573", "una pregunta bastante larga de verdad", "y una respuesta larga")
+
+    conversation = store.get("bumeran", "573")
+    # Over budget, but the last exchange is always kept.
+    assert len(conversation.turns) == 2
+    store.append("bumeran", "573", "otra", "vale")
+    assert [turn.text for turn in conversation.turns] == ["otra", "vale"]
+    assert conversation.summary == ""
+
+
+def test_token_counts_are_computed_once_per_turn():
+    counted = []
+
+    def count(text):
+        counted.append(text)
+        return words(text)
+
+    store = ConversationStore(budget=1000, count_tokens=count)
+    for index in range(5):
+        store.append("bumeran", "573", f"pregunta {index}", f"respuesta {index}")
+    assert len(counted) == 10
+
+
+def test_token_count_failures_fall_back_to_an_estimate():
+    def count(text):
+        raise RuntimeError("count_tokens unavailable")
+
+    store = ConversationStore(count_tokens=count)
+    store.append("bumeran", "573", "Hola, quiero reservar", "Claro")
+
+    assert [turn.tokens for turn in store.get("bumeran", "573").turns] == [5, 1]
+    assert store.stats()["conversations_token_count_errors"] == 2
+
+
+def test_summarizer_failures_keep_the_previous_summary():
+    def summarize(tenant, summary, turns):
+        raise RuntimeError("quota")
+
+    store = ConversationStore(budget=3, count_tokens=words, summarize=summarize)
+    store.append("bumeran", "573", "uno dos tres", "cuatro cinco")
+    store.append("bumeran", "573", "seis", "siete")
+
+    assert store.get("bumeran", "573").summary == ""
+    assert store.stats()["conversations_summarize_errors"] == 1
+
+
+class MemoryStore:
+    def __init__(self, fail=False):
+        self.saved = {}
+        self.fail = fail
+
+    def load(self, key):
+        if self.fail:
+            raise RuntimeError("firestore down")
+        data = self.saved.get(key)
+        return Conversation.from_dict(data) if data is not None else None
+
+    def save(self, key, conversation):
+        if self.fail:
+            raise RuntimeError("firestore down")
+        self.saved[key] = conversation.to_dict()
+
+
+def test_conversations_are_persisted_and_reloaded():
+    backend = MemoryStore()
+    first = ConversationStore(store=backend, count_tokens=words)
+    first.append("bumeran", "573", "Hola", "¿Cómo te ayudo?")
+
+    # A new instance (or one that evicted it) loads it from the store.
+    second = ConversationStore(store=backend, count_tokens=words)
+    turns = second.get("bumeran", "573").turns
+    assert [turn.text for turn in turns] == ["Hola", "¿Cómo te ayudo?"]
+    assert second.stats()["conversations_loaded"] == 1
+
+
+def test_store_failures_fall_back_to_memory():
+    store = ConversationStore(store=MemoryStore(fail=True), count_tokens=words)
+    store.append("bumeran", "573", "Hola", "Buenas")
+
+    assert len(store.get("bumeran", "573").turns) == 2
+    assert store.stats()["conversations_store_errors"] == 2
+
+
+def test_memory_is_bounded():
+    store = ConversationStore(maxsize=2, count_tokens=words)
+    for sender in ("1", "2", "3"):
+        store.append("bumeran", sender, "Hola", "Buenas")
+    assert store.stats()["conversations_cached"] == 2
+    assert store.prompt("bumeran", "1", "Hola") == "Hola"
@@ -0,0 +1,107 @@
+import pytest
+
+from dedup import Deduplicator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStore:
+    def __init__(self, fail=False):
+        self.claimed = set()
+        self.fail = fail
+
+    def claim(self, message_id):
+        if self.fail:
+            raise RuntimeError("store down")
+        if message_id in self.claimed:
+            return False
+        self.claimed.add(message_id)
+        return True
+
+    def release(self, message_id):
+        if self.fail:
+            raise RuntimeError("store down")
+        self.claimed.discard(message_id)
+
+
+def test_second_delivery_is_a_duplicate():
+    dedup = Deduplicator()
+    assert dedup.seen("wamid.1") is False
+    assert dedup.seen("wamid.1") is True
+    assert dedup.seen("wamid.2") is False
+    stats = dedup.stats()
+    assert stats["dedup_checked"] == 3
+    assert stats["dedup_duplicates"] == 1
+    assert stats["dedup_duplicate_rate"] == pytest.approx(1 / 3, abs=1e-4)
+
+
+def test_ids_expire_after_window():
+    clock = FakeClock()
+    dedup = Deduplicator(window=10, clock=clock)
+    dedup.seen("wamid.1")
+    clock.now = 5
+    dedup.seen("wamid.2")
+    clock.now = 11
+    assert "wamid.1" not in dedup
+    assert "wamid.2" in dedup
+    assert dedup.seen("wamid.3") is False
+    assert dedup.stats()["dedup_size"] == 2
+    assert dedup.seen("wamid.1") is False
+
+
+def test_oldest_ids_are_forgotten_past_maxsize():
+    dedup = Deduplicator(maxsize=2)
+    for message_id in ("a", "b", "c"):
+        dedup.seen(message_id)
+    assert "a" not in dedup
+    assert dedup.seen("c") is True
+
+
+def test_all_seen_records_nothing():
+    dedup = Deduplicator()
+    assert dedup.all_seen([]) is False
+    assert dedup.all_seen(["wamid.1"]) is False
+    assert dedup.stats()["dedup_checked"] == 0
+    dedup.seen("wamid.1")
+    assert dedup.all_seen(["wamid.1", "wamid.2"]) is False
+    assert dedup.all_seen(["wamid.1"]) is True
+    assert dedup.stats()["dedup_duplicates"] == 1
+
+
+def test_shared_store_catches_other_instances():
+    store = FakeStore()
+    first, second = Deduplicator(store=store), Deduplicator(store=store)
+    assert first.seen("wamid.1") is False
+    assert second.seen("wamid.1") is True
+    assert second.stats()["dedup_store_duplicates"] == 1
+    # Known locally: the store is not asked again.
+    store.claimed.clear()
+    assert first.seen("wamid.1") is True
+
+
+def test_store_failure_processes_message():
+    dedup = Deduplicator(store=FakeStore(fail=True))
+    assert dedup.seen("wamid.1") is False
+    assert dedup.stats()["dedup_store_errors"] == 1
+    assert dedup.seen("wamid.1") is True
+
+
+def test_forgotten_ids_are_processed_again():
+    store = FakeStore()
+    dedup = Deduplicator(store=store)
+    dedup.seen("wamid.1")
+    dedup.forget(["wamid.1"])
+    assert "wamid.1" not in dedup
+    assert store.claimed == set()
+    assert Deduplicator(store=store).seen("wamid.1") is False
+
+
+def test_maxsize_must_be_positive():
+    with pytest.raises(ValueError):
+        Deduplicator(maxsize=0)
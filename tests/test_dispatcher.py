@@ -0,0 +1,120 @@
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import TENANTS
+from shared.graph import GraphClient
+
+
+@pytest.fixture
+def dispatcher(load_service):
+    return load_service("dispatcher")
+
+
+def use_graph(dispatcher, monkeypatch, handler):
+    graph = GraphClient(base_url="https://graph.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(dispatcher, "graph", graph)
+
+
+def test_unknown_message_types_are_rejected(dispatcher, monkeypatch):
+    use_graph(dispatcher, monkeypatch, lambda request: httpx.Response(200, json={}))
+    with TestClient(dispatcher.app) as client:
+        response = client.post(
+            "/send",
+            json={
+                "tenant": "bumeran",
+                "phone_number": "573",
+                "message": "Hola",
+                "message_type": "audio",
+            },
+        )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "error, status",
+    [
+        (httpx.ConnectError("reset"), 502),
+        (httpx.ReadTimeout("slow"), 504),
+        (httpx.DecodingError("bad gzip"), 502),
+    ],
+)
+def test_network_errors_map_to_gateway_errors(dispatcher, monkeypatch, error, status):
+    def handler(request):
+        raise error
+
+    use_graph(dispatcher, monkeypatch, handler)
+    with TestClient(dispatcher.app) as client:
+        response = client.post(
+            "/send", json={"tenant": "bumeran", "phone_number": "573", "message": "Hola"}
+        )
+    assert response.status_code == status
+
+
+def test_an_accepted_send_without_json_is_a_success(dispatcher, monkeypatch):
+    use_graph(dispatcher, monkeypatch, lambda request: httpx.Response(200, text="OK"))
+    with TestClient(dispatcher.app) as client:
+        response = client.post(
+            "/send", json={"tenant": "bumeran", "phone_number": "573", "message": "Hola"}
+        )
+    assert response.json() == {"status": "success"}
+
+
+def test_batches_with_malformed_recipients_are_rejected_before_sending(dispatcher, monkeypatch):
+    sent = []
+    use_graph(dispatcher, monkeypatch, lambda request: sent.append(request) or httpx.Response(200))
+    with TestClient(dispatcher.app) as client:
+        response = client.post(
+            "/send/batch",
+            json={"tenant": "bumeran", "template": "promo", "recipients": ["57300", 57301]},
+        )
+    assert response.status_code == 400
+    assert sent == []
+
+
+def test_send_actions_reports_failures_per_action(dispatcher, monkeypatch):
+    sent = []
+    monkeypatch.setitem(TENANTS, "sin-token", {"phone_id": "2", "secrets": {}})
+    use_graph(
+        dispatcher,
+        monkeypatch,
+        lambda request: sent.append(request) or httpx.Response(200, json={"messages": []}),
+    )
+    actions = [
+        {"tenant": "bumeran", "to": "57300", "type": "text", "message": "Hola"},
+        {"tenant": "otro", "to": "57301", "type": "text", "message": "Hola"},
+        {"tenant": "bumeran", "type": "text", "message": "Hola"},
+        {"tenant": "sin-token", "to": "57302", "type": "text", "message": "Hola"},
+    ]
+    with TestClient(dispatcher.app) as client:
+        response = client.post("/send/actions", json={"actions": actions})
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "sent": 1, "failed": 3, "queued": 0}
+    assert len(sent) == 1
+
+
+def test_send_actions_are_queued_with_the_outbox(load_service, monkeypatch, tmp_path):
+    monkeypatch.setenv("OUTBOX_BACKEND", "sqlite")
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path / "outbox.sqlite3"))
+    dispatcher = load_service("dispatcher")
+    sent = []
+    use_graph(
+        dispatcher,
+        monkeypatch,
+        lambda request: sent.append(request) or httpx.Response(200, json={"messages": []}),
+    )
+    actions = [
+        {"tenant": "bumeran", "to": "57300", "type": "text", "message": "Hola"},
+        {"tenant": "otro", "to": "57301", "type": "text", "message": "Hola"},
+    ]
+    with TestClient(dispatcher.app) as client:
+        response = client.post("/send/actions", json={"actions": actions})
+        assert response.status_code == 202
+        assert response.json() == {"status": "queued", "sent": 0, "failed": 1, "queued": 1}
+        deadline = time.monotonic() + 2
+        while not sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert len(sent) == 1
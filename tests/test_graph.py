@@ -0,0 +1,114 @@
+import asyncio
+import email.utils
+import json
+import time
+
+import httpx
+import pytest
+
+from shared.graph import GraphAPIError, GraphClient, parse_retry_after
+
+
+def make_client(handler):
+    return GraphClient(
+        base_url="https://graph.test/", version="v20.0", transport=httpx.MockTransport(handler)
+    )
+
+
+def test_send_text_posts_with_tenant_token():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"messages": [{"id": "wamid.1"}]})
+
+    graph = make_client(handler)
+
+    async def run():
+        answer = await graph.send_text("123", "token-a", to="57300", body="Hola")
+        await graph.send_text("456", "token-b", to="57301", body="Chao")
+        await graph.close()
+        return answer
+
+    answer = asyncio.run(run())
+
+    assert answer == {"messages": [{"id": "wamid.1"}]}
+    assert [str(request.url) for request in requests] == [
+        "https://graph.test/v20.0/123/messages",
+        "https://graph.test/v20.0/456/messages",
+    ]
+    assert requests[0].headers["authorization"] == "Bearer token-a"
+    assert requests[1].headers["authorization"] == "Bearer token-b"
+    assert json.loads(requests[0].content) == {
+        "messaging_product": "whatsapp",
+        "to": "57300",
+        "type": "text",
+        "text": {"body": "Hola", "preview_url": False},
+    }
+    assert graph.stats()["graph_sent"] == 2
+
+
+def test_send_template_payload():
+    payloads = []
+
+    def handler(request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, json={})
+
+    graph = make_client(handler)
+    components = [{"type": "body", "parameters": [{"type": "text", "text": "Ana"}]}]
+    asyncio.run(graph.send_template("123", "t", to="57300", name="bienvenida", components=components))
+
+    assert payloads[0]["type"] == "template"
+    assert payloads[0]["template"] == {
+        "name": "bienvenida",
+        "language": {"code": "es"},
+        "components": components,
+    }
+
+
+def test_error_answer_raises_with_retry_after():
+    def handler(request):
+        return httpx.Response(
+            429, json={"error": {"message": "Rate limit hit"}}, headers={"Retry-After": "7"}
+        )
+
+    graph = make_client(handler)
+    with pytest.raises(GraphAPIError) as excinfo:
+        asyncio.run(graph.send_text("123", "t", to="57300", body="Hola"))
+
+    assert excinfo.value.status == 429
+    assert excinfo.value.body == {"error": {"message": "Rate limit hit"}}
+    assert excinfo.value.retry_after == 7.0
+    assert excinfo.value.retryable
+    assert graph.stats()["graph_errors"] == 1
+
+
+def test_client_errors_are_not_retryable():
+    assert not GraphAPIError(400, "bad request").retryable
+    assert GraphAPIError(503, "unavailable").retryable
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("soon") is None
+    in_ten_seconds = email.utils.formatdate(time.time() + 10, usegmt=True)
+    assert 8 <= parse_retry_after(in_ten_seconds) <= 10
+
+
+def test_each_event_loop_gets_its_own_pool():
+    graph = make_client(lambda request: httpx.Response(200, json={}))
+
+    async def pool():
+        return graph.client, graph.client
+
+    first, same = asyncio.run(pool())
+    second, _ = asyncio.run(pool())
+    assert first is same
+    assert second is not first
+    # The first loop is gone: its pool is not kept around.
+    assert list(graph._clients.values()) == [second]
+    asyncio.run(graph.close())
+    assert graph._clients == {}
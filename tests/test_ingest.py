@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from ingest import Event, IngestPipeline, MemoryQueue, QueueFull, SpoolQueue
+
+
+async def _noop(event):
+    pass
+
+
+def test_full_queue_without_overflow_is_rejected():
+    async def run():
+        pipeline = IngestPipeline(_noop, MemoryQueue(1))
+        await pipeline.submit(Event("t", b"1"))
+        with pytest.raises(QueueFull):
+            await pipeline.submit(Event("t", b"2"))
+        assert pipeline.stats()["ingest_rejected"] == 1
+
+    asyncio.run(run())
+
+
+def test_full_queue_spills_to_disk_and_drains(tmp_path):
+    seen = []
+
+    async def handler(event):
+        seen.append(event.body)
+
+    async def run():
+        pipeline = IngestPipeline(
+            handler, MemoryQueue(1), overflow=SpoolQueue(tmp_path), workers=2
+        )
+        for index in range(3):
+            await pipeline.submit(Event("t", str(index).encode()))
+        assert pipeline.stats()["ingest_spilled"] == 2
+        await pipeline.start()
+        await pipeline.stop(timeout=2)
+        return pipeline.stats()
+
+    stats = asyncio.run(run())
+    assert sorted(seen) == [b"0", b"1", b"2"]
+    assert stats["ingest_processed"] == 3
+    assert list(tmp_path.glob("*.json")) == []
+
+
+def test_spooled_events_survive_restart(tmp_path):
+    async def run():
+        await SpoolQueue(tmp_path).put(Event("bumeran", b'{"entry": []}'))
+        queue = SpoolQueue(tmp_path)
+        event = await queue.poll()
+        assert (event.tenant, event.body) == ("bumeran", b'{"entry": []}')
+        await queue.ack(event)
+        assert queue.qsize() == 0
+
+    asyncio.run(run())
+    assert list(tmp_path.glob("*.json")) == []
+
+
+def test_spool_file_io_goes_through_run(tmp_path):
+    calls = []
+
+    async def run(func, *args):
+        calls.append(func.__name__)
+        return func(*args)
+
+    async def scenario():
+        queue = SpoolQueue(tmp_path, run=run)
+        await queue.put(Event("bumeran", b"{}"))
+        await queue.ack(await queue.poll())
+        # Nothing pending: polling does no I/O.
+        assert await queue.poll() is None
+
+    asyncio.run(scenario())
+    assert calls == ["_write", "_read", "_delete"]
+
+
+def test_failed_event_is_counted_and_dropped():
+    async def handler(event):
+        raise ValueError("boom")
+
+    async def run():
+        pipeline = IngestPipeline(handler, MemoryQueue(4), workers=1)
+        await pipeline.submit(Event("t", b"x"))
+        await pipeline.start()
+        await pipeline.stop(timeout=2)
+        return pipeline.stats()
+
+    stats = asyncio.run(run())
+    assert stats["ingest_failed"] == 1
+    assert stats["ingest_queue_depth"] == 0
@@ -0,0 +1,55 @@
+import pytest
+
+from intents import IntentMatcher, IntentMatchers, normalize, tenant_intents
+
+
+def test_normalization_strips_accents_and_case():
+    assert normalize("PROVEEDÓR") == "proveedor"
+    assert normalize("Señor Cliente") == "senor cliente"
+
+
+def test_default_intents():
+    matcher = IntentMatcher(tenant_intents(None))
+    assert matcher.match("Soy PROVEEDÓR de hoteles") == {"provider"}
+    assert matcher.match("Clientes frecuentes") == {"client"}
+    assert matcher.match("soy proveedora y también cliente") == {"provider", "client"}
+    assert matcher.match("hola") == set()
+    assert matcher.match("") == set()
+
+
+def test_keywords_match_at_word_start_only():
+    matcher = IntentMatcher({"client": ["cliente"]})
+    assert matcher.match("subcliente") == set()
+    assert matcher.match("¿cliente?") == {"client"}
+
+
+def test_tenant_overrides_replace_one_intent():
+    intents = tenant_intents({"provider": ["agencia"], "complaint": "reclamo"})
+    assert intents["provider"] == ("agencia",)
+    assert intents["client"] == ("cliente", "client")
+    assert IntentMatcher(intents).match("Agencias y reclamos") == {"provider", "complaint"}
+
+
+def test_matcher_is_rebuilt_only_when_keywords_change():
+    matchers = IntentMatchers()
+    config = {"provider": ["agencia"]}
+    first = matchers.get("bumeran", config)
+    assert matchers.get("bumeran", config) is first
+    assert matchers.get("bumeran", {"provider": ["agencia"]}) is first
+    assert matchers.get("bumeran", {"provider": ["hotel"]}) is not first
+    assert matchers.builds == 2
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [["proveedor"], {"provider": 3}, {"provider": [{"pattern": "x", "next": "y"}]}],
+)
+def test_malformed_overrides_fall_back_to_the_defaults(overrides, caplog):
+    with pytest.raises(ValueError):
+        tenant_intents(overrides)
+
+    matchers = IntentMatchers()
+    matcher = matchers.get("bumeran", overrides)
+    assert matcher.match("Soy proveedor") == {"provider"}
+    assert matchers.get("bumeran", overrides) is matcher
+    assert len([r for r in caplog.records if "Invalid intents" in r.getMessage()]) == 1
@@ -0,0 +1,89 @@
+import logging
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from shared import latency
+from shared.offload import BlockingExecutor
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(latency.LatencyMiddleware, service="svc", metric="webhook_latency_ms")
+    blocking = BlockingExecutor(max_workers=2)
+
+    def lookup():
+        with latency.phase("tenant_lookup"):
+            return {"ok": True}
+
+    @app.post("/api/webhook/{tenant}")
+    async def webhook(tenant: str):
+        if tenant != "bumeran":
+            raise HTTPException(status_code=404)
+        latency.set_tenant(tenant)
+        with latency.phase("parsing"):
+            pass
+        with latency.phase("parsing"):
+            pass
+        return await blocking.run(lookup)
+
+    @app.get("/fail")
+    def fail():
+        raise HTTPException(status_code=403)
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok"}
+
+    return app
+
+
+def latency_records(caplog):
+    return [
+        record.json_fields
+        for record in caplog.records
+        if getattr(record, "json_fields", {}).get("metric") == "webhook_latency_ms"
+    ]
+
+
+def test_request_latency_is_logged_with_phases(caplog):
+    caplog.set_level(logging.INFO, logger="agentes-ia-log")
+    with TestClient(make_app()) as client:
+        client.post("/api/webhook/bumeran")
+    (fields,) = latency_records(caplog)
+    assert fields["service"] == "svc"
+    assert fields["route"] == "/api/webhook/{tenant}"
+    assert fields["tenant"] == "bumeran"
+    assert fields["status"] == 200
+    assert fields["latency"] > 0
+    assert fields["latency_parsing"] >= 0
+    # Recorded from the worker thread of the blocking pool.
+    assert "latency_tenant_lookup" in fields
+
+
+def test_status_and_exclusions(caplog):
+    caplog.set_level(logging.INFO, logger="agentes-ia-log")
+    with TestClient(make_app()) as client:
+        client.get("/fail")
+        client.get("/healthz")
+    (fields,) = latency_records(caplog)
+    assert fields["status"] == 403
+    assert "tenant" not in fields
+
+
+def test_only_known_tenants_label_the_histogram():
+    with TestClient(make_app()) as client:
+        client.post("/api/webhook/bumeran")
+        for index in range(3):
+            client.post(f"/api/webhook/random-{index}")
+    labels = {"service": "svc", "route": "/api/webhook/{tenant}"}
+    assert latency.request_latency.count(tenant="bumeran", **labels) >= 1
+    assert latency.request_latency.count(tenant="unknown", **labels) >= 3
+    assert not any("random-" in line for line in latency.request_latency.render())
+
+
+def test_phase_outside_a_request_is_a_no_op():
+    assert latency.current() is None
+    with latency.phase("routing"):
+        pass
+    assert latency.current() is None
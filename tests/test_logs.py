@@ -0,0 +1,128 @@
+import io
+import json
+import logging
+import threading
+import time
+
+from shared.logs import BatchingHandler, StdoutSink, to_entry
+
+
+class ListSink:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def write(self, entries):
+        if self.fail:
+            raise RuntimeError("logging API unavailable")
+        self.batches.append(entries)
+
+
+def make_logger(handler):
+    logger = logging.getLogger(f"test-logs-{id(handler)}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_records_are_written_in_batches():
+    sink = ListSink()
+    handler = BatchingHandler(sink, batch_size=50, flush_interval=0.05)
+    logger = make_logger(handler)
+    for index in range(120):
+        logger.info("Incoming message", extra={"json_fields": {"metric": "m", "index": index}})
+    handler.flush()
+    handler.close()
+    entries = [entry for batch in sink.batches for entry in batch]
+    assert [entry["index"] for entry in entries] == list(range(120))
+    assert entries[0]["metric"] == "m"
+    assert entries[0]["severity"] == "INFO"
+    assert all(len(batch) <= 50 for batch in sink.batches)
+    assert handler.stats()["logging_written"] == 120
+
+
+def test_flush_waits_for_a_record_the_writer_just_took():
+    class SlowTake:
+        # The writer is descheduled right after taking a record off the queue.
+        def __init__(self, queue):
+            self._queue = queue
+
+        def get(self, timeout=None):
+            record = self._queue.get(timeout=timeout)
+            time.sleep(0.05)
+            return record
+
+        def __getattr__(self, name):
+            return getattr(self._queue, name)
+
+    sink = ListSink()
+    handler = BatchingHandler(sink, batch_size=1)
+    handler._queue = SlowTake(handler._queue)
+    logger = make_logger(handler)
+    logger.info("Incoming message")
+    time.sleep(0.01)
+    handler.flush()
+    assert len(sink.batches) == 1
+    handler.close()
+
+
+def test_low_value_records_are_sampled_under_load():
+    entered, release = threading.Event(), threading.Event()
+
+    class BlockedSink(ListSink):
+        def write(self, entries):
+            entered.set()
+            release.wait()
+            super().write(entries)
+
+    sink = BlockedSink()
+    handler = BatchingHandler(
+        sink, maxsize=10, batch_size=1, low_value=("Ignoring message",), sampler=lambda: 0.99
+    )
+    logger = make_logger(handler)
+    logger.info("Request latency")
+    entered.wait(timeout=1)
+    for _ in range(9):
+        logger.info("Request latency")
+    for _ in range(5):
+        logger.info("Ignoring message")
+    for _ in range(5):
+        logger.info("Request latency")
+    release.set()
+    handler.flush()
+    handler.close()
+    stats = handler.stats()
+    assert stats["logging_sampled_out"] == 5
+    # The writer holds one record and the queue nine: one more fits.
+    assert stats["logging_dropped"] == 4
+    messages = [entry["message"] for batch in sink.batches for entry in batch]
+    assert messages == ["Request latency"] * 11
+
+
+def test_failed_writes_fall_back():
+    fallback = ListSink()
+    handler = BatchingHandler(ListSink(fail=True), fallback=fallback, flush_interval=0.01)
+    logger = make_logger(handler)
+    logger.warning("first")
+    handler.flush()
+    logger.warning("second")
+    handler.flush()
+    handler.close()
+    assert [entry["message"] for batch in fallback.batches for entry in batch] == [
+        "first",
+        "second",
+    ]
+    # The second batch went straight to the fallback.
+    assert handler.stats()["logging_fallbacks"] == 1
+
+
+def test_stdout_sink_writes_json_lines():
+    stream = io.StringIO()
+    record = logging.LogRecord("x", logging.INFO, __file__, 1, "hola %s", ("mundo",), None)
+    record.json_fields = {"tenant": "bumeran"}
+    StdoutSink(stream).write([to_entry(record), to_entry(record)])
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["message"] == "hola mundo"
+    assert json.loads(lines[0])["tenant"] == "bumeran"
@@ -0,0 +1,95 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from shared import metrics
+from shared.metrics import Registry
+
+
+def test_counter_by_labels():
+    registry = Registry()
+    counter = registry.counter("incoming_messages_total", "Inbound", ("tenant",))
+    counter.inc(tenant="a")
+    counter.inc(2, tenant="a")
+    counter.inc(tenant='b"x')
+    assert counter.value(tenant="a") == 3
+    assert registry.counter("incoming_messages_total", "Inbound", ("tenant",)) is counter
+    text = registry.render()
+    assert "# TYPE incoming_messages_total counter" in text
+    assert 'incoming_messages_total{tenant="a"} 3' in text
+    assert 'incoming_messages_total{tenant="b\\"x"} 1' in text
+
+
+def test_labels_must_match():
+    counter = Registry().counter("c", "c", ("tenant",))
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        counter.inc(-1, tenant="a")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("latency_ms", "Latency", ("tenant",), buckets=(1, 10, 100))
+    for value in (0.5, 5, 5, 50, 500):
+        histogram.observe(value, tenant="a")
+    assert histogram.count(tenant="a") == 5
+    lines = registry.render().splitlines()
+    assert 'latency_ms_bucket{tenant="a",le="1"} 1' in lines
+    assert 'latency_ms_bucket{tenant="a",le="10"} 3' in lines
+    assert 'latency_ms_bucket{tenant="a",le="100"} 4' in lines
+    assert 'latency_ms_bucket{tenant="a",le="+Inf"} 5' in lines
+    assert 'latency_ms_sum{tenant="a"} 560.5' in lines
+    assert 'latency_ms_count{tenant="a"} 5' in lines
+
+
+def test_collectors_are_rendered_as_gauges():
+    registry = Registry()
+    registry.add_collector(lambda: {"tenant_cache_hits": 4, "label": "x", "flag": True})
+    text = registry.render()
+    assert "# TYPE tenant_cache_hits gauge\ntenant_cache_hits 4" in text
+    assert "label" not in text
+    assert "flag" not in text
+
+
+def test_kind_conflict():
+    registry = Registry()
+    registry.counter("x", "x")
+    with pytest.raises(ValueError):
+        registry.histogram("x", "x")
+
+
+def test_metric_kinds_must_render_samples():
+    class Gauge(metrics._Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        Gauge("g", "g")
+
+
+def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    app = FastAPI()
+    app.include_router(metrics.router)
+    metrics.registry.counter("test_endpoint_total", "Test").inc()
+    response = TestClient(app).get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "test_endpoint_total 1" in response.text
+
+
+def test_metrics_endpoint_requires_the_token_when_set(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    app = FastAPI()
+    app.include_router(metrics.router)
+    client = TestClient(app)
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer nope"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_metrics_endpoint_is_closed_without_a_token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    app = FastAPI()
+    app.include_router(metrics.router)
+    assert TestClient(app).get("/metrics").status_code == 404
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from model_registry import ModelRegistry, UnknownModel
+
+
+def test_handles_are_built_once_per_model():
+    calls = []
+    registry = ModelRegistry(
+        lambda name: calls.append(name) or object(), init=lambda: calls.append("init")
+    )
+
+    first = registry.get("gemini")
+    assert registry.get("gemini") is first
+    assert registry.get("other") is not first
+    assert calls == ["init", "gemini", "other"]
+    assert registry.stats()["llm_models_loaded"] == 2
+
+
+def test_concurrent_requests_share_one_load():
+    loads = []
+
+    def load(name):
+        loads.append(name)
+        time.sleep(0.05)
+        return object()
+
+    registry = ModelRegistry(load)
+    handles = []
+    threads = [
+        threading.Thread(target=lambda: handles.append(registry.get("gemini")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ["gemini"]
+    assert len({id(handle) for handle in handles}) == 1
+
+
+def test_start_warms_models_and_tolerates_failures():
+    warmed = []
+
+    def load(name):
+        if name == "broken":
+            raise RuntimeError("not found")
+        return name
+
+    registry = ModelRegistry(load)
+    asyncio.run(registry.start(["gemini", "broken"], warmup=warmed.append))
+
+    assert warmed == ["gemini"]
+    stats = registry.stats()
+    assert stats["llm_models_warmed"] == 1
+    assert stats["llm_model_load_errors"] == 1
+    # A model that failed to warm is retried on its first request.
+    assert registry.get("gemini") == "gemini"
+
+
+def test_start_loads_models_in_parallel_through_run():
+    threads = set()
+
+    def load(name):
+        threads.add(threading.get_ident())
+        time.sleep(0.1)
+        return name
+
+    async def run(func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    async def scenario():
+        registry = ModelRegistry(load, run=run)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        start = time.perf_counter()
+        await registry.start(["a", "b", "c"])
+        elapsed = time.perf_counter() - start
+        ticker.cancel()
+        return registry, elapsed, ticks
+
+    registry, elapsed, ticks = asyncio.run(scenario())
+    assert registry.stats()["llm_models_warmed"] == 3
+    assert elapsed < 0.25
+    # The event loop kept running while the models loaded.
+    assert ticks >= 5
+    assert threading.get_ident() not in threads
+
+
+def test_only_allowed_models_get_a_handle():
+    registry = ModelRegistry(lambda name: name, allowed=["gemini"])
+
+    assert registry.allows("gemini")
+    assert not registry.allows("other")
+    assert not registry.allows(None)
+    with pytest.raises(UnknownModel):
+        registry.get("other")
+    assert registry.get("gemini") == "gemini"
+    assert registry.stats()["llm_models_loaded"] == 1
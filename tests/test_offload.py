@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from shared.offload import BlockingExecutor
+
+
+def test_blocking_calls_run_concurrently_off_the_loop():
+    blocking = BlockingExecutor(max_workers=8)
+    loop_thread = threading.get_ident()
+
+    def slow(value):
+        time.sleep(0.05)
+        return value, threading.get_ident()
+
+    async def run():
+        return await asyncio.gather(*(blocking.run(slow, index) for index in range(8)))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    blocking.close()
+
+    assert [value for value, _ in results] == list(range(8))
+    assert loop_thread not in {thread for _, thread in results}
+    assert elapsed < 0.3
+    stats = blocking.stats()
+    assert stats["blocking_completed"] == 8
+    assert stats["blocking_pending"] == 0
+    assert stats["blocking_peak"] == 8
+
+
+def test_pool_bounds_concurrency():
+    blocking = BlockingExecutor(max_workers=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.pop()
+
+    async def run():
+        await asyncio.gather(*(blocking.run(work) for _ in range(6)))
+
+    asyncio.run(run())
+    blocking.close()
+    assert max(peak) == 2
+
+
+def test_exceptions_propagate():
+    blocking = BlockingExecutor(max_workers=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(blocking.run(fail))
+    assert blocking.stats()["blocking_pending"] == 0
+    blocking.close()
@@ -0,0 +1,213 @@
+import asyncio
+
+import pytest
+
+from outbox import Backoff, OutboundMessage, OutboxWorker, RetryableError, SQLiteOutbox
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    store = SQLiteOutbox(str(tmp_path / "outbox.sqlite3"), clock=clock)
+    yield store
+    store.close()
+
+
+def message(index=0):
+    return OutboundMessage(tenant="bumeran", payload={"phone_number": f"5730{index}"})
+
+
+def test_claim_leases_messages_until_ack(store, clock):
+    first = store.put(message(0))
+    store.put(message(1))
+
+    claimed = store.claim(limit=10, lease=60)
+    assert [item.id for item in claimed] == [first, first + 1]
+    assert claimed[0].payload == {"phone_number": "57300"}
+    assert store.claim(limit=10, lease=60) == []
+
+    store.ack(claimed[0])
+    clock.now += 61
+    # The unacknowledged message comes back once its lease expires.
+    assert [item.id for item in store.claim(limit=10, lease=60)] == [first + 1]
+
+
+def test_retry_delays_and_counts_attempts(store, clock):
+    store.put(message())
+    [claimed] = store.claim(limit=1, lease=60)
+    store.retry(claimed, delay=5, error="429")
+
+    clock.now += 4
+    assert store.claim(limit=1, lease=60) == []
+    clock.now += 1
+    [again] = store.claim(limit=1, lease=60)
+    assert again.attempts == 1
+
+
+def test_dead_letters_can_be_requeued(store, clock):
+    store.put(message())
+    [claimed] = store.claim(limit=1, lease=60)
+    store.dead(claimed, error="400 bad request")
+
+    assert store.claim(limit=1, lease=60) == []
+    [dead] = store.dead_letters()
+    assert dead["id"] == claimed.id
+    assert dead["attempts"] == 1
+    assert dead["error"] == "400 bad request"
+    assert store.stats()["outbox_dead_letters"] == 1
+
+    assert store.requeue(claimed.id)
+    assert not store.requeue(claimed.id)
+    [requeued] = store.claim(limit=1, lease=60)
+    assert requeued.attempts == 0
+
+
+def test_stats_report_depth_and_lag(store, clock):
+    assert store.stats() == {
+        "outbox_depth": 0,
+        "outbox_dead_letters": 0,
+        "outbox_lag_seconds": 0.0,
+    }
+    store.put(OutboundMessage(tenant="bumeran", payload={}, enqueued_at=clock.now))
+    store.put(OutboundMessage(tenant="bumeran", payload={}, enqueued_at=clock.now + 5))
+    clock.now += 10
+    stats = store.stats()
+    assert stats["outbox_depth"] == 2
+    assert stats["outbox_lag_seconds"] == 10.0
+
+
+def test_messages_survive_reopening(tmp_path, clock):
+    path = str(tmp_path / "outbox.sqlite3")
+    store = SQLiteOutbox(path, clock=clock)
+    store.put(message())
+    store.close()
+
+    reopened = SQLiteOutbox(path, clock=clock)
+    assert len(reopened.claim(limit=10, lease=60)) == 1
+    reopened.close()
+
+
+def test_backoff_is_jittered_capped_and_respects_retry_after():
+    assert Backoff(base=1, cap=300, random=lambda: 1.0).delay(3) == 8
+    assert Backoff(base=1, cap=300, random=lambda: 0.5).delay(3) == 4
+    assert Backoff(base=1, cap=300, random=lambda: 1.0).delay(20) == 300
+    assert Backoff(base=1, random=lambda: 0.0).delay(3, retry_after=30) == 30
+    assert Backoff(base=1, random=lambda: 1.0).delay(6, retry_after=30) == 64
+
+
+def run_worker(store, send, count, **kwargs):
+    worker = OutboxWorker(send, store, poll_interval=0.01, **kwargs)
+
+    async def run():
+        await worker.start()
+        for index in range(count):
+            await worker.put(message(index))
+        for _ in range(200):
+            if store.stats()["outbox_depth"] == 0 and not worker.stats()["outbox_inflight"]:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(run())
+    return worker
+
+
+def test_worker_sends_and_acks(tmp_path):
+    store = SQLiteOutbox(str(tmp_path / "outbox.sqlite3"))
+    sent = []
+
+    async def send(item):
+        sent.append(item.payload["phone_number"])
+
+    worker = run_worker(store, send, count=5)
+    assert sorted(sent) == [f"5730{index}" for index in range(5)]
+    assert worker.stats()["outbox_sent"] == 5
+    assert store.stats()["outbox_depth"] == 0
+
+
+def test_worker_retries_transient_failures(tmp_path):
+    store = SQLiteOutbox(str(tmp_path / "outbox.sqlite3"))
+    calls = []
+
+    async def send(item):
+        calls.append(item.attempts)
+        if item.attempts < 2:
+            raise RetryableError("503", retry_after=0)
+
+    worker = run_worker(store, send, count=1, backoff=Backoff(random=lambda: 0.0))
+    assert calls == [0, 1, 2]
+    assert worker.stats()["outbox_retried"] == 2
+    assert worker.stats()["outbox_sent"] == 1
+
+
+def test_worker_dead_letters_after_max_attempts_or_permanent_errors(tmp_path):
+    store = SQLiteOutbox(str(tmp_path / "outbox.sqlite3"))
+
+    async def send(item):
+        if item.payload["phone_number"] == "57300":
+            raise RetryableError("429")
+        raise ValueError("400 bad request")
+
+    worker = run_worker(
+        store, send, count=2, backoff=Backoff(max_attempts=3, random=lambda: 0.0)
+    )
+    dead = {item["payload"]["phone_number"]: item for item in store.dead_letters()}
+    assert dead["57300"]["attempts"] == 3
+    assert dead["57300"]["error"] == "429"
+    assert dead["57301"]["attempts"] == 1
+    assert worker.stats()["outbox_dead_lettered"] == 2
+
+
+def test_worker_bounds_concurrency(tmp_path):
+    store = SQLiteOutbox(str(tmp_path / "outbox.sqlite3"))
+    active = 0
+    peak = 0
+
+    async def send(item):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.005)
+        active -= 1
+
+    worker = run_worker(store, send, count=20, concurrency=3)
+    assert worker.stats()["outbox_sent"] == 20
+    assert peak == 3
+
+
+def test_stopping_releases_in_flight_messages_through_run(tmp_path):
+    store = SQLiteOutbox(str(tmp_path / "outbox.sqlite3"))
+    calls = []
+
+    async def run_call(func, *args):
+        calls.append(func.__name__)
+        return func(*args)
+
+    async def send(item):
+        await asyncio.sleep(10)
+
+    worker = OutboxWorker(send, store, run=run_call, poll_interval=0.01)
+
+    async def run():
+        await worker.start()
+        await worker.put(message(0))
+        await asyncio.sleep(0.05)
+        await worker.stop(timeout=0)
+
+    asyncio.run(run())
+    assert "release" in calls
+    # Released: due again right away.
+    assert store.stats()["outbox_depth"] == 1
+    assert len(store.claim(10, 60)) == 1
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from payload import PayloadError, iter_messages, message_ids
+
+BODY = json.dumps(
+    {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "id": "1",
+                "changes": [
+                    {
+                        "field": "messages",
+                        "value": {
+                            "metadata": {"phone_number_id": "123"},
+                            "statuses": [{"id": "wamid.S", "status": "delivered"}],
+                            "messages": [
+                                {
+                                    "from": "57300",
+                                    "id": "wamid.1",
+                                    "type": "text",
+                                    "text": {"body": "Hola"},
+                                },
+                                {
+                                    "from": "57301",
+                                    "id": "wamid.2",
+                                    "type": "interactive",
+                                    "interactive": {
+                                        "type": "button_reply",
+                                        "button_reply": {"id": "b", "title": "Cliente"},
+                                    },
+                                },
+                                {"from": "57302", "id": "wamid.3", "type": "image"},
+                            ],
+                        },
+                    },
+                    {"field": "messages", "value": {"statuses": [{"id": "wamid.T"}]}},
+                ],
+            }
+        ],
+    }
+).encode()
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_messages_are_extracted(fast):
+    messages = [
+        (message.sender, message.id, message.type, message.text)
+        for message in iter_messages(BODY, fast=fast)
+    ]
+    assert messages == [
+        ("57300", "wamid.1", "text", "Hola"),
+        ("57301", "wamid.2", "interactive", "Cliente"),
+        ("57302", "wamid.3", "image", ""),
+    ]
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_invalid_body_raises_payload_error(fast):
+    with pytest.raises(PayloadError):
+        list(iter_messages(b"{not json", fast=fast))
+
+
+def test_message_ids():
+    assert message_ids(BODY) == ["wamid.1", "wamid.2", "wamid.3"]
+    with pytest.raises(PayloadError):
+        message_ids(b"[")
+
+
+def _body(*messages):
+    value = {"messages": list(messages)}
+    return json.dumps({"entry": [{"changes": [{"value": value}]}]}).encode()
+
+
+ALL_TYPES = [
+    (
+        {"type": "button", "button": {"text": "Soy cliente", "payload": "CLIENT"}},
+        {"text": "Soy cliente", "reply_id": "CLIENT", "category": "conversation"},
+    ),
+    (
+        {"type": "interactive", "interactive": {"type": "list_reply", "list_reply": {"id": "l1", "title": "Equipaje"}}},
+        {"text": "Equipaje", "reply_id": "l1", "category": "conversation"},
+    ),
+    (
+        {"type": "image", "image": {"id": "media-1", "caption": "mi pasaporte"}},
+        {"text": "mi pasaporte", "media_id": "media-1", "category": "media"},
+    ),
+    (
+        {"type": "audio", "audio": {"id": "media-2"}},
+        {"text": "", "media_id": "media-2", "category": "media"},
+    ),
+    (
+        {"type": "location", "location": {"latitude": 4.6, "longitude": -74.1, "name": "Bogotá"}},
+        {"text": "Bogotá", "location": (4.6, -74.1), "category": "media"},
+    ),
+    (
+        {"type": "reaction", "reaction": {"message_id": "wamid.0", "emoji": "👍"}},
+        {"text": "👍", "target_id": "wamid.0", "category": "ignore"},
+    ),
+    (
+        {"type": "request_welcome"},
+        {"text": "", "category": "welcome"},
+    ),
+    (
+        {"type": "unsupported", "errors": [{"code": 131051}]},
+        {"text": "", "category": "ignore"},
+    ),
+    (
+        {"type": "brand_new_type", "brand_new_type": {"x": 1}},
+        {"text": "", "category": "ignore"},
+    ),
+]
+
+
+@pytest.mark.parametrize("fast", [True, False])
+@pytest.mark.parametrize("message, expected", ALL_TYPES)
+def test_every_message_type_is_modelled(fast, message, expected):
+    body = _body({"from": "57300", "id": "wamid.9", **message})
+    (parsed,) = iter_messages(body, fast=fast)
+    assert parsed.type == message["type"]
+    for field, value in expected.items():
+        assert getattr(parsed, field) == value
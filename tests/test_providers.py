@@ -0,0 +1,78 @@
+import json
+
+from providers import FileProviderStore, ProviderRegistry
+
+
+def test_additions_survive_restart_through_the_log(tmp_path):
+    registry = ProviderRegistry(FileProviderStore(tmp_path))
+    assert registry.add("bumeran", "57300")
+    assert not registry.add("bumeran", "57300")
+    assert (tmp_path / "bumeran.wal").read_text() == "57300\n"
+
+    reloaded = ProviderRegistry(FileProviderStore(tmp_path))
+    assert reloaded.contains("bumeran", "57300")
+    assert not reloaded.contains("other", "57300")
+
+
+def test_compaction_writes_snapshot_and_truncates_log(tmp_path):
+    registry = ProviderRegistry(FileProviderStore(tmp_path))
+    registry.add("bumeran", "2")
+    registry.add("bumeran", "1")
+    registry.compact()
+    assert json.loads((tmp_path / "bumeran.json").read_text()) == {"providers": ["1", "2"]}
+    assert not (tmp_path / "bumeran.wal").exists()
+    assert ProviderRegistry(FileProviderStore(tmp_path)).size("bumeran") == 2
+
+
+def test_write_behind_flushes_on_stop(tmp_path):
+    registry = ProviderRegistry(FileProviderStore(tmp_path), flush_interval=60)
+    registry.start()
+    registry.add("bumeran", "57300")
+    assert not (tmp_path / "bumeran.wal").exists()
+    registry.stop()
+    assert ProviderRegistry(FileProviderStore(tmp_path)).contains("bumeran", "57300")
+
+
+def test_legacy_blacklist_only_applies_to_its_tenant(tmp_path):
+    legacy = tmp_path / "providers_blacklist.json"
+    legacy.write_text(json.dumps({"providers": ["57999"]}))
+    store = FileProviderStore(
+        tmp_path / "providers", legacy_file=legacy, legacy_tenant="bumeran"
+    )
+    registry = ProviderRegistry(store)
+    assert registry.contains("bumeran", "57999")
+    assert not registry.contains("other", "57999")
+
+
+def test_non_providers_are_answered_by_the_filter(tmp_path):
+    registry = ProviderRegistry(FileProviderStore(tmp_path))
+    registry.add("bumeran", "57300")
+    misses = [str(570000 + index) for index in range(1000)]
+    assert not any(registry.contains("bumeran", number) for number in misses)
+    # At a 1% false positive rate nearly every miss stops at the filter.
+    assert registry.stats()["providers_filter_negatives"] > 950
+
+
+def test_evicted_tenant_confirms_hits_against_the_store(tmp_path):
+    registry = ProviderRegistry(FileProviderStore(tmp_path), memory_budget=0)
+    registry.add("bumeran", "57300")
+    assert registry.memory("bumeran")["providers_set_bytes"] == 0
+    assert registry.memory("bumeran")["providers_filter_bytes"] > 0
+    assert registry.contains("bumeran", "57300")
+    assert registry.stats()["providers_store_confirmations"] >= 1
+
+
+def test_budget_is_enforced_with_the_default_store(tmp_path):
+    registry = ProviderRegistry(FileProviderStore(tmp_path), memory_budget=2000)
+    for tenant in ("a", "b", "c"):
+        for index in range(20):
+            registry.add(tenant, f"573{index:04d}")
+    assert registry.stats()["providers_set_bytes"] <= 2000
+    assert registry.stats()["providers_set_evictions"] >= 1
+    # The least recently used tenant was evicted; its numbers are still found.
+    assert registry.memory("a")["providers_set_bytes"] == 0
+    assert registry.contains("a", "5730007")
+    assert not registry.contains("a", "5739999")
+
+    registry.compact()
+    assert registry.contains("a", "5730019")
@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from shared.ratelimit import RateLimiter, RateLimitExceeded, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_spaces_at_rate():
+    bucket = TokenBucket(rate=10, burst=3)
+    slots = []
+    for _ in range(5):
+        at = bucket.earliest(0.0)
+        bucket.take(at)
+        slots.append(round(at, 3))
+    assert slots == [0.0, 0.0, 0.0, 0.1, 0.2]
+
+
+def test_bucket_refills_while_idle():
+    bucket = TokenBucket(rate=10, burst=2)
+    for _ in range(2):
+        bucket.take(bucket.earliest(0.0))
+    assert bucket.earliest(0.0) == pytest.approx(0.1)
+    assert bucket.earliest(5.0) == 5.0
+
+
+def make_limiter(**kwargs):
+    """A limiter on a fake clock that `sleep` advances."""
+    clock = FakeClock()
+
+    async def sleep(delay):
+        assert limiter.waiting == 1
+        clock.now += delay
+
+    limiter = RateLimiter(clock=clock, sleep=sleep, **kwargs)
+    return limiter, clock
+
+
+def send_times(limiter, clock, sends):
+    async def run():
+        times = []
+        for phone_id, recipient in sends:
+            await limiter.acquire(phone_id, recipient)
+            times.append(round(clock.now, 4))
+        return times
+
+    return asyncio.run(run())
+
+
+def test_burst_drains_at_phone_rate_without_failing():
+    limiter, clock = make_limiter(phone_rate=80, phone_burst=1)
+    times = send_times(limiter, clock, [("phone-1", f"5730{index}") for index in range(160)])
+
+    # 160 sends go out 12.5 ms apart: 80 per second, none rejected.
+    assert times[0] == 0.0
+    assert times[-1] == pytest.approx(159 / 80)
+    assert all(later - earlier == pytest.approx(1 / 80) for earlier, later in zip(times, times[1:]))
+    stats = limiter.stats()
+    assert stats["ratelimit_granted"] == 160
+    assert stats["ratelimit_delayed"] == 159
+    assert stats["ratelimit_rejected"] == 0
+    assert stats["ratelimit_waiting"] == 0
+
+
+def test_phone_numbers_have_independent_buckets():
+    limiter, clock = make_limiter(phone_rate=1)
+    times = send_times(limiter, clock, [("phone-1", "a"), ("phone-2", "a"), ("phone-1", "b")])
+    assert times == [0.0, 0.0, 1.0]
+
+
+def test_recipient_limit_applies_per_recipient():
+    limiter, clock = make_limiter(
+        phone_rate=1000, phone_burst=10, recipient_rate=1 / 6, recipient_burst=2
+    )
+    times = send_times(limiter, clock, [("phone-1", "a")] * 3)
+    assert times == [0.0, 0.0, 6.0]
+
+
+def test_throttled_recipient_does_not_hold_back_others():
+    limiter, _ = make_limiter(phone_rate=10, recipient_rate=1 / 6, recipient_burst=1)
+    events = []
+
+    async def send(recipient):
+        waited, scope = await limiter.acquire("phone-1", recipient)
+        events.append((recipient, round(waited, 3), scope))
+
+    async def run():
+        # Real sleeps, scaled down: only the order and the scopes matter.
+        limiter._sleep = lambda delay: asyncio.sleep(delay / 100)
+        await send("a")
+        await asyncio.gather(send("a"), send("b"))
+
+    asyncio.run(run())
+    assert events[0] == ("a", 0.0, "")
+    assert events[1][0] == "b" and events[1][2] == "phone"
+    assert events[2][0] == "a" and events[2][2] == "recipient"
+
+
+def test_tenant_rate_overrides_default():
+    limiter, clock = make_limiter(phone_rate=1)
+
+    async def run():
+        await limiter.acquire("phone-1", "a", rate=250)
+        return await limiter.acquire("phone-1", "b", rate=250)
+
+    assert asyncio.run(run()) == (pytest.approx(1 / 250), "phone")
+
+
+def test_waits_beyond_max_wait_are_rejected():
+    limiter, clock = make_limiter(phone_rate=1, max_wait=2)
+    limiter._sleep = lambda delay: asyncio.sleep(0)
+
+    async def run():
+        for recipient in ("a", "b", "c"):
+            await limiter.acquire("phone-1", recipient)
+        with pytest.raises(RateLimitExceeded) as excinfo:
+            await limiter.acquire("phone-1", "d")
+        return excinfo.value.retry_after
+
+    assert asyncio.run(run()) == pytest.approx(3.0)
+    assert limiter.stats()["ratelimit_rejected"] == 1
+
+
+def test_a_phone_rejection_gives_the_recipient_slot_back():
+    limiter, clock = make_limiter(
+        phone_rate=1, recipient_rate=1 / 6, recipient_burst=1, max_wait=2
+    )
+    limiter._sleep = lambda delay: asyncio.sleep(0)
+
+    async def run():
+        for recipient in ("a", "b", "c"):
+            await limiter.acquire("phone-1", recipient)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire("phone-1", "d")
+        # The phone number has a token again and "d" never used its slot.
+        clock.now = 3
+        return await limiter.acquire("phone-1", "d")
+
+    assert asyncio.run(run()) == (0.0, "")
+
+
+def test_a_send_cancelled_while_waiting_gives_both_slots_back():
+    limiter, clock = make_limiter(phone_rate=1, recipient_rate=1 / 6, recipient_burst=1)
+    limiter._sleep = lambda delay: asyncio.Event().wait()
+
+    async def run():
+        await limiter.acquire("phone-1", "a")
+        waiting = asyncio.create_task(limiter.acquire("phone-1", "b"))
+        await asyncio.sleep(0)
+        assert limiter.stats()["ratelimit_waiting"] == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        # One second later the phone number and "b" are free again.
+        clock.now = 1
+        return await asyncio.wait_for(limiter.acquire("phone-1", "b"), timeout=1)
+
+    assert asyncio.run(run()) == (0.0, "")
+
+
+def test_recipient_buckets_are_bounded():
+    limiter, clock = make_limiter(max_recipients=2)
+    send_times(limiter, clock, [("phone-1", recipient) for recipient in "abc"])
+    assert limiter.stats()["ratelimit_recipients"] == 2
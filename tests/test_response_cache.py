@@ -0,0 +1,77 @@
+from response_cache import ResponseCache, normalize
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+VECTORS = {
+    "que equipaje puedo llevar": [1.0, 0.0, 0.1],
+    "cuantas maletas puedo llevar": [0.98, 0.05, 0.12],
+    "formas de pago": [0.0, 1.0, 0.0],
+}
+
+
+def embed(text):
+    return VECTORS[normalize(text)]
+
+
+def test_normalize_ignores_case_accents_and_punctuation():
+    assert normalize("  ¿Cuál es el HORARIO de atención?? ") == "cual es el horario de atencion"
+
+
+def test_exact_hits_are_per_tenant_and_model():
+    cache = ResponseCache()
+    cache.store("bumeran", "gemini", "¿Horario de atención?", "9 a 18", tokens=40)
+
+    hit, _ = cache.lookup("bumeran", "gemini", "horario de atencion")
+    assert (hit.response, hit.tier, hit.tokens) == ("9 a 18", "exact", 40)
+    assert cache.lookup("otro", "gemini", "horario de atencion")[0] is None
+    assert cache.lookup("bumeran", "other", "horario de atencion")[0] is None
+
+    stats = cache.stats()
+    assert stats["llm_cache_hits_exact"] == 1
+    assert stats["llm_cache_misses"] == 2
+    assert stats["llm_cache_tokens_saved"] == 40
+
+
+def test_semantic_hits_above_the_threshold():
+    cache = ResponseCache(embed=embed, threshold=0.95)
+    hit, vector = cache.lookup("bumeran", "gemini", "¿Qué equipaje puedo llevar?")
+    assert hit is None
+    cache.store("bumeran", "gemini", "¿Qué equipaje puedo llevar?", "23 kg", 50, vector)
+
+    hit, _ = cache.lookup("bumeran", "gemini", "¿Cuántas maletas puedo llevar?")
+    assert (hit.response, hit.tier) == ("23 kg", "semantic")
+    assert hit.similarity > 0.95
+    assert cache.lookup("bumeran", "gemini", "Formas de pago")[0] is None
+
+
+def test_embedding_failures_fall_back_to_a_miss():
+    def broken(text):
+        raise RuntimeError("quota")
+
+    cache = ResponseCache(embed=broken)
+    assert cache.lookup("bumeran", "gemini", "hola") == (None, None)
+    assert cache.stats()["llm_cache_embed_errors"] == 1
+
+
+def test_entries_expire_and_are_evicted_lru():
+    clock = FakeClock()
+    cache = ResponseCache(maxsize=2, ttl=60, clock=clock)
+    cache.store("bumeran", "gemini", "a", "A", 1)
+    cache.store("bumeran", "gemini", "b", "B", 1)
+    cache.lookup("bumeran", "gemini", "a")
+    cache.store("bumeran", "gemini", "c", "C", 1)
+
+    assert cache.lookup("bumeran", "gemini", "b")[0] is None
+    assert cache.lookup("bumeran", "gemini", "a")[0].response == "A"
+    assert cache.stats()["llm_cache_evictions"] == 1
+
+    clock.now += 61
+    assert cache.lookup("bumeran", "gemini", "a")[0] is None
+    assert cache.stats()["llm_cache_size"] == 1
@@ -0,0 +1,290 @@
+import asyncio
+from types import SimpleNamespace
+from typing import NamedTuple
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from model_registry import ModelRegistry, generate_content, predict_instances
+from scheduler import FairScheduler, SchedulerFull
+from streaming import ReleasingResponse, events
+
+
+class Backend:
+    def __init__(self, delay=0.01, fail=False):
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self, model, payloads):
+        self.calls.append((model, list(payloads)))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return [f"{model}:{payload}" for payload in payloads]
+
+
+def run(scheduler, scenario):
+    async def main():
+        await scheduler.start()
+        try:
+            return await scenario()
+        finally:
+            await scheduler.stop()
+
+    return asyncio.run(main())
+
+
+def test_results_are_returned_and_concurrency_is_bounded():
+    backend = Backend()
+    scheduler = FairScheduler(backend, max_concurrency=3, tenant_concurrency=10)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(scheduler.submit("bumeran", "gemini", index) for index in range(10))
+        )
+
+    assert run(scheduler, scenario) == [f"gemini:{index}" for index in range(10)]
+    assert backend.peak == 3
+    assert scheduler.stats()["llm_model_calls"] == 10
+
+
+def test_a_noisy_tenant_does_not_starve_the_others():
+    backend = Backend(delay=0.005)
+    scheduler = FairScheduler(backend, max_concurrency=1, tenant_concurrency=1)
+
+    async def scenario():
+        noisy = [scheduler.submit("noisy", "gemini", f"n{index}") for index in range(10)]
+        quiet = [scheduler.submit("quiet", "gemini", f"q{index}") for index in range(2)]
+        await asyncio.gather(*noisy, *quiet)
+
+    run(scheduler, scenario)
+
+    order = [payloads[0] for _, payloads in backend.calls]
+    # Tenants alternate while both have requests queued.
+    assert order[:4] == ["n0", "q0", "n1", "q1"]
+
+
+def test_tenant_concurrency_is_bounded():
+    backend = Backend()
+    scheduler = FairScheduler(backend, max_concurrency=10, tenant_concurrency=2)
+
+    async def scenario():
+        await asyncio.gather(*(scheduler.submit("bumeran", "gemini", i) for i in range(6)))
+
+    run(scheduler, scenario)
+    assert backend.peak == 2
+
+
+def test_compatible_requests_are_batched_across_tenants():
+    backend = Backend()
+    scheduler = FairScheduler(
+        backend,
+        max_concurrency=1,
+        batch_size=lambda model: 4 if model == "batchable" else 1,
+        batch_window=0.01,
+    )
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.submit("a", "batchable", 1),
+            scheduler.submit("b", "batchable", 2),
+            scheduler.submit("a", "other", 3),
+            scheduler.submit("c", "batchable", 4),
+        )
+
+    assert run(scheduler, scenario) == ["batchable:1", "batchable:2", "other:3", "batchable:4"]
+    assert backend.calls == [("batchable", [1, 2, 4]), ("other", [3])]
+    assert scheduler.stats()["llm_batched_requests"] == 4
+
+
+def test_model_failures_reach_every_request_of_the_batch():
+    scheduler = FairScheduler(Backend(fail=True), batch_size=lambda model: 2)
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.submit("a", "gemini", 1),
+            scheduler.submit("b", "gemini", 2),
+            return_exceptions=True,
+        )
+
+    results = run(scheduler, scenario)
+    assert [str(result) for result in results] == ["model unavailable"] * 2
+
+
+def test_queue_is_bounded_per_tenant():
+    scheduler = FairScheduler(Backend(), max_concurrency=1, max_queued=2)
+
+    async def scenario():
+        first = asyncio.ensure_future(scheduler.submit("a", "gemini", 1))
+        second = asyncio.ensure_future(scheduler.submit("a", "gemini", 2))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerFull):
+            await scheduler.submit("a", "gemini", 3)
+        # Other tenants still get in.
+        assert await scheduler.submit("b", "gemini", 4) == "gemini:4"
+        await asyncio.gather(first, second)
+
+    run(scheduler, scenario)
+    assert scheduler.stats()["llm_rejected"] == 1
+
+
+def test_held_slots_count_until_released():
+    backend = Backend()
+    scheduler = FairScheduler(backend, max_concurrency=1)
+
+    async def scenario():
+        release = await scheduler.hold("a")
+        waiting = asyncio.ensure_future(scheduler.submit("b", "gemini", 1))
+        await asyncio.sleep(0.02)
+        assert not waiting.done()
+        release()
+        release()
+        return await waiting
+
+    assert run(scheduler, scenario) == "gemini:1"
+    assert scheduler.stats()["llm_active_calls"] == 0
+
+
+@pytest.mark.parametrize("spec_version, fails_on_start", [("2.0", False), ("2.4", True)])
+def test_a_stream_closed_before_its_first_chunk_gives_the_slot_back(
+    spec_version, fails_on_start
+):
+    scheduler = FairScheduler(Backend(), max_concurrency=1, tenant_concurrency=1)
+    started = []
+
+    def chunks():
+        started.append(True)
+        yield "Hola"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if fails_on_start:
+            raise OSError("connection reset")
+        await asyncio.sleep(0.05)
+
+    async def scenario():
+        release = await scheduler.hold("a")
+        response = ReleasingResponse(events(chunks()), release)
+        scope = {"type": "http", "asgi": {"spec_version": spec_version}}
+        try:
+            await response(scope, receive, send)
+        except ClientDisconnect:
+            pass
+        await asyncio.sleep(0)
+        return scheduler.stats()["llm_active_calls"]
+
+    assert run(scheduler, scenario) == 0
+    assert started == []
+
+
+# Mirror the Vertex AI SDK: `aiplatform.Endpoint.predict()` returns a
+# `Prediction` and `GenerativeModel.generate_content()` a response with `text`
+# and `usage_metadata`.
+class Prediction(NamedTuple):
+    predictions: list
+    deployed_model_id: str
+    metadata: object = None
+    model_version_id: str = "1"
+    model_resource_name: str = ""
+
+
+class Endpoint:
+    def __init__(self, name, answers=None):
+        self.name = name
+        self.answers = answers
+        self.instances = []
+
+    def predict(self, instances, parameters=None):
+        self.instances.append(instances)
+        answers = self.answers or [f"re: {instance['prompt']}" for instance in instances]
+        return Prediction(predictions=answers, deployed_model_id="123")
+
+
+class GenerativeModel:
+    def __init__(self, name):
+        self.name = name
+
+    def generate_content(self, prompt, stream=False):
+        return SimpleNamespace(
+            text=f"{self.name}: {prompt}",
+            usage_metadata=SimpleNamespace(total_token_count=len(prompt)),
+        )
+
+
+def service(handles, batch_models):
+    """The orchestrator's `run_batch`, over `ModelRegistry` and these handles."""
+    registry = ModelRegistry(handles.__getitem__)
+
+    def predict_batch(model_name, prompts):
+        handle = registry.get(model_name)
+        if model_name in batch_models:
+            return predict_instances(handle, prompts, lambda text: len(text.split()))
+        return [generate_content(handle, prompt) for prompt in prompts]
+
+    async def run_batch(model_name, prompts):
+        return await asyncio.to_thread(predict_batch, model_name, prompts)
+
+    return FairScheduler(
+        run_batch,
+        batch_size=lambda model: 4 if model in batch_models else 1,
+        batch_window=0.01,
+    )
+
+
+def test_batches_run_through_the_model_handles():
+    endpoint = Endpoint("endpoint-1", answers=["uno dos", {"content": "tres"}])
+    handles = {"endpoint-1": endpoint, "gemini": GenerativeModel("gemini")}
+    scheduler = service(handles, {"endpoint-1"})
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.submit("a", "endpoint-1", "hola"),
+            scheduler.submit("b", "endpoint-1", "buenas tardes"),
+            scheduler.submit("a", "gemini", "hola"),
+        )
+
+    assert run(scheduler, scenario) == [("uno dos", 3), ("tres", 3), ("gemini: hola", 4)]
+    assert endpoint.instances == [[{"prompt": "hola"}, {"prompt": "buenas tardes"}]]
+    assert scheduler.stats()["llm_model_calls"] == 2
+
+
+def test_a_short_prediction_list_fails_the_whole_batch():
+    endpoint = Endpoint("endpoint-1", answers=["solo una"])
+    scheduler = service({"endpoint-1": endpoint}, {"endpoint-1"})
+
+    async def scenario():
+        return await asyncio.wait_for(
+            asyncio.gather(
+                scheduler.submit("a", "endpoint-1", "hola"),
+                scheduler.submit("b", "endpoint-1", "buenas"),
+                return_exceptions=True,
+            ),
+            timeout=2,
+        )
+
+    results = run(scheduler, scenario)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_worker_threads_submit_through_the_queue():
+    backend = Backend(delay=0.02)
+    scheduler = FairScheduler(backend, tenant_concurrency=1)
+
+    async def scenario():
+        # The thread's request queues behind the tenant's running one.
+        first = asyncio.create_task(scheduler.submit("a", "gemini", 1))
+        await asyncio.sleep(0)
+        second = await asyncio.to_thread(scheduler.submit_from_thread, "a", "summary", 2)
+        return await first, second
+
+    assert run(scheduler, scenario) == ("gemini:1", "summary:2")
+    assert backend.peak == 1
+    assert [model for model, _ in backend.calls] == ["gemini", "summary"]
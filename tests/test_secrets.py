@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from shared.secrets import SecretProvider
+
+
+class FakeSecretManager:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.value = "s3cret"
+        self.lock = threading.Lock()
+
+    def access_secret_version(self, request):
+        with self.lock:
+            self.calls.append(request["name"])
+        time.sleep(self.delay)
+        payload = SimpleNamespace(data=self.value.encode())
+        return SimpleNamespace(payload=payload)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_misses_are_coalesced():
+    fake = FakeSecretManager(delay=0.05)
+    provider = SecretProvider(client_factory=lambda: fake, project="p")
+    with ThreadPoolExecutor(max_workers=100) as pool:
+        results = list(pool.map(lambda _: provider.get("META_APP_SECRET"), range(100)))
+    assert set(results) == {"s3cret"}
+    assert fake.calls == ["projects/p/secrets/META_APP_SECRET/versions/latest"]
+
+
+def test_expired_secret_is_fetched_again():
+    fake = FakeSecretManager()
+    clock = FakeClock()
+    provider = SecretProvider(client_factory=lambda: fake, ttl=10, clock=clock)
+    provider.get("A")
+    clock.now = 11
+    fake.value = "rotated"
+    assert provider.get("A") == "rotated"
+    assert len(fake.calls) == 2
+
+
+def test_stale_secret_is_served_while_refreshing():
+    fake = FakeSecretManager()
+    clock = FakeClock()
+    provider = SecretProvider(
+        client_factory=lambda: fake, ttl=10, refresh_after=5, clock=clock
+    )
+    provider.get("A")
+    clock.now = 6
+    fake.value = "rotated"
+    assert provider.get("A") == "s3cret"
+    deadline = time.monotonic() + 2
+    while provider.stats()["secrets_fetches"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert provider.get("A") == "rotated"
+    provider.close()
+
+
+def test_cached_never_calls_secret_manager():
+    fake = FakeSecretManager()
+    provider = SecretProvider(client_factory=lambda: fake, project="p")
+    assert provider.cached("META_APP_SECRET") is None
+    assert fake.calls == []
+    provider.get("META_APP_SECRET")
+    assert provider.cached("META_APP_SECRET") == "s3cret"
+    assert len(fake.calls) == 1
@@ -0,0 +1,106 @@
+import json
+from types import SimpleNamespace
+
+from streaming import events
+
+
+def chunk(text, tokens=0):
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=tokens))
+
+
+def parse(lines):
+    return [json.loads(line) for line in lines]
+
+
+def test_events_stream_deltas_paragraphs_and_a_summary():
+    done = []
+    first = []
+    chunks = [
+        chunk("Hola, el equipaje"),
+        chunk(" es de 23 kg.\n\nPara pagar"),
+        chunk(" usa PSE.", 57),
+    ]
+
+    output = parse(events(chunks, on_done=lambda *args: done.append(args), on_first=first.append))
+
+    assert [event["type"] for event in output] == [
+        "delta",
+        "delta",
+        "message",
+        "delta",
+        "message",
+        "done",
+    ]
+    assert output[2]["text"] == "Hola, el equipaje es de 23 kg."
+    assert output[4]["text"] == "Para pagar usa PSE."
+    assert output[-1] == {
+        "type": "done",
+        "response": "Hola, el equipaje es de 23 kg.\n\nPara pagar usa PSE.",
+        "tokens": 57,
+    }
+    assert done == [(output[-1]["response"], 57)]
+    assert len(first) == 1
+
+
+def test_chunks_without_text_are_skipped():
+    class UsageOnly:
+        usage_metadata = SimpleNamespace(total_token_count=12)
+
+        @property
+        def text(self):
+            raise ValueError("no text part")
+
+    output = parse(events([chunk("Listo"), UsageOnly()]))
+    assert [event["type"] for event in output] == ["delta", "message", "done"]
+    assert output[-1]["tokens"] == 12
+
+
+def test_cached_answers_replay_as_a_stream():
+    output = parse(events(["Abrimos de 9 a 18."]))
+    assert output[-1] == {"type": "done", "response": "Abrimos de 9 a 18.", "tokens": 0}
+
+
+def test_a_failure_mid_stream_ends_with_an_error_event():
+    done = []
+
+    def chunks():
+        yield chunk("Hola")
+        raise RuntimeError("deadline exceeded")
+
+    output = parse(events(chunks(), on_done=lambda *args: done.append(args)))
+
+    assert output[-1] == {"type": "error", "error": "deadline exceeded"}
+    assert done == []
+
+
+def test_closing_the_stream_early_closes_the_generation():
+    done = []
+    closed = []
+
+    def chunks():
+        try:
+            yield chunk("Hola")
+            yield chunk(", ¿en qué te ayudo?")
+        finally:
+            closed.append(True)
+
+    lines = events(chunks(), on_done=lambda *args: done.append(args))
+    assert parse([next(lines)]) == [{"type": "delta", "text": "Hola"}]
+    # The client disconnected: the server closes the lines.
+    lines.close()
+
+    assert closed == [True]
+    assert done == []
+
+
+def test_a_stream_closed_before_its_first_chunk_never_starts_the_generation():
+    started = []
+
+    def chunks():
+        started.append(True)
+        yield chunk("Hola")
+
+    lines = events(chunks())
+    lines.close()
+
+    assert started == []
@@ -0,0 +1,95 @@
+from shared.tenant_cache import TenantCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(documents, **kwargs):
+    calls = []
+
+    def loader(tenant):
+        calls.append(tenant)
+        return documents.get(tenant)
+
+    return TenantCache(loader, **kwargs), calls
+
+
+def test_hit_does_not_reload():
+    cache, calls = make_cache({"bumeran": {"phone_id": "1"}})
+    assert cache.get("bumeran") == {"phone_id": "1"}
+    assert cache.get("bumeran") == {"phone_id": "1"}
+    assert calls == ["bumeran"]
+    assert cache.stats()["tenant_cache_hits"] == 1
+    assert cache.stats()["tenant_cache_misses"] == 1
+
+
+def test_unknown_tenant_is_negatively_cached():
+    clock = FakeClock()
+    cache, calls = make_cache({}, negative_ttl=10, clock=clock)
+    assert cache.get("nope") is None
+    assert cache.get("nope") is None
+    assert calls == ["nope"]
+    clock.now = 11
+    assert cache.get("nope") is None
+    assert calls == ["nope", "nope"]
+    assert cache.stats()["tenant_cache_negative_hits"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache, calls = make_cache({"a": {}}, ttl=5, clock=clock)
+    cache.get("a")
+    clock.now = 6
+    cache.get("a")
+    assert calls == ["a", "a"]
+    assert cache.stats()["tenant_cache_expirations"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache, calls = make_cache({"a": {}, "b": {}, "c": {}}, maxsize=2)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    cache.get("c")
+    cache.get("a")
+    cache.get("b")
+    assert calls == ["a", "b", "c", "b"]
+    assert cache.stats()["tenant_cache_evictions"] == 2
+
+
+def test_snapshot_listener_updates_entries():
+    class Change:
+        def __init__(self, kind, tenant, data):
+            self.type = type("ChangeType", (), {"name": kind})()
+            self.document = type(
+                "Doc", (), {"id": tenant, "to_dict": lambda _self: data}
+            )()
+
+    class Collection:
+        def on_snapshot(self, callback):
+            self.callback = callback
+            return self
+
+    collection = Collection()
+    cache, calls = make_cache({})
+    cache.watch(collection)
+    collection.callback(None, [Change("ADDED", "a", {"v": 1})], None)
+    assert cache.get("a") == {"v": 1}
+    collection.callback(None, [Change("REMOVED", "a", None)], None)
+    assert cache.get("a") is None
+    assert calls == []
+
+
+def test_cached_only_reads_memory():
+    cache, calls = make_cache({"bumeran": {"phone_id": "1"}})
+    assert cache.cached("bumeran") == (False, None)
+    cache.get("bumeran")
+    cache.get("nope")
+    assert cache.cached("bumeran") == (True, {"phone_id": "1"})
+    assert cache.cached("nope") == (True, None)
+    assert calls == ["bumeran", "nope"]
@@ -0,0 +1,126 @@
+import functools
+import hashlib
+import hmac
+import json
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import SECRET
+from shared import actions
+from shared.graph import GraphClient
+
+
+@pytest.fixture
+def webhook(load_service):
+    return load_service("whatsapp-webhook")
+
+
+def delivery(*messages):
+    body = json.dumps(
+        {"entry": [{"changes": [{"value": {"messages": list(messages)}}]}]}
+    ).encode()
+    signature = "sha256=" + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return body, {"x-hub-signature-256": signature}
+
+
+def text(message_id, sender, body):
+    return {"from": sender, "id": message_id, "type": "text", "text": {"body": body}}
+
+
+def test_only_conversational_messages_get_a_reply(webhook):
+    body, headers = delivery(
+        text("wamid.1", "5731", "Hola"),
+        {"from": "5732", "id": "wamid.2", "type": "reaction",
+         "reaction": {"message_id": "wamid.0", "emoji": "👍"}},
+        {"from": "5733", "id": "wamid.3", "type": "image", "image": {"id": "media.1"}},
+        text("wamid.4", "5734", "Soy cliente"),
+    )
+    with TestClient(webhook.app) as client:
+        response = client.post("/api/webhook/bumeran", content=body, headers=headers)
+
+    assert response.status_code == 200
+    actions = response.json()["actions"]
+    assert [(action["to"], action["next"]) for action in actions] == [
+        ("5731", "await_intent"),
+        ("5734", "delegate_to_llm"),
+    ]
+    assert webhook.incoming_messages.value(tenant="bumeran", category="ignore") == 1
+
+
+def test_a_failed_delivery_is_processed_when_redelivered(webhook, monkeypatch):
+    body, headers = delivery(text("wamid.1", "5731", "Hola"))
+    contains = webhook.provider_registry.contains
+
+    def failing(tenant, sender):
+        raise RuntimeError("store down")
+
+    with TestClient(webhook.app, raise_server_exceptions=False) as client:
+        monkeypatch.setattr(webhook.provider_registry, "contains", failing)
+        assert client.post("/api/webhook/bumeran", content=body, headers=headers).status_code == 500
+
+        monkeypatch.setattr(webhook.provider_registry, "contains", contains)
+        response = client.post("/api/webhook/bumeran", content=body, headers=headers)
+        assert response.json()["status"] == "success"
+        assert len(response.json()["actions"]) == 1
+
+        # Now it was processed: the next redelivery is dropped.
+        response = client.post("/api/webhook/bumeran", content=body, headers=headers)
+        assert response.json() == {"status": "duplicate"}
+
+
+def test_unverified_redeliveries_are_rejected(webhook):
+    body, headers = delivery(text("wamid.1", "5731", "Hola"))
+    with TestClient(webhook.app) as client:
+        client.post("/api/webhook/bumeran", content=body, headers=headers)
+        response = client.post("/api/webhook/bumeran", content=body)
+        assert response.status_code == 400
+        response = client.post("/api/webhook/otro", content=body, headers=headers)
+        assert response.status_code == 404
+    assert webhook.deduplicator.stats()["dedup_duplicates"] == 0
+
+
+def test_metrics_are_not_public(webhook):
+    with TestClient(webhook.app) as client:
+        assert client.get("/metrics").status_code == 404
+
+
+def test_replies_are_published_to_the_dispatcher(load_service, monkeypatch):
+    # The dispatcher runs in-process; its Graph API calls go to a mock.
+    dispatcher = load_service("dispatcher")
+    sent = []
+
+    def graph_api(request):
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json={"messages": [{"id": "wamid.out"}]})
+
+    monkeypatch.setattr(
+        dispatcher,
+        "graph",
+        GraphClient(base_url="https://graph.test", transport=httpx.MockTransport(graph_api)),
+    )
+    monkeypatch.setattr(
+        actions,
+        "DispatcherPublisher",
+        functools.partial(
+            actions.DispatcherPublisher, transport=httpx.ASGITransport(dispatcher.app)
+        ),
+    )
+    monkeypatch.setenv("ACTIONS_MODE", "publish")
+    monkeypatch.setenv("DISPATCHER_URL", "http://dispatcher.test")
+    webhook = load_service("whatsapp-webhook")
+
+    body, headers = delivery(text("wamid.1", "5731", "Hola"))
+    with TestClient(webhook.app) as client:
+        response = client.post("/api/webhook/bumeran", content=body, headers=headers)
+        assert response.status_code == 200
+        deadline = time.monotonic() + 2
+        while not sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert [(message["to"], message["text"]["body"]) for message in sent] == [
+        ("5731", webhook.WELCOME_PROMPT)
+    ]
+    assert webhook.action_pipeline.stats()["actions_delivered"] == 1